@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Vault search latency vs. shard workers.
+
+Builds a throwaway vault index of random vectors in a temp directory and
+times exhaustive queries with MIMI_VAULT_SEARCH_WORKERS-style worker
+counts. Nothing under data/ is touched.
+
+    python bench_vault_search.py --rows 400000 --dim 1536 --workers 1,2,4,8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+
+from mimi_lib.memory import vault_store  # noqa: E402
+
+
+def build_index(rows, dim, chunks_per_note=10, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, dim), dtype=np.float32)
+    entries = {}
+    for start in range(0, rows, chunks_per_note):
+        entries[f"notes/n{start // chunks_per_note:07d}.md"] = [
+            {
+                "chunk_index": i,
+                "text": f"chunk {start + i}",
+                "embedding": matrix[start + i],
+            }
+            for i in range(min(chunks_per_note, rows - start))
+        ]
+    vault_store.write_vault_index(entries, ("bench", None))
+    return rng.standard_normal((64, dim), dtype=np.float32)
+
+
+def time_queries(index, queries, top_k, repeats):
+    index.search(queries[0], top_k)  # Warm the page cache and the pool
+    samples = []
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            index.search(q, top_k)
+            samples.append(time.perf_counter() - start)
+    return np.array(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--shard-rows", type=int, default=vault_store.VAULT_SHARD_ROWS)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    index_dir = Path(tmp.name) / "vault_index"
+    patches = [
+        patch.object(vault_store, "VAULT_INDEX_DIR", index_dir),
+        patch.object(vault_store, "HEADER_FILE", index_dir / "header.json"),
+        patch.object(vault_store, "JOURNAL_FILE", index_dir / "journal.log"),
+        patch.object(vault_store, "VAULT_VECTORS_FILE", index_dir / "none.json"),
+        patch.object(vault_store, "_INDEX_CACHE", None),
+        # Exhaustive scoring only: no IVF, no int8 first pass
+        patch.object(vault_store, "VAULT_ANN_MIN_CHUNKS", args.rows + 1),
+        patch.object(vault_store, "VAULT_INT8", False),
+        patch.object(vault_store, "VAULT_SHARD_ROWS", args.shard_rows),
+    ]
+    for p in patches:
+        p.start()
+    try:
+        print(f"Building {args.rows} x {args.dim} index...", flush=True)
+        queries = build_index(args.rows, args.dim)[: args.queries]
+        index = vault_store.load_vault_index()
+        shards = -(-args.rows // args.shard_rows)
+        print(f"{shards} shards of {args.shard_rows} rows, {os.cpu_count()} CPUs\n")
+
+        print(f"{'workers':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'speedup':>7}")
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(",")]:
+            with patch.object(vault_store, "VAULT_SEARCH_WORKERS", workers):
+                ms = time_queries(index, queries, args.top_k, args.repeats)
+            p50, p95 = np.percentile(ms, 50), np.percentile(ms, 95)
+            baseline = baseline or p50
+            print(f"{workers:>7}  {p50:>8.2f}  {p95:>8.2f}  {baseline / p50:>6.2f}x")
+    finally:
+        for p in patches:
+            p.stop()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,8 @@ from mimi_lib.ui.input import VimInput
 from mimi_lib.ui.printer import StreamPrinter
 from mimi_lib.ui.pager import Pager
 from mimi_lib.utils.text import Colors, get_layout, visible_len, visible_wrap
-from mimi_lib.memory.brain import load_system_prompt, save_memory, load_json, save_json
+from mimi_lib.memory.brain import load_system_prompt, save_memory
+from mimi_lib.utils.docstore import WRITE_BEHIND_SECONDS, load_doc, save_doc
 from mimi_lib.memory.embeddings import semantic_search
 from mimi_lib.api.provider import call_api
 from mimi_lib.api.generic import call_generic_api
@@ -82,10 +83,11 @@ class MimiApp:
             )
 
     def _load_working_set(self) -> Dict[str, Any]:
-        return load_json(WORKING_SET_FILE, default={})
+        return load_doc(WORKING_SET_FILE, default={})
 
     def _save_working_set(self):
-        save_json(WORKING_SET_FILE, self.working_set)
+        # Touched on every tool call; coalesced, and flushed at exit
+        save_doc(WORKING_SET_FILE, self.working_set, delay=WRITE_BEHIND_SECONDS)
 
     def _update_working_set(self, paths: List[str] = None, context: str = None):
         """Updates the working set with new paths or task context."""
@@ -435,6 +437,7 @@ class MimiApp:
             print(f"{indent}  /model [name]   - List or switch AI model")
             print(f"{indent}  /autorename     - Toggle auto-renaming")
             print(f"{indent}  /prep           - Run 'git_pull_lecture_guides' routine")
+            print(f"{indent}  /reconcile [dry] - Sync memory vectors with the archive")
             print(f"{indent}  /clear          - Clear screen")
             print(f"{indent}  /exit           - Quit")
         elif cmd[0] == "/prep":
@@ -456,6 +459,19 @@ class MimiApp:
                 }
             )
             self.generate_response(get_layout(self.config)[0], indent)
+        elif cmd[0] == "/reconcile":
+            from mimi_lib.memory.embeddings import (
+                format_reconcile_report,
+                reconcile_memory_vectors,
+            )
+
+            dry_run = len(cmd) > 1 and cmd[1].lower() in ("dry", "--dry-run")
+            print(
+                f"{indent}Reconciling memory vectors{' (dry run)' if dry_run else ''}..."
+            )
+            report = reconcile_memory_vectors(dry_run=dry_run)
+            for line in format_reconcile_report(report).splitlines():
+                print(f"{indent}  {line}")
         elif cmd[0] == "/autorename":
             if len(cmd) > 1:
                 self.autorename = cmd[1].lower() == "on"
@@ -1023,56 +1039,30 @@ class MimiApp:
         ]:
             return ""
 
-        from mimi_lib.memory.brain import get_literal_matches
-        from mimi_lib.memory.vault_indexer import search_vault
-        from mimi_lib.memory.embeddings import semantic_search
+        from mimi_lib.memory.retrieval import DIARY, MEMORY, TEMPORAL, VAULT, retrieve
 
         rem = "\n**Reminiscence (Relevant History & Notes):**\n"
         found = False
-        seen_contents = set()
-
-        # TURBO: Parallel RAG Execution
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            # Launch searches in parallel
-            f_vault = executor.submit(search_vault, user_input, top_k=2)
-            f_semantic = executor.submit(semantic_search, user_input, top_k=2)
-            f_literal = executor.submit(get_literal_matches, user_input, top_k=2)
 
-            # 1. Vault Search Results
-            try:
-                vault_results = f_vault.result()
-                for r in vault_results:
-                    content = f"[{r['path']}] {r['text']}"
-                    if content not in seen_contents:
-                        rem += f"- [Vault] {content}\n"
-                        seen_contents.add(content)
-                        found = True
-            except:
-                pass
-
-            # 2. Semantic Search (Session Memory)
-            try:
-                semantic_results = f_semantic.result()
-                for r in semantic_results:
-                    content = r["content"]
-                    if content not in seen_contents:
-                        rem += f"- [Intuition] {content}\n"
-                        seen_contents.add(content)
-                        found = True
-            except:
-                pass
-
-            # 3. Literal Search (Keyword)
-            try:
-                literal_results = f_literal.result()
-                for r in literal_results:
-                    content = r["content"]
-                    if content not in seen_contents:
-                        rem += f"- [Recall] {content}\n"
-                        seen_contents.add(content)
-                        found = True
-            except:
-                pass
+        # Vault, memory vectors, BM25 recall and (for "last week"-style
+        # questions) the timeline, fused into one ranking
+        try:
+            hits = retrieve(user_input, top_k=6)
+        except:
+            hits = []
+
+        for hit in hits:
+            if hit.source == VAULT:
+                rem += f"- [Vault] [{hit.path}] {hit.text}\n"
+            elif hit.source == DIARY:
+                rem += f"- [Diary {hit.item.get('date')}] {hit.text[:300]}\n"
+            elif len(hit.lanes) == 1 and TEMPORAL in hit.lanes:
+                rem += f"- [Timeline] [{hit.item.get('timestamp')}] {hit.text}\n"
+            elif MEMORY in hit.lanes:
+                rem += f"- [Intuition] {hit.text}\n"
+            else:
+                rem += f"- [Recall] {hit.text}\n"
+            found = True
 
         return rem if found else ""
 
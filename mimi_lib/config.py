@@ -13,11 +13,20 @@ for d in [SESSION_DIR, MEMORY_DIR]:
     d.mkdir(parents=True, exist_ok=True)
 
 # Native Storage Files (Replacing Jan dependencies)
+# Pre-SQLite memory files; imported into MEMORY_DB_FILE on first use
 MEMORY_ARCHIVE_FILE = MEMORY_DIR / "archive.json"
 MEMORY_STORE_FILE = MEMORY_DIR / "active_store.json"
+MEMORY_DB_FILE = MEMORY_DIR / "memories.sqlite3"  # Archive + active store (WAL)
 MEMORY_VECTORS_FILE = MEMORY_DIR / "vectors.json"
+MEMORY_LEXICAL_INDEX_FILE = MEMORY_DIR / "lexical_index.json"  # BM25 over archive
 VAULT_VECTORS_FILE = MEMORY_DIR / "vault_vectors.json"
 VAULT_INDEX_LOG = MEMORY_DIR / "vault_index_log.json"
+VAULT_INDEX_DIR = MEMORY_DIR / "vault_index"  # Binary (memmapped) vault index
+VAULT_SNAPSHOT_FILE = MEMORY_DIR / "vault_snapshot.json"  # Polling watcher state
+VAULT_INDEXER_LOCK = MEMORY_DIR / "vault_indexer.lock"  # Cross-process lease
+VAULT_INDEXER_RERUN = MEMORY_DIR / "vault_indexer.rerun"  # Queued requests for it
+EMBEDDING_CACHE_FILE = MEMORY_DIR / "embedding_cache.sqlite3"
+SKILL_INIT_CACHE_FILE = MEMORY_DIR / "skill_init_cache.json"  # load_skill results
 PERSONA_CORE_FILE = MEMORY_DIR / "persona_core.json"
 DIARY_STORE_FILE = MEMORY_DIR / "diary_store.json"
 NOTES_STORE_FILE = MEMORY_DIR / "notes_store.json"
@@ -39,6 +48,48 @@ OBSIDIAN_NOTES_FILE = VAULT_PATH / "Mimi/Notes.md"
 # Load Secrets
 load_dotenv(PROJECT_ROOT / ".env")
 
+# Embeddings
+# Model used before index headers recorded one (legacy files are assumed to be it)
+DEFAULT_EMBEDDING_MODEL = "openai/text-embedding-3-small"
+EMBEDDING_MODEL = os.getenv("MIMI_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+# Requested vector size (e.g. 512); unset means the model's native size
+EMBEDDING_DIMENSIONS = int(os.getenv("MIMI_EMBEDDING_DIMENSIONS", "0")) or None
+
+# Vault Search Tuning
+# IVF approximate search switches on once the base index has this many chunks
+VAULT_ANN_MIN_CHUNKS = int(os.getenv("MIMI_ANN_MIN_CHUNKS", "20000"))
+VAULT_ANN_NPROBE = int(os.getenv("MIMI_ANN_NPROBE", "12"))  # Cells probed per query
+VAULT_ANN_RERANK = int(os.getenv("MIMI_ANN_RERANK", "4000"))  # Exact-rescored rows
+# Optional 8-bit codes for the first scoring pass (~4x less resident memory)
+VAULT_INT8 = os.getenv("MIMI_VAULT_INT8", "0") == "1"
+VAULT_INT8_RERANK = int(os.getenv("MIMI_VAULT_INT8_RERANK", "256"))
+# Exhaustive scans are split into shards of this many rows and scored on a
+# thread pool (NumPy's kernels release the GIL); 1 worker = single-threaded
+VAULT_SEARCH_WORKERS = int(
+    os.getenv("MIMI_VAULT_SEARCH_WORKERS", str(min(8, os.cpu_count() or 1)))
+)
+VAULT_SHARD_ROWS = int(os.getenv("MIMI_VAULT_SHARD_ROWS", "65536"))
+# Seconds between scans when inotify isn't available
+VAULT_POLL_INTERVAL = float(os.getenv("MIMI_VAULT_POLL_INTERVAL", "10"))
+
+# Embedding Throughput
+# Concurrent background /embeddings requests (queries get one extra dispatcher)
+EMBED_CONCURRENCY = int(os.getenv("MIMI_EMBED_CONCURRENCY", "4"))
+# Client-side request rate cap (token bucket), shared by all callers
+EMBED_RATE_PER_SEC = float(os.getenv("MIMI_EMBED_RATE_PER_SEC", "8"))
+
+# Hybrid Retrieval
+# Lanes that haven't answered within this budget are left out of the fusion
+RETRIEVAL_BUDGET_MS = int(os.getenv("MIMI_RETRIEVAL_BUDGET_MS", "2500"))
+# Explicit search tools: the model asked for these results, so wait longer
+TOOL_RETRIEVAL_BUDGET_MS = int(os.getenv("MIMI_TOOL_RETRIEVAL_BUDGET_MS", "20000"))
+
+# Write-time Near-Duplicate Memories
+# MinHash-estimated shingle overlap that counts as a duplicate on its own
+NEAR_DUP_JACCARD = float(os.getenv("MIMI_NEAR_DUP_JACCARD", "0.8"))
+# Weaker LSH candidates are duplicates if their embeddings are this close
+NEAR_DUP_COSINE = float(os.getenv("MIMI_NEAR_DUP_COSINE", "0.92"))
+
 
 def get_config():
     """Returns a dictionary of API keys and endpoints."""
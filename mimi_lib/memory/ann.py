@@ -0,0 +1,131 @@
+"""
+IVF (inverted file) approximate nearest-neighbour index on NumPy.
+
+A spherical k-means coarse quantizer splits the (pre-normalized) rows into
+`nlist` cells. A query probes the `nprobe` cells whose centroids are most
+similar, then the candidate rows are rescored exactly against the full
+float32 matrix and the best `top_k` are kept.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from mimi_lib.memory.vector_store import normalize_rows
+
+KMEANS_ITERS = 8
+# Training sample per centroid; k-means quality saturates well before N
+SAMPLE_PER_LIST = 32
+# Score/assign in row blocks to bound temporary memory
+BLOCK_ROWS = 16384
+
+
+def default_nlist(count: int) -> int:
+    return int(max(16, min(4096, 4 * np.sqrt(count))))
+
+
+def assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (max cosine) per row."""
+    out = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], BLOCK_ROWS):
+        block = np.asarray(matrix[start : start + BLOCK_ROWS], dtype=np.float32)
+        out[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(
+    matrix: np.ndarray, nlist: int, seed: int = 0, iters: int = KMEANS_ITERS
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    count = matrix.shape[0]
+    sample_size = min(count, nlist * SAMPLE_PER_LIST)
+    sample_rows = np.sort(rng.choice(count, size=sample_size, replace=False))
+    sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+
+    nlist = min(nlist, sample_size)
+    centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = assign(sample, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        # Per-cell sums via one sort + reduceat (np.add.at is far slower)
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        empty = ~filled
+        if empty.any():
+            # Reseed dead cells from random sample rows
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, labels: np.ndarray, trained_on: int):
+        self.centroids = centroids.astype(np.float32)
+        self.trained_on = trained_on
+        nlist = len(self.centroids)
+        # Rows grouped by cell: cell c owns order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(labels, kind="stable").astype(np.int64)
+        self.offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=self.offsets[1:])
+
+    @classmethod
+    def build(
+        cls, matrix: np.ndarray, previous: Optional["IVFIndex"] = None
+    ) -> "IVFIndex":
+        """
+        Reuses the previous coarse quantizer when the index hasn't doubled
+        since it was trained, so compaction only pays for an assignment pass.
+        """
+        count = matrix.shape[0]
+        if (
+            previous is not None
+            and previous.centroids.shape[1] == matrix.shape[1]
+            and count <= 2 * previous.trained_on
+        ):
+            centroids, trained_on = previous.centroids, previous.trained_on
+        else:
+            centroids, trained_on = train_centroids(matrix, default_nlist(count)), count
+        return cls(centroids, assign(matrix, centroids), trained_on)
+
+    def candidates(self, q: np.ndarray, nprobe: int, limit: int) -> np.ndarray:
+        """Row ids from the nprobe closest cells, best cells first, up to limit."""
+        cell_scores = self.centroids @ q
+        nprobe = min(nprobe, len(cell_scores))
+        cells = np.argpartition(-cell_scores, nprobe - 1)[:nprobe]
+        cells = cells[np.argsort(-cell_scores[cells])]
+        parts, total = [], 0
+        for c in cells:
+            rows = self.order[self.offsets[c] : self.offsets[c + 1]]
+            parts.append(rows)
+            total += len(rows)
+            if total >= limit:
+                break
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(parts)[:limit]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                order=self.order,
+                offsets=self.offsets,
+                trained_on=np.int64(self.trained_on),
+            )
+
+    @classmethod
+    def load(cls, path) -> Optional["IVFIndex"]:
+        try:
+            data = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        ivf = cls.__new__(cls)
+        ivf.centroids = data["centroids"]
+        ivf.order = data["order"]
+        ivf.offsets = data["offsets"]
+        ivf.trained_on = int(data["trained_on"])
+        return ivf
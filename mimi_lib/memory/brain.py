@@ -1,29 +1,27 @@
-import json
-import re
 import uuid
 from datetime import datetime
 from mimi_lib.config import (
     LOCAL_PROMPT_FILE,
     VAULT_PROMPT_FILE,
-    MEMORY_ARCHIVE_FILE,
-    MEMORY_STORE_FILE,
     PERSONA_CORE_FILE,
     DIARY_STORE_FILE,
     NOTES_STORE_FILE,
 )
+from mimi_lib.memory.embeddings import get_embedding
+from mimi_lib.memory.lexical import get_lexical_index
+from mimi_lib.memory.memory_db import ACTIVE, ARCHIVE, get_memory_db
+from mimi_lib.memory.near_dup import find_near_duplicate, get_near_dup_index
+from mimi_lib.memory.vector_store import get_memory_store
+from mimi_lib.utils.docstore import load_doc, save_doc, transaction
 
 
+# Kept for existing callers; both go through the locked, atomic docstore
 def load_json(path, default=None):
-    if not path.exists():
-        return default if default is not None else []
-    try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except:
-        return default if default is not None else []
+    return load_doc(path, default)
 
 
 def save_json(path, data):
-    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    save_doc(path, data)
 
 
 def load_system_prompt():
@@ -37,12 +35,9 @@ def load_system_prompt():
 
     # Inject Persona
     persona = ""
-    if PERSONA_CORE_FILE.exists():
-        try:
-            data = json.loads(PERSONA_CORE_FILE.read_text())
-            persona = f"**Identity Narrative:**\n{data.get('narrative', '')}\n\n"
-        except:
-            pass
+    data = load_doc(PERSONA_CORE_FILE, {})
+    if data:
+        persona = f"**Identity Narrative:**\n{data.get('narrative', '')}\n\n"
 
     now = datetime.now()
     temporal = f"**Temporal Context:**\n- Date: {now.strftime('%A, %b %d, %Y')}\n- Time: {now.strftime('%H:%M')}\n\n"
@@ -55,49 +50,80 @@ def load_system_prompt():
 
 
 def get_literal_matches(query: str, top_k: int = 2):
-    if not MEMORY_ARCHIVE_FILE.exists():
-        return []
+    """[Recall] lane: BM25 over the archive via the in-memory inverted index."""
     try:
-        archive = json.loads(MEMORY_ARCHIVE_FILE.read_text())
-        stop_words = {"about", "there", "their", "would", "could", "should"}
-        words = re.findall(r"\b\w{5,}\b", query.lower())
-        keywords = [w for w in words if w not in stop_words]
-
-        if not keywords:
-            return []
-
-        matches = []
-        for item in archive:
-            content = item.get("content", "").lower()
-            score = sum(1 for kw in keywords if kw in content)
-            if score > 0:
-                matches.append((score, item))
-
-        matches.sort(key=lambda x: x[0], reverse=True)
-        return [m[1] for m in matches[:top_k]]
+        return [item for item, _ in get_lexical_index().search(query, top_k)]
     except:
         return []
 
 
+def find_restated_memory(content, vectors=None):
+    """The archive item `content` paraphrases (not repeats verbatim), or None."""
+    if get_memory_db().contains(content, ARCHIVE):
+        return None
+    vectors = vectors or get_memory_store()
+    # The embedding is cached, so saving afterwards doesn't fetch it again
+    found = find_near_duplicate(
+        content, lambda: get_embedding(content, vectors.spec), vectors
+    )
+    return found[0] if found else None
+
+
+def merge_near_duplicate(existing, content):
+    """
+    Folds a restated fact into the memory it duplicates. Corrections
+    (a changed negation or number) never get here, so this is a tie-break
+    between paraphrases: the longer one wins, since it usually carries the
+    extra detail. Returns (id, whether the stored text changed).
+    """
+    mem_id = existing["id"]
+    if len(content) <= len(existing.get("content", "")):
+        return mem_id, False
+    db = get_memory_db()
+    if not db.update_content(mem_id, content, ARCHIVE):
+        return mem_id, False
+    db.update_content(mem_id, content, ACTIVE)
+
+    item = dict(existing, content=content)
+    get_lexical_index().add(item)
+    get_near_dup_index().add(item)
+    vectors = get_memory_store()
+    vector = get_embedding(content, vectors.spec)
+    if vector:
+        vectors.add(mem_id, vector)
+    return mem_id, True
+
+
 def save_memory(content, category="Kuumin"):
-    archive = load_json(MEMORY_ARCHIVE_FILE)
-    mem_id = int(datetime.now().timestamp() * 1000)
+    # Paraphrases of a stored fact are merged into it instead of piling up
+    # in the active store (and triggering compression)
+    existing = find_restated_memory(content)
+    if existing:
+        return merge_near_duplicate(existing, content)[0]
+
+    db = get_memory_db()
     item = {
-        "id": mem_id,
+        "id": int(datetime.now().timestamp() * 1000),
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
         "content": content,
         "category": category,
     }
 
-    if not any(m.get("content") == content for m in archive):
-        archive.append(item)
-        save_json(MEMORY_ARCHIVE_FILE, archive)
+    # Duplicate content is rejected by the content-hash index
+    mem_id, inserted = db.add(item, ARCHIVE)
+    if inserted:
+        item["id"] = mem_id
+        get_lexical_index().add(item)
+        get_near_dup_index().add(item)
+
+        # Index for semantic_search, in the same space as the existing vectors
+        vectors = get_memory_store()
+        vector = get_embedding(content, vectors.spec)
+        if vector:
+            vectors.add(mem_id, vector)
 
     # Also update active store
-    store = load_json(MEMORY_STORE_FILE)
-    if not any(m.get("content") == content for m in store):
-        store.append(item)
-        save_json(MEMORY_STORE_FILE, store)
+    db.add(dict(item, id=mem_id), ACTIVE)
     return mem_id
 
 
@@ -107,50 +133,39 @@ def delete_memory(mem_id):
     except:
         return False
 
-    deleted = False
-    # Store
-    store = load_json(MEMORY_STORE_FILE)
-    new_store = [m for m in store if m.get("id") != target_id]
-    if len(new_store) < len(store):
-        save_json(MEMORY_STORE_FILE, new_store)
-        deleted = True
-
-    # Archive
-    archive = load_json(MEMORY_ARCHIVE_FILE)
-    new_archive = [m for m in archive if m.get("id") != target_id]
-    if len(new_archive) < len(archive):
-        save_json(MEMORY_ARCHIVE_FILE, new_archive)
+    db = get_memory_db()
+    deleted = db.delete(target_id, ACTIVE)
+    if db.delete(target_id, ARCHIVE):
+        get_lexical_index().remove(target_id)
+        get_near_dup_index().remove(target_id)
         deleted = True
 
+    get_memory_store().remove(target_id)
     return deleted
 
 
 def add_note(content, priority="Medium", tags=None):
     if tags is None:
         tags = []
-    notes = load_json(NOTES_STORE_FILE)
     note_id = str(uuid.uuid4())[:8]
-    notes.append(
-        {
-            "id": note_id,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "content": content,
-            "priority": priority,
-            "tags": tags,
-        }
-    )
-    save_json(NOTES_STORE_FILE, notes)
+    with transaction(NOTES_STORE_FILE, []) as doc:
+        doc.data.append(
+            {
+                "id": note_id,
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                "content": content,
+                "priority": priority,
+                "tags": tags,
+            }
+        )
     return note_id
 
 
 def delete_note(note_id):
-    notes = load_json(NOTES_STORE_FILE)
-    initial_len = len(notes)
-    notes = [n for n in notes if n.get("id") != note_id]
-    if len(notes) < initial_len:
-        save_json(NOTES_STORE_FILE, notes)
-        return True
-    return False
+    with transaction(NOTES_STORE_FILE, []) as doc:
+        initial_len = len(doc.data)
+        doc.data = [n for n in doc.data if n.get("id") != note_id]
+        return len(doc.data) < initial_len
 
 
 def load_diary():
@@ -160,27 +175,29 @@ def load_diary():
 def save_diary_entry(content, date=None):
     if date is None:
         date = datetime.now().strftime("%Y-%m-%d")
-    diary = load_json(DIARY_STORE_FILE)
     entry = {
         "date": date,
         "content": content,
         "timestamp": int(datetime.now().timestamp()),
     }
+    with transaction(DIARY_STORE_FILE, []) as doc:
+        upsert_diary_entry(doc.data, entry)
+    return True
+
+
+def upsert_diary_entry(diary, entry):
     # Update existing or append
-    existing_idx = next((i for i, d in enumerate(diary) if d["date"] == date), None)
+    existing_idx = next(
+        (i for i, d in enumerate(diary) if d["date"] == entry["date"]), None
+    )
     if existing_idx is not None:
         diary[existing_idx] = entry
     else:
         diary.append(entry)
-    save_json(DIARY_STORE_FILE, diary)
-    return True
 
 
 def delete_diary_entry(date):
-    diary = load_json(DIARY_STORE_FILE)
-    initial_len = len(diary)
-    diary = [d for d in diary if d["date"] != date]
-    if len(diary) < initial_len:
-        save_json(DIARY_STORE_FILE, diary)
-        return True
-    return False
+    with transaction(DIARY_STORE_FILE, []) as doc:
+        initial_len = len(doc.data)
+        doc.data = [d for d in doc.data if d["date"] != date]
+        return len(doc.data) < initial_len
@@ -0,0 +1,151 @@
+"""
+Content-addressed embedding cache.
+
+Vectors are keyed by sha256(model, exact input text) and stored as float32
+blobs in a local SQLite database. Every hit refreshes `last_used`, and the
+least recently used rows are evicted once the database outgrows its cap.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from mimi_lib.config import EMBEDDING_CACHE_FILE
+
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# Evict down to this fraction of the cap so we don't evict on every insert
+EVICT_TARGET = 0.9
+# How many inserts between size checks
+CHECK_EVERY = 256
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_FILE, max_bytes: int = MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inserts = 0
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key BLOB PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " last_used INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """Returns {position: vector} for every text already in the cache."""
+        if not texts:
+            return {}
+        keys = [cache_key(model, t) for t in texts]
+        found: Dict[bytes, List[float]] = {}
+        try:
+            with self._lock:
+                conn = self._connect()
+                unique = list(set(keys))
+                # Stay under SQLite's bound-parameter limit
+                for start in range(0, len(unique), 500):
+                    part = unique[start : start + 500]
+                    marks = ",".join("?" * len(part))
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})",
+                        part,
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if found:
+                    now = int(time.time())
+                    conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, k) for k in found],
+                    )
+                    conn.commit()
+        except sqlite3.Error as e:
+            print(f"[EmbeddingCache] Read failed: {e}")
+            return {}
+        return {i: found[k] for i, k in enumerate(keys) if k in found}
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text]).get(0)
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        now = int(time.time())
+        rows = [
+            (cache_key(model, t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+            if v
+        ]
+        if not rows:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used)"
+                    " VALUES (?, ?, ?)",
+                    rows,
+                )
+                conn.commit()
+                self._inserts += len(rows)
+                if self._inserts >= CHECK_EVERY:
+                    self._inserts = 0
+                    self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"[EmbeddingCache] Write failed: {e}")
+
+    def put(self, model: str, text: str, vector: List[float]):
+        self.put_many(model, [text], [vector])
+
+    def _used_bytes(self, conn) -> int:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _evict(self, conn):
+        """Drops least-recently-used rows until the live size is under the cap."""
+        used = self._used_bytes(conn)
+        if used <= self.max_bytes:
+            return
+        total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if not total:
+            return
+        # Rows are roughly equal size, so drop a proportional slice
+        keep = int(total * (self.max_bytes * EVICT_TARGET) / used)
+        conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (total - keep,),
+        )
+        conn.commit()
+
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = EmbeddingCache()
+        return _CACHE
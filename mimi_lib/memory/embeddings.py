@@ -1,21 +1,131 @@
-import json
 import math
+import threading
+import time
 import requests
-from typing import List, Dict, Optional
-from mimi_lib.config import get_config, MEMORY_VECTORS_FILE, MEMORY_ARCHIVE_FILE
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Optional, Tuple
+from mimi_lib.config import (
+    get_config,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    EMBED_CONCURRENCY,
+    EMBED_RATE_PER_SEC,
+)
+from mimi_lib.memory.vector_store import MemoryVectorStore, get_memory_store
+from mimi_lib.memory.embedding_cache import get_embedding_cache
+from mimi_lib.memory.memory_db import ARCHIVE, get_memory_db
 
-# Global Session
-_http_session = None
+# One Session per thread (the indexer embeds from several workers)
+_http_local = threading.local()
 
 
 def get_session():
-    global _http_session
-    if _http_session is None:
-        _http_session = requests.Session()
-    return _http_session
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        session = _http_local.session = requests.Session()
+    return session
 
 
-def get_embedding(text: str) -> Optional[List[float]]:
+class TokenBucket:
+    """
+    Blocking rate limiter shared by every embedding request. A 429 pauses
+    the whole bucket, so all workers back off together instead of each
+    hammering the provider on its own schedule. While an urgent caller is
+    waiting, nobody else gets a token.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._urgent_waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0, urgent: bool = False):
+        queued = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._tokens = min(
+                        self.capacity, self._tokens + (now - self._stamp) * self.rate
+                    )
+                    self._stamp = now
+                    ready = now >= self._paused_until and self._tokens >= n
+                    if ready and (urgent or not self._urgent_waiting):
+                        self._tokens -= n
+                        return
+                    if urgent and not queued:
+                        self._urgent_waiting += 1
+                        queued = True
+                    wait = max(self._paused_until - now, (n - self._tokens) / self.rate)
+                # Yielding callers re-check soon; the urgent one may be done
+                time.sleep(min(max(wait, 0.005), 1.0))
+        finally:
+            if queued:
+                with self._lock:
+                    self._urgent_waiting -= 1
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+_RATE_LIMIT = TokenBucket(EMBED_RATE_PER_SEC, max(1, EMBED_CONCURRENCY))
+
+# Retries for 429/5xx and dropped connections, with exponential backoff
+MAX_RETRIES = 5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _retry_after(res, attempt: int) -> float:
+    """Server-provided Retry-After (seconds or HTTP date), else backoff."""
+    value = res.headers.get("Retry-After") if res is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return min(60.0, 2.0**attempt)
+
+
+# (model, requested dimensions); dimensions None means the model's native size
+EmbeddingSpec = Tuple[str, Optional[int]]
+
+
+def current_spec() -> EmbeddingSpec:
+    """Spec new vectors are embedded with (MIMI_EMBEDDING_MODEL / _DIMENSIONS)."""
+    return (EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+
+
+def _cache_model(spec: EmbeddingSpec) -> str:
+    # Truncated vectors differ from full ones, so they get their own cache keys
+    model, dimensions = spec
+    return f"{model}@{dimensions}" if dimensions else model
+
+
+# Provider limits for a single /embeddings request (kept well under OpenAI's)
+MAX_BATCH_INPUTS = 128
+MAX_BATCH_TOKENS = 100_000
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~3 chars per token is a safe overestimate for mixed prose/markdown
+    return len(text) // 3 + 1
+
+
+def _post_embeddings(
+    inputs: List[str], spec: EmbeddingSpec, urgent: bool = False
+) -> Optional[List[List[float]]]:
+    """One /embeddings call; returns vectors in input order, or None on failure."""
     config = get_config()
     session = get_session()
 
@@ -25,23 +135,272 @@ def get_embedding(text: str) -> Optional[List[float]]:
         "Authorization": f"Bearer {config['openrouter_api_key']}",
         "Content-Type": "application/json",
     }
+    model, dimensions = spec
     payload = {
-        "model": "openai/text-embedding-3-small",
-        "input": text.replace("\n", " "),
+        "model": model,
+        "input": inputs if len(inputs) > 1 else inputs[0],
     }
+    if dimensions:
+        payload["dimensions"] = dimensions
+
+    for attempt in range(MAX_RETRIES + 1):
+        _RATE_LIMIT.acquire(urgent=urgent)
+        try:
+            res = session.post(url, headers=headers, json=payload, timeout=60)
+        except Exception as e:
+            print(f"[Embeddings] Connection failed: {e}")
+            if attempt < MAX_RETRIES:
+                time.sleep(_retry_after(None, attempt))
+            continue
 
-    try:
-        # Increased timeout to 60 seconds and added basic retry
-        res = session.post(url, headers=headers, json=payload, timeout=60)
         if res.ok:
-            return res.json()["data"][0]["embedding"]
-        else:
+            data = res.json()["data"]
+            # Results may come back out of order; map by their index field
+            vectors = [None] * len(inputs)
+            for item in data:
+                vectors[item.get("index", 0)] = item["embedding"]
+            return vectors
+        if res.status_code not in RETRY_STATUS:
             print(f"[Embeddings] API Error: {res.status_code} - {res.text}")
-    except Exception as e:
-        print(f"[Embeddings] Connection failed: {e}")
+            return None
+        delay = _retry_after(res, attempt)
+        print(f"[Embeddings] HTTP {res.status_code}, retrying in {delay:.1f}s")
+        _RATE_LIMIT.pause(delay)
     return None
 
 
+def _iter_batches(texts: List[str]):
+    """Yields lists of indices that fit the per-request input and token limits."""
+    batch, batch_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = _estimate_tokens(text)
+        if batch and (
+            len(batch) >= MAX_BATCH_INPUTS or batch_tokens + tokens > MAX_BATCH_TOKENS
+        ):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+# --- SHARED CLIENT (micro-batching, two priority lanes) ---
+FOREGROUND, BACKGROUND = 0, 1
+# How long a dispatcher holds a request open for others to join its batch
+COALESCE_SECONDS = 0.004
+
+
+class _Request:
+    __slots__ = ("inputs", "spec", "tokens", "future")
+
+    def __init__(self, inputs: List[str], spec: EmbeddingSpec):
+        self.inputs = inputs
+        self.spec = spec
+        self.tokens = sum(_estimate_tokens(t) for t in inputs)
+        self.future: Future = Future()
+
+
+class EmbeddingClient:
+    """
+    Every /embeddings request in the process goes through here. Requests
+    for the same spec that arrive within COALESCE_SECONDS of each other
+    are sent as one API call (up to the batch limits).
+
+    Two lanes: FOREGROUND (query embeddings for a user's turn) and
+    BACKGROUND (indexing, migrations). Dispatchers always drain the
+    foreground lane first, one dispatcher serves nothing but it, and its
+    requests jump the rate limiter, so a turn never queues behind a
+    reindex.
+    """
+
+    def __init__(self, workers: int = EMBED_CONCURRENCY, post=None):
+        self.workers = max(1, workers)
+        self._post = post  # override for tests; default is _post_embeddings
+        self._lanes = (deque(), deque())
+        self._cond = threading.Condition()
+        self._started = False
+
+    def _start(self):
+        # Caller holds self._cond
+        self._started = True
+        lanes = [(FOREGROUND,)] + [(FOREGROUND, BACKGROUND)] * self.workers
+        for i, served in enumerate(lanes):
+            threading.Thread(
+                target=self._run,
+                args=(served,),
+                name=f"embed-dispatch-{i}",
+                daemon=True,
+            ).start()
+
+    def submit(
+        self, inputs: List[str], spec: EmbeddingSpec, priority: int = BACKGROUND
+    ) -> Future:
+        """Queues one batch; the Future resolves to its vectors or None."""
+        request = _Request(inputs, tuple(spec))
+        with self._cond:
+            if not self._started:
+                self._start()
+            self._lanes[priority].append(request)
+            self._cond.notify_all()
+        return request.future
+
+    def _take(self, served) -> Tuple[int, List[_Request]]:
+        """Blocks for the next request, then lingers briefly to fill its batch."""
+        with self._cond:
+            while not any(self._lanes[p] for p in served):
+                self._cond.wait()
+            priority = next(p for p in served if self._lanes[p])
+            lane = self._lanes[priority]
+            first = lane.popleft()
+            batch, count, tokens = [first], len(first.inputs), first.tokens
+
+            deadline = time.monotonic() + COALESCE_SECONDS
+            while True:
+                # Only same-spec requests from the same lane share a call
+                for request in list(lane):
+                    if request.spec != first.spec:
+                        continue
+                    if (
+                        count + len(request.inputs) > MAX_BATCH_INPUTS
+                        or tokens + request.tokens > MAX_BATCH_TOKENS
+                    ):
+                        continue
+                    lane.remove(request)
+                    batch.append(request)
+                    count += len(request.inputs)
+                    tokens += request.tokens
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or count >= MAX_BATCH_INPUTS:
+                    break
+                self._cond.wait(remaining)
+            return priority, batch
+
+    def _run(self, served):
+        while True:
+            priority, batch = self._take(served)
+            inputs = [t for request in batch for t in request.inputs]
+            try:
+                vectors = (self._post or _post_embeddings)(
+                    inputs, batch[0].spec, urgent=priority == FOREGROUND
+                )
+            except Exception as e:
+                print(f"[Embeddings] Dispatch failed: {e}")
+                vectors = None
+            pos = 0
+            for request in batch:
+                n = len(request.inputs)
+                request.future.set_result(vectors[pos : pos + n] if vectors else None)
+                pos += n
+
+
+_CLIENT: Optional[EmbeddingClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_embedding_client() -> EmbeddingClient:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = EmbeddingClient()
+        return _CLIENT
+
+
+def get_embeddings(
+    texts: List[str],
+    spec: Optional[EmbeddingSpec] = None,
+    priority: int = BACKGROUND,
+) -> List[Optional[List[float]]]:
+    """
+    Embeds many texts with as few /embeddings requests as the limits allow.
+    Texts already in the local embedding cache never hit the network.
+    The result is aligned with `texts`; failed entries are None. `spec`
+    defaults to the configured model/dimensions. Bulk work stays in the
+    BACKGROUND lane; anything a user is waiting on should pass FOREGROUND.
+    """
+    spec = tuple(spec) if spec else current_spec()
+    cache_model = _cache_model(spec)
+    cleaned = [t.replace("\n", " ") for t in texts]
+    cache = get_embedding_cache()
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    for i, vec in cache.get_many(cache_model, cleaned).items():
+        results[i] = vec
+
+    # Identical misses are only sent once
+    misses: Dict[str, List[int]] = {}
+    for i, vec in enumerate(results):
+        if vec is None:
+            misses.setdefault(cleaned[i], []).append(i)
+    unique = list(misses)
+
+    client = get_embedding_client()
+    pending = []
+    for batch in _iter_batches(unique):
+        inputs = [unique[i] for i in batch]
+        pending.append((inputs, client.submit(inputs, spec, priority)))
+    for inputs, future in pending:
+        vectors = future.result()
+        if not vectors:
+            continue
+        cache.put_many(cache_model, inputs, vectors)
+        for text, vec in zip(inputs, vectors):
+            for i in misses[text]:
+                results[i] = vec
+    return results
+
+
+# --- QUERY MEMO (LRU + TTL, single-flight) ---
+# The same query text is embedded by several retrieval lanes in one turn
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 600  # seconds
+
+# (spec, text) -> (expires, vector)
+_QUERY_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_IN_FLIGHT: Dict[tuple, Future] = {}
+_QUERY_LOCK = threading.Lock()
+
+
+def get_embedding(
+    text: str, spec: Optional[EmbeddingSpec] = None
+) -> Optional[List[float]]:
+    """
+    Embeds one (query) text in the FOREGROUND lane. Recent results are
+    memoized in-process, and concurrent callers asking for the same text
+    share a single request. Queries against an index must use that index's
+    spec.
+    """
+    spec = tuple(spec) if spec else current_spec()
+    key = (spec, text.replace("\n", " "))
+    now = time.monotonic()
+
+    with _QUERY_LOCK:
+        hit = _QUERY_CACHE.get(key)
+        if hit and hit[0] > now:
+            _QUERY_CACHE.move_to_end(key)
+            return hit[1]
+        flight = _IN_FLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = _IN_FLIGHT[key] = Future()
+
+    if not leader:
+        return flight.result()
+
+    vector = None
+    try:
+        vector = get_embeddings([key[1]], spec, FOREGROUND)[0]
+    finally:
+        with _QUERY_LOCK:
+            _IN_FLIGHT.pop(key, None)
+            if vector:
+                _QUERY_CACHE[key] = (time.monotonic() + QUERY_CACHE_TTL, vector)
+                _QUERY_CACHE.move_to_end(key)
+                while len(_QUERY_CACHE) > QUERY_CACHE_SIZE:
+                    _QUERY_CACHE.popitem(last=False)
+        flight.set_result(vector)
+    return vector
+
+
 def cosine_similarity(v1: List[float], v2: List[float]) -> float:
     if not v1 or not v2 or len(v1) != len(v2):
         return 0.0
@@ -54,41 +413,129 @@ def cosine_similarity(v1: List[float], v2: List[float]) -> float:
 
 
 def load_vectors() -> Dict[str, List[float]]:
-    if not MEMORY_VECTORS_FILE.exists():
-        return {}
-    try:
-        with open(MEMORY_VECTORS_FILE, "r") as f:
-            return json.load(f)
-    except:
-        return {}
+    return get_memory_store().to_dict()
 
 
 def save_vectors(vectors: Dict[str, List[float]]):
-    with open(MEMORY_VECTORS_FILE, "w") as f:
-        json.dump(vectors, f)
+    store = get_memory_store()
+    store.replace(vectors, store.spec)
 
 
-def semantic_search(
-    query_text: str, top_k: int = 3, vectors_cache: Optional[Dict] = None
-) -> List[Dict]:
-    query_vector = get_embedding(query_text)
+def semantic_hits(
+    query_text: str,
+    top_k: int = 3,
+    vectors_cache: Optional[Dict] = None,
+    query_vector: Optional[List[float]] = None,
+    threshold: float = 0.3,
+) -> List[Tuple[Dict, float]]:
+    """
+    [(archive item, cosine)] for the best memories. `query_vector` must be in
+    the store's spec (see `get_memory_store().spec`); it is embedded here
+    when not given.
+    """
+    if vectors_cache is not None:
+        store = MemoryVectorStore.from_dict(vectors_cache)
+    else:
+        store = get_memory_store()
+
+    # The query has to live in the same space as the stored vectors
+    if query_vector is None:
+        query_vector = get_embedding(query_text, store.spec)
     if not query_vector:
         return []
 
-    vectors = vectors_cache if vectors_cache is not None else load_vectors()
-    if not vectors or not MEMORY_ARCHIVE_FILE.exists():
+    # Over-fetch a little: vectors may exist for IDs no longer in the archive
+    hits = store.search(query_vector, top_k=top_k * 2 + 4, threshold=threshold)
+    if not hits:
         return []
+    archive = get_memory_db().get_many([mem_id for mem_id, _ in hits], ARCHIVE)
+    results = [(archive[mem_id], score) for mem_id, score in hits if mem_id in archive]
+    return results[:top_k]
+
+
+def semantic_search(
+    query_text: str, top_k: int = 3, vectors_cache: Optional[Dict] = None
+) -> List[Dict]:
+    return [item for item, _ in semantic_hits(query_text, top_k, vectors_cache)]
+
+
+def migrate_memory_vectors() -> bool:
+    """
+    Re-embeds the memory store from archive content when it was built with a
+    different model/dimensions than configured. The swap only happens once
+    every memory has a new vector, so search never mixes the two spaces.
+    Returns True if a migration ran.
+    """
+    store = get_memory_store()
+    spec = current_spec()
+    if store.spec == spec:
+        return False
+
+    archive = get_memory_db().get_many(store.ids(), ARCHIVE)
+    ids = [mem_id for mem_id in store.ids() if mem_id in archive]
+    vectors = get_embeddings([archive[mem_id]["content"] for mem_id in ids], spec)
+    if any(v is None for v in vectors):
+        print("[Embeddings] Memory migration incomplete, keeping old vectors.")
+        return False
+
+    store.replace(dict(zip(ids, vectors)), spec)
+    print(f"[Embeddings] Migrated {len(ids)} memory vectors to {spec[0]}.")
+    return True
+
+
+def reconcile_memory_vectors(store=None, db=None, dry_run: bool = False) -> Dict:
+    """
+    Brings the memory vector store back in line with the archive: drops
+    vectors whose memory is gone, bulk-embeds archive items that have none
+    (in the store's own spec) and rewrites the file compactly. Returns the
+    counts and bytes reclaimed; with dry_run nothing is changed.
+    """
+    store = store or get_memory_store()
+    db = db or get_memory_db()
+    # Vectors first: memories are saved archive-first, so every vector read
+    # here has its archive row in the snapshot below, even if a save lands
+    # in between
+    vector_ids = set(store.ids())
+    archive = db.load(ARCHIVE)
+    archive_ids = {str(m["id"]) for m in archive}
+
+    orphans = sorted(vector_ids - archive_ids)
+    missing = [m for m in archive if str(m["id"]) not in vector_ids]
+    report = {
+        "archive": len(archive),
+        "vectors": len(vector_ids),
+        "orphans": len(orphans),
+        "missing": len(missing),
+        "embedded": 0,
+        "failed": 0,
+        "bytes_before": store.disk_size(),
+        "bytes_after": store.disk_size(),
+    }
+    if dry_run:
+        return report
 
-    with open(MEMORY_ARCHIVE_FILE, "r") as f:
-        archive = json.load(f)
+    fresh = {}
+    if missing:
+        vectors = get_embeddings([m.get("content", "") for m in missing], store.spec)
+        fresh = {item["id"]: vector for item, vector in zip(missing, vectors) if vector}
+    # One locked read-modify-write on top of whatever was written during the
+    # embedding call
+    added, removed = store.update(add=fresh, remove=orphans)
+    report["orphans"] = removed
+    report["embedded"] = added
+    report["failed"] = len(missing) - added
+    report["bytes_after"] = store.disk_size()
+    return report
 
-    scored_memories = []
-    for item in archive:
-        mem_id = str(item.get("id"))
-        if mem_id in vectors:
-            sim = cosine_similarity(query_vector, vectors[mem_id])
-            if sim > 0.3:
-                scored_memories.append((sim, item))
 
-    scored_memories.sort(key=lambda x: x[0], reverse=True)
-    return [item for score, item in scored_memories[:top_k]]
+def format_reconcile_report(report: Dict) -> str:
+    reclaimed = report["bytes_before"] - report["bytes_after"]
+    lines = [
+        f"Archive items: {report['archive']}, vectors: {report['vectors']}",
+        f"Orphan vectors dropped: {report['orphans']}",
+        f"Missing vectors: {report['missing']} "
+        f"(embedded {report['embedded']}, failed {report['failed']})",
+        f"Vectors on disk: {report['bytes_before']:,} -> {report['bytes_after']:,} bytes "
+        f"({reclaimed:,} reclaimed)",
+    ]
+    return "\n".join(lines)
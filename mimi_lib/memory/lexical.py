@@ -0,0 +1,252 @@
+"""
+BM25 inverted index over the memory archive (the [Recall] lane).
+
+The index lives in memory across turns and is persisted next to the
+archive, a few seconds after the last change (it is only a cache: a
+missed save is caught up by the next sync). `save_memory` /
+`delete_memory` update it in place; writes from other processes (e.g.
+the watcher) are picked up by diffing the archive against the index when
+the archive's version changes.
+"""
+
+import atexit
+import heapq
+import json
+import math
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from mimi_lib.config import MEMORY_LEXICAL_INDEX_FILE
+from mimi_lib.memory.memory_db import ARCHIVE, get_memory_db
+from mimi_lib.utils.docstore import WRITE_BEHIND_SECONDS, write_json
+
+INDEX_VERSION = 1
+
+# Okapi BM25 defaults
+K1 = 1.2
+B = 0.75
+
+STOP_WORDS = frozenset("""
+    a about above after again against all also am an and any are as at be
+    because been before being below between both but by can could did do does
+    doing down during each few for from further had has have having he her here
+    hers herself him himself his how i if in into is it its itself just me more
+    most my myself no nor not now of off on once only or other our ours
+    ourselves out over own same she should so some such than that the their
+    theirs them themselves then there these they this those through to too
+    under until up very was we were what when where which while who whom why
+    will with would you your yours yourself yourselves im ive dont didnt cant
+    thats theres lets like really still even much many well yeah okay ok
+    """.split())
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        t
+        for t in _TOKEN_RE.findall(text.lower().replace("'", ""))
+        if len(t) > 1 and t not in STOP_WORDS
+    ]
+
+
+def _term_counts(text: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for t in tokenize(text):
+        counts[t] = counts.get(t, 0) + 1
+    return counts
+
+
+def _archive_stamp():
+    try:
+        return get_memory_db().version(ARCHIVE)
+    except:
+        return None
+
+
+class LexicalIndex:
+    def __init__(self, path=MEMORY_LEXICAL_INDEX_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._stamp = None  # archive version the index reflects
+        self._dirty = False  # changed since the last save
+        self._timer = None  # pending write-behind save
+        self.items: Dict[str, Dict] = {}  # id -> archive item
+        self.doc_terms: Dict[str, Dict[str, int]] = {}  # id -> {term: tf}
+        self.doc_len: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {id: tf}
+        self.total_len = 0
+
+    # --- Mutation ---
+
+    def _index(self, item: Dict, terms: Optional[Dict[str, int]] = None):
+        doc_id = str(item.get("id"))
+        self._unindex(doc_id)
+        if terms is None:
+            terms = _term_counts(item.get("content", ""))
+        self.items[doc_id] = item
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = length = sum(terms.values())
+        self.total_len += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def _unindex(self, doc_id: str) -> bool:
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        self.items.pop(doc_id, None)
+        self.total_len -= self.doc_len.pop(doc_id, 0)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        return True
+
+    # Writers just committed one write to the archive themselves. If that
+    # is the only write since our last sync, patch it in and adopt the new
+    # version; otherwise another process wrote too, so diff the archive
+    # (which already holds the caller's change)
+    def _adopt_write(self, apply):
+        self._ensure_loaded()
+        stamp = _archive_stamp()
+        if stamp is not None and self._stamp is not None and stamp == self._stamp + 1:
+            result = apply()
+            self._stamp = stamp
+            return result
+        self._ensure_synced()
+        return None
+
+    def add(self, item: Dict, persist: bool = True):
+        """Indexes one archive item that was just saved."""
+        with self._lock:
+            self._adopt_write(lambda: self._index(item))
+            if persist:
+                self.schedule_save()
+
+    def remove(self, mem_id, persist: bool = True) -> bool:
+        with self._lock:
+            doc_id = str(mem_id)
+            removed = doc_id in self.doc_terms
+            self._adopt_write(lambda: self._unindex(doc_id))
+            if persist:
+                self.schedule_save()
+            return removed
+
+    # --- Disk Sync ---
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except:
+            return
+        if data.get("version") != INDEX_VERSION:
+            return
+        self._stamp = data.get("archive_stamp")
+        for doc in data.get("docs", []):
+            self._index(doc["item"], doc["terms"])
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            data = {
+                "version": INDEX_VERSION,
+                "archive_stamp": self._stamp,
+                "docs": [
+                    {"item": self.items[d], "terms": terms}
+                    for d, terms in self.doc_terms.items()
+                ],
+            }
+            write_json(self.path, data, indent=None)
+            self._dirty = False
+
+    def schedule_save(self, delay: float = WRITE_BEHIND_SECONDS):
+        """Saves after `delay` seconds, so a burst of changes is written once."""
+        with self._lock:
+            self._dirty = True
+            if self._timer is None and self.path is not None:
+                self._timer = threading.Timer(delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self.save()
+
+    def _ensure_synced(self):
+        self._ensure_loaded()
+        stamp = _archive_stamp()
+        if stamp == self._stamp:
+            return
+        # Someone else wrote to the archive: reindex only what differs
+        try:
+            archive = get_memory_db().load(ARCHIVE) if stamp else []
+        except:
+            return
+        current = {str(item.get("id")): item for item in archive}
+        for doc_id in [d for d in self.items if d not in current]:
+            self._unindex(doc_id)
+        for doc_id, item in current.items():
+            old = self.items.get(doc_id)
+            if old is None or old.get("content") != item.get("content"):
+                self._index(item)
+            else:
+                self.items[doc_id] = item
+        self._stamp = stamp
+        self.schedule_save()
+
+    # --- Query ---
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[Dict, float]]:
+        """Returns [(archive item, BM25 score)], best first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            self._ensure_synced()
+            n = len(self.doc_len)
+            if not n:
+                return []
+            avg_len = self.total_len / n or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = K1 * (1 - B + B * self.doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (
+                        tf + norm
+                    )
+            best = heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+            return [(self.items[doc_id], score) for doc_id, score in best]
+
+
+_LEXICAL_INDEX: Optional[LexicalIndex] = None
+_LEXICAL_LOCK = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _LEXICAL_INDEX
+    with _LEXICAL_LOCK:
+        if _LEXICAL_INDEX is None:
+            _LEXICAL_INDEX = LexicalIndex()
+            atexit.register(_LEXICAL_INDEX.flush)
+        return _LEXICAL_INDEX
@@ -0,0 +1,372 @@
+"""
+Transactional memory storage (SQLite, WAL mode).
+
+Replaces archive.json (permanent memories) and active_store.json (the
+compressible set shown in the prompt). Both live in one `memories` table,
+told apart by `store`:
+
+    memories(store, id, timestamp, category, content, content_hash, extra)
+        PRIMARY KEY (store, id)
+        UNIQUE (store, content_hash)   -> duplicate saves are a no-op
+        INDEX (store, category), (store, timestamp)
+    stores(store, version, modified)   -> bumped by writes that change rows
+
+Saving one memory is an indexed insert instead of a full-file rewrite, and
+SQLite's locking serializes the CLI, the watcher and the diary cron.
+`version` lets readers that keep derived state (the BM25 index, the skill
+init cache) notice writes from other processes.
+
+On first open the JSON files are imported once and renamed to
+*.json.migrated.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from mimi_lib.config import MEMORY_ARCHIVE_FILE, MEMORY_DB_FILE, MEMORY_STORE_FILE
+
+ARCHIVE, ACTIVE = "archive", "active"
+SCHEMA_VERSION = 1
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M"
+
+# Columns of their own; any other item keys round-trip through `extra`
+_COLUMNS = ("id", "timestamp", "category", "content")
+
+
+def content_hash(content: str) -> bytes:
+    return hashlib.sha256(content.encode("utf-8")).digest()
+
+
+def _timestamp_key(value) -> str:
+    # Stored timestamps are "%Y-%m-%d %H:%M", which sorts chronologically
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return str(value)
+
+
+def _row_to_item(row) -> Dict:
+    mem_id, timestamp, category, content, extra = row
+    item = json.loads(extra) if extra else {}
+    item.update(id=mem_id, timestamp=timestamp, content=content)
+    if category is not None:
+        item["category"] = category
+    return item
+
+
+class MemoryDB:
+    def __init__(
+        self,
+        path=MEMORY_DB_FILE,
+        legacy_files=((ARCHIVE, MEMORY_ARCHIVE_FILE), (ACTIVE, MEMORY_STORE_FILE)),
+    ):
+        self.path = path
+        self.legacy_files = legacy_files
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(
+                str(self.path),
+                timeout=30,
+                check_same_thread=False,
+                isolation_level=None,  # Transactions are explicit below
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS memories ("
+                " store TEXT NOT NULL,"
+                " id INTEGER NOT NULL,"
+                " timestamp TEXT NOT NULL DEFAULT '',"
+                " category TEXT,"
+                " content TEXT NOT NULL,"
+                " content_hash BLOB NOT NULL,"
+                " extra TEXT,"
+                " PRIMARY KEY (store, id))"
+            )
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_memories_hash"
+                " ON memories(store, content_hash)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_memories_category"
+                " ON memories(store, category)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_memories_timestamp"
+                " ON memories(store, timestamp)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stores ("
+                " store TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " modified REAL NOT NULL)"
+            )
+            self._conn = conn
+            self._migrate_json()
+        return self._conn
+
+    # --- Transactions ---
+
+    def _write(self, store: str, fn):
+        """
+        Runs fn(conn) in one IMMEDIATE transaction and bumps the store if
+        it changed any rows. A duplicate add or a delete of an unknown ID
+        leaves the version alone, so derived indexes don't resync for it.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                changes = conn.total_changes
+                result = fn(conn)
+                if conn.total_changes > changes:
+                    conn.execute(
+                        "INSERT INTO stores (store, version, modified) VALUES (?, 1, ?)"
+                        " ON CONFLICT(store) DO UPDATE SET"
+                        " version = version + 1, modified = excluded.modified",
+                        (store, time.time()),
+                    )
+                conn.execute("COMMIT")
+            except:
+                conn.execute("ROLLBACK")
+                raise
+            return result
+
+    def _insert(self, conn, store: str, item: Dict) -> Tuple[int, bool]:
+        content = item.get("content", "")
+        digest = content_hash(content)
+        row = conn.execute(
+            "SELECT id FROM memories WHERE store = ? AND content_hash = ?",
+            (store, digest),
+        ).fetchone()
+        if row:
+            return row[0], False
+
+        mem_id = item.get("id")
+        mem_id = int(time.time() * 1000 if mem_id in (None, "") else mem_id)
+        if conn.execute(
+            "SELECT 1 FROM memories WHERE store = ? AND id = ?", (store, mem_id)
+        ).fetchone():
+            # Two saves in the same millisecond; keep IDs unique and increasing
+            mem_id = conn.execute(
+                "SELECT MAX(id) + 1 FROM memories WHERE store = ?", (store,)
+            ).fetchone()[0]
+        extra = {k: v for k, v in item.items() if k not in _COLUMNS}
+        conn.execute(
+            "INSERT INTO memories"
+            " (store, id, timestamp, category, content, content_hash, extra)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                store,
+                mem_id,
+                item.get("timestamp", ""),
+                item.get("category"),
+                content,
+                digest,
+                json.dumps(extra, ensure_ascii=False) if extra else None,
+            ),
+        )
+        return mem_id, True
+
+    # --- API (shaped like the old load_json/save_json lists) ---
+
+    def add(self, item: Dict, store: str = ARCHIVE) -> Tuple[int, bool]:
+        """
+        Inserts one {id, timestamp, content, category, ...} item. Returns
+        (id, inserted); for duplicate content that's the existing ID.
+        """
+        return self._write(store, lambda conn: self._insert(conn, store, item))
+
+    def delete(self, mem_id, store: str = ARCHIVE) -> bool:
+        return self._write(
+            store,
+            lambda conn: conn.execute(
+                "DELETE FROM memories WHERE store = ? AND id = ?", (store, int(mem_id))
+            ).rowcount
+            > 0,
+        )
+
+    def update_content(
+        self, mem_id, content: str, store: str = ARCHIVE, timestamp=None
+    ) -> bool:
+        """
+        Rewrites one item's content (and optionally timestamp) in place.
+        False if the ID is unknown or the store already has that content.
+        """
+
+        def run(conn):
+            sql = "UPDATE memories SET content = ?, content_hash = ?"
+            args = [content, content_hash(content)]
+            if timestamp is not None:
+                sql += ", timestamp = ?"
+                args.append(_timestamp_key(timestamp))
+            sql += " WHERE store = ? AND id = ?"
+            return conn.execute(sql, args + [store, int(mem_id)]).rowcount > 0
+
+        try:
+            return self._write(store, run)
+        except sqlite3.IntegrityError:
+            return False
+
+    def replace(self, items: Iterable[Dict], store: str = ACTIVE) -> int:
+        """Swaps a whole store's contents in one transaction (e.g. compression)."""
+
+        def run(conn):
+            conn.execute("DELETE FROM memories WHERE store = ?", (store,))
+            return sum(self._insert(conn, store, item)[1] for item in items)
+
+        return self._write(store, run)
+
+    def load(self, store: str = ARCHIVE) -> List[Dict]:
+        """Every item of a store, oldest insert first (like the JSON list)."""
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT id, timestamp, category, content, extra FROM memories"
+                    " WHERE store = ? ORDER BY rowid",
+                    (store,),
+                )
+                .fetchall()
+            )
+        return [_row_to_item(r) for r in rows]
+
+    def get_many(self, ids, store: str = ARCHIVE) -> Dict[str, Dict]:
+        """{str(id): item} for the IDs that exist; one indexed lookup each."""
+        wanted = []
+        for mem_id in ids:
+            try:
+                wanted.append(int(mem_id))
+            except (TypeError, ValueError):
+                continue
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(wanted), 500):
+                part = wanted[start : start + 500]
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    "SELECT id, timestamp, category, content, extra FROM memories"
+                    f" WHERE store = ? AND id IN ({marks})",
+                    [store] + part,
+                ).fetchall()
+                for row in rows:
+                    found[str(row[0])] = _row_to_item(row)
+        return found
+
+    def between(
+        self,
+        store: str = ARCHIVE,
+        start=None,
+        end=None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> List[Dict]:
+        """
+        Items with start <= timestamp < end (either bound optional), in
+        timestamp order. A range scan of the (store, timestamp) index, so
+        "latest N" is between(store, limit=N, newest_first=True).
+        """
+        sql = (
+            "SELECT id, timestamp, category, content, extra FROM memories"
+            " WHERE store = ?"
+        )
+        args = [store]
+        if start is not None:
+            sql += " AND timestamp >= ?"
+            args.append(_timestamp_key(start))
+        if end is not None:
+            sql += " AND timestamp < ?"
+            args.append(_timestamp_key(end))
+        sql += " ORDER BY timestamp DESC" if newest_first else " ORDER BY timestamp"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        with self._lock:
+            rows = self._connect().execute(sql, args).fetchall()
+        return [_row_to_item(r) for r in rows]
+
+    def contains(self, content: str, store: str = ARCHIVE) -> bool:
+        with self._lock:
+            return (
+                self._connect()
+                .execute(
+                    "SELECT 1 FROM memories WHERE store = ? AND content_hash = ?",
+                    (store, content_hash(content)),
+                )
+                .fetchone()
+                is not None
+            )
+
+    def version(self, store: str = ARCHIVE) -> int:
+        """Bumped by every committed write to `store`, from any process."""
+        row = self._stamp(store)
+        return row[0] if row else 0
+
+    def modified(self, store: str = ARCHIVE) -> float:
+        """Wall-clock time of the last write to `store` (0 if never)."""
+        row = self._stamp(store)
+        return row[1] if row else 0.0
+
+    def _stamp(self, store: str) -> Optional[tuple]:
+        with self._lock:
+            return (
+                self._connect()
+                .execute(
+                    "SELECT version, modified FROM stores WHERE store = ?", (store,)
+                )
+                .fetchone()
+            )
+
+    # --- JSON Migration ---
+
+    def _migrate_json(self):
+        """One-shot import of archive.json / active_store.json."""
+        conn = self._conn
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                for store, path in self.legacy_files:
+                    try:
+                        items = json.loads(path.read_text(encoding="utf-8"))
+                    except (FileNotFoundError, ValueError):
+                        continue
+                    for item in items:
+                        if isinstance(item, dict) and item.get("content"):
+                            self._insert(conn, store, item)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO stores (store, version, modified)"
+                        " VALUES (?, 1, ?)",
+                        (store, path.stat().st_mtime),
+                    )
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        for _, path in self.legacy_files:
+            if path.exists():
+                path.rename(path.with_suffix(".json.migrated"))
+                print(f"[MemoryDB] Migrated {path.name} into {self.path.name}")
+
+
+_MEMORY_DB: Optional[MemoryDB] = None
+_MEMORY_DB_LOCK = threading.Lock()
+
+
+def get_memory_db() -> MemoryDB:
+    global _MEMORY_DB
+    with _MEMORY_DB_LOCK:
+        if _MEMORY_DB is None:
+            _MEMORY_DB = MemoryDB()
+        return _MEMORY_DB
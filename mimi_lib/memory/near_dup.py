@@ -0,0 +1,233 @@
+"""
+Write-time near-duplicate detection for the memory archive.
+
+Every archive item gets a MinHash signature over character 5-gram
+shingles of its text, minus stop words (but keeping negations and
+numbers). Signatures are split into LSH bands, so finding the items that
+look like a new memory costs a few dict lookups rather than a scan. A
+candidate counts as a duplicate when its estimated shingle overlap is at
+least NEAR_DUP_JACCARD, or, for weaker candidates, when its embedding is
+within NEAR_DUP_COSINE of the new one.
+
+Neither measure notices "is allergic" vs "is not allergic" or "March
+3rd" vs "March 5th", so a candidate whose negation or numbers differ is
+never a duplicate: that's a correction, and it gets stored on its own.
+
+Like the BM25 index, this lives in memory and is rebuilt from the
+archive when another process has written to it.
+"""
+
+import re
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from mimi_lib.config import NEAR_DUP_COSINE, NEAR_DUP_JACCARD
+from mimi_lib.memory.lexical import STOP_WORDS
+from mimi_lib.memory.memory_db import ARCHIVE, get_memory_db
+
+SHINGLE = 5
+NUM_PERM = 64
+# 16 bands x 4 rows: pairs above ~0.5 estimated Jaccard usually share a band
+BANDS, ROWS = 16, 4
+# Only the best few candidates are confirmed (embedding lookups aren't free)
+MAX_CANDIDATES = 5
+
+_PRIME = (1 << 31) - 1  # Mersenne; a * x stays well inside uint64
+_rng = np.random.default_rng(0x6D696D69)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+# Apostrophes are dropped before matching, so "don't" is "dont"
+NEGATIONS = frozenset("""
+    not no nor never none nothing nobody neither without cannot cant dont
+    doesnt didnt isnt arent wasnt werent wont wouldnt shouldnt couldnt
+    hasnt havent hadnt aint
+    """.split())
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower().replace("'", "").replace("\u2019", ""))
+
+
+def _is_number(word: str) -> bool:
+    return any(c.isdigit() for c in word)
+
+
+def normalize(text: str) -> str:
+    """Stop-word-free text for shingling; negations and numbers stay."""
+    return " ".join(
+        w
+        for w in _words(text)
+        if w in NEGATIONS or _is_number(w) or (len(w) > 1 and w not in STOP_WORDS)
+    )
+
+
+def qualifiers(text: str) -> Tuple[bool, frozenset]:
+    """(negated, numbers): two texts that differ here state different facts."""
+    words = _words(text)
+    return (
+        any(w in NEGATIONS for w in words),
+        frozenset(w for w in words if _is_number(w)),
+    )
+
+
+def shingles(text: str) -> np.ndarray:
+    normalized = normalize(text)
+    if len(normalized) <= SHINGLE:
+        grams = {normalized} if normalized else set()
+    else:
+        grams = {
+            normalized[i : i + SHINGLE] for i in range(len(normalized) - SHINGLE + 1)
+        }
+    return np.fromiter(
+        (zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams),
+        dtype=np.uint64,
+        count=len(grams),
+    )
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (NUM_PERM uint32s), or None for empty text."""
+    hashes = shingles(text)
+    if hashes.size == 0:
+        return None
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def estimate_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+class NearDupIndex:
+    def __init__(self, store: str = ARCHIVE):
+        self.store = store
+        self._lock = threading.RLock()
+        self._version = None  # store version the index reflects
+        self._items: Dict[str, Dict] = {}
+        self._sigs: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(BANDS)]
+
+    def _index(self, item: Dict):
+        sig = signature(item.get("content", ""))
+        if sig is None:
+            return
+        doc_id = str(item.get("id"))
+        self._unindex(doc_id)
+        self._items[doc_id] = item
+        self._sigs[doc_id] = sig
+        for band, bucket in zip(sig.reshape(BANDS, ROWS), self._buckets):
+            bucket.setdefault(band.tobytes(), set()).add(doc_id)
+
+    def _unindex(self, doc_id: str):
+        sig = self._sigs.pop(doc_id, None)
+        self._items.pop(doc_id, None)
+        if sig is None:
+            return
+        for band, bucket in zip(sig.reshape(BANDS, ROWS), self._buckets):
+            ids = bucket.get(band.tobytes())
+            if ids:
+                ids.discard(doc_id)
+                if not ids:
+                    del bucket[band.tobytes()]
+
+    def _ensure_synced(self):
+        db = get_memory_db()
+        version = db.version(self.store)
+        if version == self._version:
+            return
+        self._items, self._sigs = {}, {}
+        self._buckets = [{} for _ in range(BANDS)]
+        for item in db.load(self.store):
+            self._index(item)
+        self._version = version
+
+    # Writers just committed one write to the store themselves: if nothing
+    # else was written since our last sync, patch it in and adopt the new
+    # version; otherwise rebuild (the store already holds the change)
+    def _adopt_write(self, apply):
+        version = get_memory_db().version(self.store)
+        if self._version is not None and version == self._version + 1:
+            apply()
+            self._version = version
+        else:
+            self._ensure_synced()
+
+    def add(self, item: Dict):
+        with self._lock:
+            self._adopt_write(lambda: self._index(item))
+
+    def remove(self, mem_id):
+        with self._lock:
+            self._adopt_write(lambda: self._unindex(str(mem_id)))
+
+    def candidates(self, text: str) -> List[Tuple[Dict, float]]:
+        """[(item, estimated Jaccard)] sharing an LSH band with text, best first."""
+        sig = signature(text)
+        if sig is None:
+            return []
+        with self._lock:
+            self._ensure_synced()
+            found = set()
+            for band, bucket in zip(sig.reshape(BANDS, ROWS), self._buckets):
+                found |= bucket.get(band.tobytes(), set())
+            scored = [
+                (self._items[doc_id], estimate_jaccard(sig, self._sigs[doc_id]))
+                for doc_id in found
+            ]
+        return sorted(scored, key=lambda c: c[1], reverse=True)
+
+
+def find_near_duplicate(
+    content: str,
+    embed: Optional[Callable[[], Optional[List[float]]]] = None,
+    vectors=None,
+    index: Optional[NearDupIndex] = None,
+) -> Optional[Tuple[Dict, float]]:
+    """
+    The archive item `content` restates, with its similarity, or None.
+    `embed` (called at most once, only if a candidate needs confirming)
+    returns the new memory's embedding; `vectors` is the memory vector
+    store holding the candidates' embeddings.
+    """
+    query = None
+    facts = qualifiers(content)
+    candidates = [
+        (item, jaccard)
+        for item, jaccard in (index or get_near_dup_index()).candidates(content)
+        if qualifiers(item.get("content", "")) == facts
+    ]
+    for item, jaccard in candidates[:MAX_CANDIDATES]:
+        if jaccard >= NEAR_DUP_JACCARD:
+            return item, jaccard
+        if embed is None or vectors is None:
+            continue
+        if query is None:
+            vec = embed()
+            if not vec:
+                embed = None
+                continue
+            query = np.asarray(vec, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+        other = vectors.get(item.get("id"))
+        if other is not None and other.size == query.size:
+            cosine = float(other @ query)
+            if cosine >= NEAR_DUP_COSINE:
+                return item, cosine
+    return None
+
+
+_NEAR_DUP_INDEX: Optional[NearDupIndex] = None
+_NEAR_DUP_LOCK = threading.Lock()
+
+
+def get_near_dup_index() -> NearDupIndex:
+    global _NEAR_DUP_INDEX
+    with _NEAR_DUP_LOCK:
+        if _NEAR_DUP_INDEX is None:
+            _NEAR_DUP_INDEX = NearDupIndex()
+        return _NEAR_DUP_INDEX
@@ -0,0 +1,58 @@
+"""
+Per-dimension 8-bit scalar quantization of embedding matrices.
+
+Each dimension d is mapped affinely onto 0..255 with its own offset and
+scale, so x[d] ~= offset[d] + scale[d] * code[d]. A dot product against the
+codes then only needs one extra bias term:
+
+    q . x ~= q . offset + (q * scale) . code
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+# Rows processed per step, to bound float32 temporaries on large indexes
+BLOCK_ROWS = 32768
+# Scoring upcasts small blocks so each float32 temporary stays cache-resident
+SCORE_BLOCK_ROWS = 256
+
+
+def fit_quantizer(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (scale, offset) per dimension from the matrix's value range."""
+    lo = np.asarray(matrix.min(axis=0), dtype=np.float32)
+    hi = np.asarray(matrix.max(axis=0), dtype=np.float32)
+    scale = (hi - lo) / 255.0
+    scale[scale == 0] = 1.0
+    return scale.astype(np.float32), lo
+
+
+def encode(matrix: np.ndarray, scale: np.ndarray, offset: np.ndarray) -> np.ndarray:
+    codes = np.empty(matrix.shape, dtype=np.uint8)
+    for start in range(0, matrix.shape[0], BLOCK_ROWS):
+        block = np.asarray(matrix[start : start + BLOCK_ROWS], dtype=np.float32)
+        codes[start : start + len(block)] = np.clip(
+            np.rint((block - offset) / scale), 0, 255
+        )
+    return codes
+
+
+def approx_scores(
+    codes: np.ndarray, scale: np.ndarray, offset: np.ndarray, q: np.ndarray, rows=None
+) -> np.ndarray:
+    """
+    Approximate q . x for every row (or just `rows`) straight from the codes.
+    Codes are upcast one block at a time, since NumPy has no BLAS path for
+    8-bit matrix-vector products.
+    """
+    q_scaled = (q * scale).astype(np.float32)
+    bias = float(q @ offset)
+
+    if rows is not None:
+        return codes[rows].astype(np.float32) @ q_scaled + bias
+
+    out = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+        block = codes[start : start + SCORE_BLOCK_ROWS]
+        out[start : start + len(block)] = block.astype(np.float32) @ q_scaled
+    return out + bias
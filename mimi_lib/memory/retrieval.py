@@ -0,0 +1,228 @@
+"""
+Hybrid retrieval engine.
+
+One call embeds the query once per embedding spec in use, fans out to the
+vault index, the memory vector store and the BM25 recall index in
+parallel, and merges whatever answered within the latency budget with
+reciprocal-rank fusion (RRF). Every hit records which lanes found it, and
+the result records which lanes didn't answer (timed out or failed).
+
+When the query names a time ("last week", "in March") or the caller
+passes a `time_range`, the temporal lane adds archive items and diary
+entries from that window, newest first. Only an explicit `time_range`
+also drops memory hits from the other lanes that fall outside it.
+"""
+
+import concurrent.futures
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from mimi_lib.config import RETRIEVAL_BUDGET_MS
+from mimi_lib.memory.embeddings import get_embedding, semantic_hits
+from mimi_lib.memory.lexical import get_lexical_index
+from mimi_lib.memory.memory_db import TIMESTAMP_FORMAT
+from mimi_lib.memory.timeline import (
+    get_diary_index,
+    memories_between,
+    parse_time_range,
+)
+from mimi_lib.memory.vault_indexer import search_vault
+from mimi_lib.memory.vault_store import load_vault_index
+from mimi_lib.memory.vector_store import get_memory_store
+
+VAULT, MEMORY, LEXICAL, TEMPORAL = "vault", "memory", "lexical", "temporal"
+ALL_LANES = (VAULT, MEMORY, LEXICAL, TEMPORAL)
+DIARY = "diary"  # Hit source only; diary entries come from the temporal lane
+
+# RRF damping constant (Cormack et al.); keeps one lane's #1 from dominating
+RRF_K = 60
+# Noise floors for the cosine lanes; vault chunks carry a filename prefix,
+# which lifts their baseline similarity
+VAULT_MIN_COSINE = 0.4
+MEMORY_MIN_COSINE = 0.3
+
+# Shared pool: a lane that misses the budget finishes in the background
+# without holding up the caller
+_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=6, thread_name_prefix="retrieval"
+)
+
+
+@dataclass
+class RetrievalHit:
+    """
+    One fused result. `source` is "vault" for vault chunks, "memory" for
+    archive items (whichever lane found them) and "diary" for diary
+    entries; `lanes` maps each lane that returned it to its raw lane score.
+    """
+
+    source: str
+    text: str
+    score: float = 0.0  # RRF score
+    path: Optional[str] = None  # vault only
+    item: Optional[Dict] = None  # archive item or diary entry
+    lanes: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def key(self):
+        if self.source == VAULT:
+            return (VAULT, self.path, self.text)
+        if self.source == DIARY:
+            return (DIARY, self.item.get("date"))
+        return (MEMORY, str(self.item.get("id")))
+
+    def in_range(self, time_range) -> bool:
+        """Vault hits are never time-filtered here (see vault_scope)."""
+        if self.source == VAULT:
+            return True
+        end = time_range.end.strftime(TIMESTAMP_FORMAT)
+        if self.source == DIARY:
+            # "2026-01-05" < "2026-01-05 00:00": a day counts if it starts
+            # before the end
+            start = time_range.start.strftime("%Y-%m-%d")
+            return start <= self.item.get("date", "") < end
+        start = time_range.start.strftime(TIMESTAMP_FORMAT)
+        return start <= self.item.get("timestamp", "") < end
+
+
+class RetrievalHits(list):
+    """Fused hits; `missed` names the lanes that timed out or failed."""
+
+    def __init__(self, hits=(), missed: Tuple[str, ...] = ()):
+        super().__init__(hits)
+        self.missed = missed
+
+    @property
+    def complete(self) -> bool:
+        return not self.missed
+
+
+def _query_vector(query, spec):
+    # An empty lane and a lane that couldn't run look the same to the
+    # caller; raising lets retrieve() report the failure as a miss
+    vector = get_embedding(query, spec)
+    if not vector:
+        raise RuntimeError("query embedding failed")
+    return vector
+
+
+def _vault_lane(query, depth, spec, scope):
+    vector = _query_vector(query, spec)
+    return [
+        RetrievalHit(VAULT, r["text"], path=r["path"], lanes={VAULT: r["score"]})
+        for r in search_vault(
+            query,
+            top_k=depth,
+            query_vector=vector,
+            threshold=VAULT_MIN_COSINE,
+            **(scope or {}),
+        )
+    ]
+
+
+def _memory_lane(query, depth, spec):
+    vector = _query_vector(query, spec)
+    return [
+        RetrievalHit(MEMORY, item.get("content", ""), item=item, lanes={MEMORY: score})
+        for item, score in semantic_hits(
+            query, top_k=depth, query_vector=vector, threshold=MEMORY_MIN_COSINE
+        )
+    ]
+
+
+def _lexical_lane(query, depth):
+    return [
+        RetrievalHit(MEMORY, item.get("content", ""), item=item, lanes={LEXICAL: score})
+        for item, score in get_lexical_index().search(query, top_k=depth)
+    ]
+
+
+def _temporal_lane(time_range, depth):
+    # Newest first: "what happened last week" wants the end of the window
+    hits = [
+        RetrievalHit(MEMORY, item.get("content", ""), item=item, lanes={TEMPORAL: 1.0})
+        for item in memories_between(time_range.start, time_range.end, limit=depth)
+    ]
+    diary = get_diary_index().between(time_range.start, time_range.end, limit=depth)
+    hits += [
+        RetrievalHit(DIARY, entry.get("content", ""), item=entry, lanes={TEMPORAL: 1.0})
+        for entry in diary
+    ]
+    hits.sort(key=_hit_time, reverse=True)
+    return hits[:depth]
+
+
+def _hit_time(hit):
+    # Diary entries carry an epoch int `timestamp`, memories a formatted
+    # string; a diary entry sorts at the end of its day
+    if hit.source == DIARY:
+        return f"{hit.item.get('date', '')} 23:59"
+    return hit.item.get("timestamp", "")
+
+
+def fuse(ranked_lists: Sequence[List[RetrievalHit]], top_k: int) -> List[RetrievalHit]:
+    """Reciprocal-rank fusion; hits found by several lanes are merged."""
+    fused: Dict[tuple, RetrievalHit] = {}
+    for hits in ranked_lists:
+        for rank, hit in enumerate(hits):
+            merged = fused.get(hit.key)
+            if merged is None:
+                merged = fused[hit.key] = hit
+            else:
+                merged.lanes.update(hit.lanes)
+            merged.score += 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.values(), key=lambda h: h.score, reverse=True)[:top_k]
+
+
+def retrieve(
+    query: str,
+    top_k: int = 6,
+    lanes: Sequence[str] = ALL_LANES,
+    budget_ms: Optional[int] = None,
+    vault_scope: Optional[Dict] = None,
+    time_range=None,
+) -> RetrievalHits:
+    """
+    Fused top_k across `lanes`. The whole call (embedding included) is held
+    to `budget_ms`; lanes still running at the deadline (or that raised)
+    are dropped and listed in the result's `missed`.
+    `vault_scope` holds search_vault's filter arguments (path_prefix, tags,
+    since, until, keys) for the vault lane. An explicit `time_range` (a
+    TimeRange) restricts memory and diary hits from every lane; without
+    one, a time phrase in the query only adds the temporal lane, since
+    "help me with this today" shouldn't hide older memories.
+    """
+    deadline = time.monotonic() + (budget_ms or RETRIEVAL_BUDGET_MS) / 1000
+    depth = max(top_k * 2, 8)
+    window = time_range
+    if window is None and TEMPORAL in lanes:
+        window = parse_time_range(query)
+
+    # Both vector lanes ask for the query in their index's spec; when the
+    # specs agree, get_embedding's single-flight memo sends one request
+    futures = {}  # lane -> future, in lane order
+    if VAULT in lanes:
+        index = load_vault_index()
+        if index:
+            futures[VAULT] = _EXECUTOR.submit(
+                _vault_lane, query, depth, index.spec, vault_scope
+            )
+    if MEMORY in lanes:
+        spec = get_memory_store().spec
+        futures[MEMORY] = _EXECUTOR.submit(_memory_lane, query, depth, spec)
+    if LEXICAL in lanes:
+        futures[LEXICAL] = _EXECUTOR.submit(_lexical_lane, query, depth)
+    if TEMPORAL in lanes and window:
+        futures[TEMPORAL] = _EXECUTOR.submit(_temporal_lane, window, depth)
+
+    done, _ = concurrent.futures.wait(
+        futures.values(), timeout=max(0.0, deadline - time.monotonic())
+    )
+    # Keep lane order stable so ties in the fusion break the same way
+    answered = [lane for lane, f in futures.items() if f in done and not f.exception()]
+    ranked = [futures[lane].result() for lane in answered]
+    if time_range:
+        ranked = [[h for h in hits if h.in_range(time_range)] for hits in ranked]
+    missed = tuple(lane for lane in futures if lane not in answered)
+    return RetrievalHits(fuse(ranked, top_k), missed)
@@ -0,0 +1,280 @@
+"""
+Time-range lookups over memories and the diary.
+
+Archive and active-store items are range-scanned through the SQLite
+(store, timestamp) index (`MemoryDB.between`). Diary entries live in a
+JSON document, so they get a date-sorted in-memory index, rebuilt only
+when the diary file changes and queried with bisect. Both answer a range
+or "latest N" in O(log n + k).
+
+`parse_time_range` turns phrases like "last week", "3 days ago" or
+"in March" into a [start, end) window; it drives the temporal retrieval
+lane.
+"""
+
+import bisect
+import re
+import threading
+from calendar import monthrange
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from mimi_lib.config import DIARY_STORE_FILE
+from mimi_lib.memory.memory_db import ARCHIVE, get_memory_db
+from mimi_lib.utils.docstore import doc_stamp, load_doc
+
+
+class TimeRange(NamedTuple):
+    start: datetime  # inclusive
+    end: datetime  # exclusive
+    phrase: str
+
+
+# --- Memories ---
+
+
+def memories_between(
+    start=None, end=None, store=ARCHIVE, limit=None, newest_first=True
+) -> List[Dict]:
+    return get_memory_db().between(store, start, end, limit, newest_first)
+
+
+def latest_memories(n: int, store=ARCHIVE) -> List[Dict]:
+    return memories_between(store=store, limit=n)
+
+
+# --- Diary ---
+
+
+class DiaryIndex:
+    """Diary entries sorted by date; reloaded when the diary file changes."""
+
+    def __init__(self, path=DIARY_STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._dates: List[str] = []
+        self._entries: List[Dict] = []
+
+    def _ensure_loaded(self):
+        stamp = doc_stamp(self.path)
+        if stamp == self._stamp:
+            return
+        entries = [e for e in load_doc(self.path, []) if e.get("date")]
+        entries.sort(key=lambda e: e["date"])
+        self._dates = [e["date"] for e in entries]
+        self._entries = entries
+        self._stamp = stamp
+
+    def between(self, start=None, end=None, limit=None, newest_first=True):
+        """Entries whose day overlaps [start, end)."""
+        with self._lock:
+            self._ensure_loaded()
+            lo = 0
+            if start is not None:
+                lo = bisect.bisect_left(self._dates, start.strftime("%Y-%m-%d"))
+            hi = len(self._dates)
+            if end is not None:
+                # "2026-01-05" < "2026-01-05 10:00": a day counts if it starts
+                # before the end
+                hi = bisect.bisect_left(self._dates, end.strftime("%Y-%m-%d %H:%M"))
+            if hi <= lo:
+                return []
+            if newest_first:
+                first = lo if limit is None else max(lo, hi - limit)
+                return self._entries[first:hi][::-1]
+            last = hi if limit is None else min(hi, lo + limit)
+            return self._entries[lo:last]
+
+    def latest(self, n: int) -> List[Dict]:
+        return self.between(limit=n)
+
+
+_DIARY_INDEX: Optional[DiaryIndex] = None
+_DIARY_LOCK = threading.Lock()
+
+
+def get_diary_index() -> DiaryIndex:
+    global _DIARY_INDEX
+    with _DIARY_LOCK:
+        if _DIARY_INDEX is None:
+            _DIARY_INDEX = DiaryIndex()
+        return _DIARY_INDEX
+
+
+# --- Temporal Phrases ---
+
+_MONTHS = {
+    m: i + 1
+    for i, m in enumerate(
+        [
+            "january",
+            "february",
+            "march",
+            "april",
+            "may",
+            "june",
+            "july",
+            "august",
+            "september",
+            "october",
+            "november",
+            "december",
+        ]
+    )
+}
+_WEEKDAYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+_UNITS = {"day": 1, "week": 7, "fortnight": 14}
+_NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+_NUMBERS.update({"six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "few": 3})
+
+_NUM = r"(\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|few)"
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_AGO_RE = re.compile(rf"\b{_NUM}\s+(day|week|fortnight|month|year)s?\s+ago\b")
+# "past week" is rolling (the last 7 days); "last week" is the calendar week
+_PAST_RE = re.compile(
+    rf"\b(?:(?:last|past|previous)\s+{_NUM}|past)\s+(day|week|fortnight|month|year)s?\b"
+)
+_RELATIVE_RE = re.compile(
+    r"\b(today|tonight|this morning|this afternoon|this evening|yesterday|"
+    r"last night|(?:this|last|previous) (?:week|weekend|month|year)|"
+    r"recently|lately|these days)\b"
+)
+_WEEKDAY_RE = re.compile(rf"\b(?:on|last|this past)\s+({'|'.join(_WEEKDAYS)})\b")
+# "may" alone is too common a word; months need "in"/"during" or a year
+_MONTH_RE = re.compile(
+    rf"\b(?:(?:in|during|since|back in)\s+({'|'.join(_MONTHS)})(?:\s+(\d{{4}}))?"
+    rf"|({'|'.join(_MONTHS)})\s+(\d{{4}}))\b"
+)
+
+
+def _day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _month_start(year: int, month: int) -> datetime:
+    while month < 1:
+        year, month = year - 1, month + 12
+    return datetime(year, month, 1)
+
+
+def _month_range(year: int, month: int):
+    start = _month_start(year, month)
+    return start, start + timedelta(days=monthrange(start.year, start.month)[1])
+
+
+def _count(word: str) -> int:
+    return int(word) if word.isdigit() else _NUMBERS[word]
+
+
+def parse_time_range(text: str, now: Optional[datetime] = None) -> Optional[TimeRange]:
+    """The first time window mentioned in `text`, or None."""
+    now = now or datetime.now()
+    today = _day(now)
+    lowered = text.lower()
+
+    m = _ISO_DATE_RE.search(lowered)
+    if m:
+        try:
+            start = datetime(int(m[1]), int(m[2]), int(m[3]))
+            return TimeRange(start, start + timedelta(days=1), m[0])
+        except ValueError:
+            pass
+
+    m = _PAST_RE.search(lowered)
+    if m:
+        n, unit = _count(m[1] or "one"), m[2]
+        if unit in _UNITS:
+            start = today - timedelta(days=n * _UNITS[unit] - 1)
+        elif unit == "month":
+            first = _month_start(now.year, now.month - n)
+            days = monthrange(first.year, first.month)[1]
+            start = first.replace(day=min(today.day, days))
+        else:
+            first = datetime(today.year - n, today.month, 1)
+            days = monthrange(first.year, first.month)[1]
+            start = first.replace(day=min(today.day, days))
+        return TimeRange(start, now + timedelta(minutes=1), m[0])
+
+    m = _AGO_RE.search(lowered)
+    if m:
+        n, unit = _count(m[1]), m[2]
+        if unit in _UNITS:
+            days = n * _UNITS[unit]
+            start = today - timedelta(days=days)
+            # "2 weeks ago" means that week, give or take; "2 days ago" that day
+            span = 1 if unit == "day" else _UNITS[unit]
+            start -= timedelta(days=span // 2)
+            return TimeRange(start, start + timedelta(days=span), m[0])
+        if unit == "month":
+            return TimeRange(*_month_range(now.year, now.month - n), m[0])
+        return TimeRange(
+            datetime(now.year - n, 1, 1), datetime(now.year - n + 1, 1, 1), m[0]
+        )
+
+    m = _RELATIVE_RE.search(lowered)
+    if m:
+        phrase = m[1]
+        week_start = today - timedelta(days=today.weekday())
+        if phrase in (
+            "today",
+            "tonight",
+            "this morning",
+            "this afternoon",
+            "this evening",
+        ):
+            return TimeRange(today, today + timedelta(days=1), phrase)
+        if phrase in ("yesterday", "last night"):
+            return TimeRange(today - timedelta(days=1), today, phrase)
+        if phrase == "this week":
+            return TimeRange(week_start, week_start + timedelta(days=7), phrase)
+        if phrase in ("last week", "previous week"):
+            return TimeRange(week_start - timedelta(days=7), week_start, phrase)
+        if phrase == "this weekend":
+            start = week_start + timedelta(days=5)
+            return TimeRange(start, start + timedelta(days=2), phrase)
+        if phrase.endswith("weekend"):
+            start = week_start - timedelta(days=2)
+            return TimeRange(start, week_start, phrase)
+        if phrase == "this month":
+            return TimeRange(*_month_range(now.year, now.month), phrase)
+        if phrase.endswith("month"):
+            return TimeRange(*_month_range(now.year, now.month - 1), phrase)
+        if phrase == "this year":
+            return TimeRange(
+                datetime(now.year, 1, 1), datetime(now.year + 1, 1, 1), phrase
+            )
+        if phrase.endswith("year"):
+            return TimeRange(
+                datetime(now.year - 1, 1, 1), datetime(now.year, 1, 1), phrase
+            )
+        # recently / lately / these days
+        return TimeRange(today - timedelta(days=6), now + timedelta(minutes=1), phrase)
+
+    m = _WEEKDAY_RE.search(lowered)
+    if m:
+        # Most recent past occurrence (a week back if it's that day today)
+        back = (today.weekday() - _WEEKDAYS.index(m[1])) % 7 or 7
+        start = today - timedelta(days=back)
+        return TimeRange(start, start + timedelta(days=1), m[0])
+
+    m = _MONTH_RE.search(lowered)
+    if m:
+        month = _MONTHS[m[1] or m[3]]
+        year = m[2] or m[4]
+        if year:
+            year = int(year)
+        else:
+            # Latest one that has started
+            year = now.year if month <= now.month else now.year - 1
+        return TimeRange(*_month_range(year, month), m[0])
+
+    return None
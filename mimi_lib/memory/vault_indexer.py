@@ -1,54 +1,172 @@
 import os
 import json
+import hashlib
+import queue
+import re
 import threading
 import time
+from collections import ChainMap
 from pathlib import Path
-from datetime import datetime
-from mimi_lib.config import VAULT_PATH, VAULT_VECTORS_FILE, VAULT_INDEX_LOG
-from mimi_lib.memory.embeddings import get_embedding, cosine_similarity
-
-# Global Lock to prevent multiple indexers running at once
+from datetime import datetime, timedelta
+from mimi_lib.config import (
+    VAULT_PATH,
+    VAULT_INDEX_LOG,
+    VAULT_INDEXER_LOCK,
+    VAULT_INDEXER_RERUN,
+    EMBED_CONCURRENCY,
+)
+from mimi_lib.memory.embeddings import (
+    MAX_BATCH_INPUTS,
+    current_spec,
+    get_embedding,
+    get_embeddings,
+    migrate_memory_vectors,
+)
+from mimi_lib.memory.vault_store import (
+    compact_vault_index,
+    journal_delete,
+    journal_put,
+    journal_size,
+    load_vault_index,
+    replace_vault_index,
+)
+from mimi_lib.memory.vault_watcher import get_vault_watcher
+from mimi_lib.utils.docstore import file_lock, write_json
+from mimi_lib.utils.lease import FileLease
+
+# Global Lock to prevent multiple indexer threads running at once; across
+# processes (CLI, watcher, cron) the indexer holds a FileLease instead
 _INDEX_LOCK = threading.Lock()
 # Flag to indicate if an indexing run is currently active
 _IS_INDEXING = False
 # Flag to indicate if another run was requested while one was active
 _RERUN_REQUESTED = False
+# Once one full walk has succeeded, runs only visit the watcher's dirty paths
+_FULL_SCAN_DONE = False
+
+# Fold the journal into a new base snapshot once it grows past this
+COMPACT_JOURNAL_BYTES = 32 * 1024 * 1024
+# ...or once this share of the base rows belongs to deleted/replaced notes
+COMPACT_DEAD_FRACTION = 0.25
+# A lease holder that hasn't heartbeated for this long is considered wedged
+LEASE_STALE_SECONDS = 600
+# Files the scanner may run ahead of the chunker
+SCAN_QUEUE_SIZE = 256
+
+# Callbacks run (on the indexer thread) after each finished indexing run
+_INDEX_LISTENERS = []
 
-# --- PERFORMANCE CACHE ---
-_VECTOR_CACHE = None
-_VECTOR_CACHE_MTIME = 0
-_CACHE_LOCK = threading.Lock()
 
+def add_index_listener(callback):
+    """Registers callback() to run after the indexer finishes a run."""
+    _INDEX_LISTENERS.append(callback)
 
-def _load_vectors_cached():
-    """Thread-safe cached loading of vectors."""
-    global _VECTOR_CACHE, _VECTOR_CACHE_MTIME
 
-    if not VAULT_VECTORS_FILE.exists():
-        return {}
+def _notify_index_listeners(silent=True):
+    for callback in list(_INDEX_LISTENERS):
+        try:
+            callback()
+        except Exception as e:
+            if not silent:
+                print(f"Index listener failed: {e}")
 
-    current_mtime = VAULT_VECTORS_FILE.stat().st_mtime
 
-    with _CACHE_LOCK:
-        if _VECTOR_CACHE is not None and current_mtime == _VECTOR_CACHE_MTIME:
-            return _VECTOR_CACHE
+# --- Pipeline Plumbing ---
+_DONE = object()  # End-of-stream marker passed down the queues
 
+# Cancellation event of the running pass (None when idle)
+_CANCEL = None
+_PROGRESS_LOCK = threading.Lock()
+_PROGRESS = {}
+
+
+def _put(q, item, cancel):
+    """Blocking put that gives up once the run is cancelled."""
+    while not cancel.is_set():
         try:
-            vectors = json.loads(VAULT_VECTORS_FILE.read_text())
-            _VECTOR_CACHE = vectors
-            _VECTOR_CACHE_MTIME = current_mtime
-            return vectors
-        except:
-            return {}
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
 
+def _get(q, cancel):
+    """Blocking get; None once the run is cancelled."""
+    while not cancel.is_set():
+        try:
+            return q.get(timeout=0.2)
+        except queue.Empty:
+            continue
+    return None
 
-def _update_vector_cache(vectors):
-    """Directly update cache after indexing."""
-    global _VECTOR_CACHE, _VECTOR_CACHE_MTIME
-    with _CACHE_LOCK:
-        _VECTOR_CACHE = vectors
-        if VAULT_VECTORS_FILE.exists():
-            _VECTOR_CACHE_MTIME = VAULT_VECTORS_FILE.stat().st_mtime
+
+def _stage(target, cancel):
+    def run():
+        try:
+            target()
+        except Exception as e:
+            print(f"Indexer stage {target.__name__} crashed: {e}")
+            cancel.set()
+
+    t = threading.Thread(target=run, daemon=True, name=f"index-{target.__name__}")
+    t.start()
+    return t
+
+
+def _begin_run():
+    global _CANCEL
+    _CANCEL = threading.Event()
+    with _PROGRESS_LOCK:
+        _PROGRESS.clear()
+        _PROGRESS.update(
+            running=True,
+            started=time.monotonic(),
+            queued=0,
+            embedded=0,
+            written=0,
+            failed=0,
+        )
+    return _CANCEL
+
+
+def _end_run(cancelled=False):
+    global _CANCEL
+    _CANCEL = None
+    with _PROGRESS_LOCK:
+        _PROGRESS["running"] = False
+        _PROGRESS["cancelled"] = cancelled
+        _PROGRESS["finished"] = time.monotonic()
+
+
+def _progress(**counts):
+    with _PROGRESS_LOCK:
+        for key, n in counts.items():
+            _PROGRESS[key] = _PROGRESS.get(key, 0) + n
+
+
+def get_index_progress():
+    """
+    Snapshot of the current (or last) pass: files queued/written/failed,
+    chunks embedded, the embedding throughput in chunks/sec and whether
+    the pass was cancelled.
+    """
+    with _PROGRESS_LOCK:
+        progress = dict(_PROGRESS)
+    if progress:
+        end = progress.get("finished") or time.monotonic()
+        elapsed = max(end - progress["started"], 1e-6)
+        progress["chunks_per_sec"] = progress["embedded"] / elapsed
+    return progress
+
+
+def cancel_indexing():
+    """Stops the running pass after its in-flight commits; True if one ran."""
+    cancel = _CANCEL
+    if cancel is None:
+        return False
+    cancel.set()
+    return True
 
 
 def chunk_text(text, max_chars=1500):
@@ -70,6 +188,23 @@ def chunk_text(text, max_chars=1500):
     return chunks
 
 
+def chunk_hash(chunk):
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+
+def _known_chunk_vectors(old_entries, old_hashes):
+    """Maps chunk hash -> embedding for a file's currently indexed chunks."""
+    known = {}
+    for entry in old_entries or []:
+        idx = entry["chunk_index"]
+        if old_hashes and idx < len(old_hashes):
+            h = old_hashes[idx]
+        else:
+            h = chunk_hash(entry["text"])
+        known[h] = entry["embedding"]
+    return known
+
+
 def get_vault_files():
     """Recursively find all markdown files in the vault, excluding hidden dirs."""
     files = []
@@ -84,91 +219,447 @@ def get_vault_files():
     return files
 
 
-def _run_indexing_logic(force=False, silent=True):
-    """Internal function that performs the actual indexing logic (synchronous)."""
+_FRONTMATTER_RE = re.compile(r"\A---[ \t]*\n(.*?)\n---[ \t]*(?:\n|\Z)", re.S)
+_FRONTMATTER_KEY_RE = re.compile(r"^([^\s#:-][^:]*):(.*)$")
+# Obsidian inline tags: #tag or #nested/tag, but not headings or #123
+_INLINE_TAG_RE = re.compile(r"(?<![\w&/#])#([^\W\d][\w/-]*)")
+
+
+def _clean_tag(tag):
+    return tag.strip().strip("\"'").lstrip("#").lower()
+
+
+def note_metadata(content, mtime=None):
+    """
+    {"mtime", "tags", "keys"} for one note: its frontmatter keys, and tags
+    from both the frontmatter `tags:` field and inline #tags in the body.
+    """
+    keys, tags = [], set()
+    body = content
+    match = _FRONTMATTER_RE.match(content)
+    if match:
+        body = content[match.end() :]
+        current = None
+        for line in match.group(1).splitlines():
+            key = _FRONTMATTER_KEY_RE.match(line)
+            if key:
+                current = key.group(1).strip()
+                keys.append(current)
+                value = key.group(2)
+            elif line[:1].isspace() or line.startswith("-"):
+                value = line.strip().lstrip("-")
+            else:
+                continue
+            if current in ("tags", "tag"):
+                # tags: [a, b] / tags: a, b / a YAML list below the key
+                for tag in re.split(r"[,\s]+", value.strip().strip("[]")):
+                    if _clean_tag(tag):
+                        tags.add(_clean_tag(tag))
+    tags.update(t.lower().rstrip("/") for t in _INLINE_TAG_RE.findall(body))
+    return {"mtime": mtime, "tags": sorted(tags), "keys": keys}
+
+
+def contextual_text(rel_path, chunk):
+    # Filename context for retrieval
+    return f"File: {rel_path}\nContent: {chunk}"
+
+
+def _commit_batch(batch, vectors, index_log, spec):
+    """
+    Writer side of the pipeline: journals each file of an embedded batch,
+    reusing known vectors for unchanged chunks. A file with a chunk that
+    failed to embed is left out (and its log untouched) so the next run
+    retries it. Returns (committed paths, failed paths).
+    """
+    embeddings = iter(vectors)
+    committed, failed = [], []
+    for job in batch:
+        file_vectors = []
+        for i, (chunk, h) in enumerate(zip(job["chunks"], job["hashes"])):
+            embedding = job["known"].get(h)
+            if embedding is None:
+                embedding = next(embeddings)
+            if embedding is not None:
+                file_vectors.append(
+                    {"chunk_index": i, "text": chunk, "embedding": embedding}
+                )
+
+        if len(file_vectors) < len(job["chunks"]):
+            failed.append(job["rel_path"])
+            continue
+        log = {
+            "mtime": job["mtime"],
+            "indexed_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "chunks": job["hashes"],
+        }
+        journal_put(job["rel_path"], file_vectors, log, spec, job["note"])
+        index_log[job["rel_path"]] = log
+        committed.append(job["rel_path"])
+    return committed, failed
+
+
+def _load_index_log(index):
+    """Index log as of the last compaction, plus what the journal recorded since."""
     index_log = {}
     if VAULT_INDEX_LOG.exists():
         try:
             index_log = json.loads(VAULT_INDEX_LOG.read_text())
         except:
             pass
+    if index:
+        for path, log in index.journal_logs.items():
+            if log is None:
+                index_log.pop(path, None)
+            else:
+                index_log[path] = log
+    return index_log
 
-    # Load initial vectors (uncached here as we are modifying)
-    vectors = {}
-    if VAULT_VECTORS_FILE.exists():
-        try:
-            vectors = json.loads(VAULT_VECTORS_FILE.read_text())
-        except:
-            pass
-
-    files = get_vault_files()
-    updated_count = 0
 
-    for fpath in files:
-        rel_path = str(fpath.relative_to(VAULT_PATH))
-        mtime = fpath.stat().st_mtime
+def _compact(index_log, notes=None):
+    # Log first: it already includes the journal's entries, and replaying
+    # them over it is harmless if we die before the journal is folded
+    write_json(VAULT_INDEX_LOG, index_log)
+    compact_vault_index(notes)
 
-        # Skip if not changed
-        if (
-            not force
-            and rel_path in index_log
-            and index_log[rel_path]["mtime"] == mtime
-        ):
-            continue
 
+def _migrate_spec(index, index_log, silent=True):
+    """
+    Re-embeds an index built with a different model/dimensions than
+    configured. Until every chunk has a new vector the old index stays live
+    (and new files keep using its spec); already-embedded chunks come back
+    from the embedding cache when an interrupted migration is retried.
+    """
+    spec = current_spec()
+    if index is None or index.spec == spec:
+        return index
+
+    entries = index.to_entries()
+    if not silent:
+        print(f"Migrating vault index to {spec[0]} ({spec[1] or 'native'} dims)...")
+    texts = [
+        contextual_text(path, e["text"])
+        for path, chunks in entries.items()
+        for e in chunks
+    ]
+    vectors = iter(get_embeddings(texts, spec) if texts else [])
+    migrated = {}
+    for path, chunks in entries.items():
+        migrated[path] = [dict(e, embedding=next(vectors)) for e in chunks]
+    if any(e["embedding"] is None for chunks in migrated.values() for e in chunks):
         if not silent:
-            print(f"Indexing: {rel_path}")
+            print("Vault migration incomplete, keeping the old index for now.")
+        return index
+
+    # The journal goes away with the old index, so its index-log entries
+    # have to be persisted first (see _compact)
+    write_json(VAULT_INDEX_LOG, index_log)
+    replace_vault_index(migrated, spec, index.to_notes())
+    return load_vault_index()
+
+
+def _backfill_notes(index, index_log, silent=True):
+    """
+    Reads the metadata of notes indexed before it was recorded and folds it
+    in with one compaction, so scoped searches see the whole vault.
+    """
+    missing = index.paths_missing_notes() if index else []
+    notes = {}
+    for rel_path in missing:
+        fpath = VAULT_PATH / rel_path
         try:
             content = fpath.read_text(encoding="utf-8", errors="replace")
+            notes[rel_path] = note_metadata(content, fpath.stat().st_mtime)
+        except OSError:
+            continue  # Deleted; pruned by this run
+    if not notes:
+        return index
+    if not silent:
+        print(f"Backfilling metadata for {len(notes)} indexed notes...")
+    _compact(index_log, notes)
+    return load_vault_index()
+
+
+def _run_indexing_logic(force=False, silent=True, paths=None, lease=None):
+    """
+    Internal function that performs the actual indexing logic (synchronous).
+    `paths` limits the run to those vault-relative notes; None walks the vault.
+    With a `lease`, every commit first heartbeats it (LeaseLost aborts).
+    Returns (status message, paths to retry): notes that couldn't be read
+    or embedded, plus everything left unwritten when the pass is cancelled.
+    """
+    try:
+        migrate_memory_vectors()
+    except Exception as e:
+        if not silent:
+            print(f"Memory vector migration failed: {e}")
+
+    # Embeddings stay memmapped; each indexed file is appended to the journal
+    index = load_vault_index()
+    index_log = _load_index_log(index)
+    index = _migrate_spec(index, index_log, silent)
+    index = _backfill_notes(index, index_log, silent)
+    # New chunks must match whatever spec the live index is in
+    spec = index.spec if index else current_spec()
+
+    if paths is None:
+        files = get_vault_files()
+    else:
+        files = [VAULT_PATH / p for p in sorted(paths) if (VAULT_PATH / p).is_file()]
+    present = {str(f.relative_to(VAULT_PATH)) for f in files}
+    indexed = set(index_log) | set(index.indexed_paths() if index else [])
+    gone = indexed - present if paths is None else (set(paths) - present) & indexed
+
+    # Tombstone deleted (or renamed-away) notes, keeping their chunk vectors
+    # around so a renamed copy can reuse them instead of re-embedding
+    moved = {}
+    for rel_path in sorted(gone):
+        if index:
+            moved.update(
+                _known_chunk_vectors(
+                    index.entries_for(rel_path),
+                    index_log.get(rel_path, {}).get("chunks"),
+                )
+            )
+        journal_delete(rel_path)
+        index_log.pop(rel_path, None)
+        if not silent:
+            print(f"Pruned: {rel_path}")
+
+    # Scan -> chunk -> embed (EMBED_CONCURRENCY workers) -> write (this
+    # thread), joined by bounded queues so no stage runs far ahead
+    workers = max(1, EMBED_CONCURRENCY)
+    scan_q = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    batch_q = queue.Queue(maxsize=2 * workers)
+    write_q = queue.Queue(maxsize=2 * workers)
+    cancel = _begin_run()
+    unread = set()  # Only touched by the chunker thread until it's joined
+
+    def scanner():
+        for fpath in files:
+            rel_path = str(fpath.relative_to(VAULT_PATH))
+            try:
+                mtime = fpath.stat().st_mtime
+            except OSError:
+                continue  # Deleted since the walk; the watcher will tell us
+            # Skip if not changed
+            if (
+                not force
+                and rel_path in index_log
+                and index_log[rel_path]["mtime"] == mtime
+            ):
+                continue
+            if not _put(scan_q, (fpath, rel_path, mtime), cancel):
+                return
+        _put(scan_q, _DONE, cancel)
+
+    def chunker():
+        # Chunks from several files are collected and embedded together
+        batch, batch_chunks = [], 0
+        while True:
+            item = _get(scan_q, cancel)
+            if item is None:
+                return
+            if item is _DONE:
+                break
+            fpath, rel_path, mtime = item
+            try:
+                content = fpath.read_text(encoding="utf-8", errors="replace")
+            except Exception as e:
+                if not silent:
+                    print(f"Failed to index {rel_path}: {e}")
+                unread.add(rel_path)
+                continue
+            _progress(queued=1)
             if not content.strip():
-                # Update log for empty files to prevent re-indexing loop
-                index_log[rel_path] = {
-                    "mtime": mtime,
-                    "indexed_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                }
-                # Remove from vectors if it exists (file became empty)
-                if rel_path in vectors:
-                    del vectors[rel_path]
-                updated_count += 1
+                if not _put(write_q, ("empty", rel_path, mtime), cancel):
+                    return
                 continue
 
             chunks = chunk_text(content)
-            file_vectors = []
-
-            for i, chunk in enumerate(chunks):
-                # Add context (filename) to the chunk for better retrieval
-                contextual_chunk = f"File: {rel_path}\nContent: {chunk}"
-                embedding = get_embedding(contextual_chunk)
-                if embedding:
-                    file_vectors.append(
-                        {"chunk_index": i, "text": chunk, "embedding": embedding}
-                    )
-
-            if file_vectors:
-                vectors[rel_path] = file_vectors
+            hashes = [chunk_hash(c) for c in chunks]
+            # Only chunks with unseen content need embedding (e.g. the tail
+            # of an appended session file); forced runs re-embed everything
+            known = (
+                {}
+                if force or index is None
+                else ChainMap(
+                    _known_chunk_vectors(
+                        index.entries_for(rel_path),
+                        index_log.get(rel_path, {}).get("chunks"),
+                    ),
+                    moved,
+                )
+            )
+            batch.append(
+                {
+                    "rel_path": rel_path,
+                    "mtime": mtime,
+                    "note": note_metadata(content, mtime),
+                    "chunks": chunks,
+                    "hashes": hashes,
+                    "known": known,
+                }
+            )
+            batch_chunks += sum(1 for h in hashes if h not in known)
+            if batch_chunks >= MAX_BATCH_INPUTS:
+                if not _put(batch_q, batch, cancel):
+                    return
+                batch, batch_chunks = [], 0
+        if batch and not _put(batch_q, batch, cancel):
+            return
+        for _ in range(workers):
+            _put(batch_q, _DONE, cancel)
+        _put(write_q, _DONE, cancel)
+
+    def embedder():
+        while True:
+            batch = _get(batch_q, cancel)
+            if batch is None:
+                return
+            if batch is _DONE:
+                _put(write_q, _DONE, cancel)
+                return
+            texts = [
+                contextual_text(job["rel_path"], chunk)
+                for job in batch
+                for chunk, h in zip(job["chunks"], job["hashes"])
+                if h not in job["known"]
+            ]
+            try:
+                vectors = get_embeddings(texts, spec) if texts else []
+            except Exception as e:
+                if not silent:
+                    print(f"Failed to embed batch: {e}")
+                vectors = [None] * len(texts)
+            _progress(embedded=sum(1 for v in vectors if v is not None))
+            if not _put(write_q, ("put", batch, vectors), cancel):
+                return
+
+    threads = [_stage(scanner, cancel), _stage(chunker, cancel)]
+    threads += [_stage(embedder, cancel) for _ in range(workers)]
+
+    written, failed_paths = set(), set()
+    finished = 0  # DONE markers seen: one per embed worker plus the chunker
+    try:
+        while finished < workers + 1:
+            item = _get(write_q, cancel)
+            if item is None:
+                break  # Cancelled
+            if item is _DONE:
+                finished += 1
+                continue
+            if lease:
+                lease.heartbeat()
+            if item[0] == "empty":
+                _, rel_path, mtime = item
+                # Update log for empty files to prevent re-indexing loop, and
+                # drop its vectors if it exists (file became empty)
                 index_log[rel_path] = {
                     "mtime": mtime,
                     "indexed_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
                 }
-                updated_count += 1
-
-            # Periodically save progress every 5 files
-            if updated_count % 5 == 0:
-                VAULT_VECTORS_FILE.write_text(json.dumps(vectors))
-                VAULT_INDEX_LOG.write_text(json.dumps(index_log, indent=2))
-
-        except Exception as e:
+                journal_delete(rel_path, index_log[rel_path])
+                committed, failed = [rel_path], []
+            else:
+                committed, failed = _commit_batch(item[1], item[2], index_log, spec)
+            written.update(committed)
+            failed_paths.update(failed)
+            _progress(written=len(committed), failed=len(failed))
             if not silent:
-                print(f"Failed to index {rel_path}: {e}")
-
-    if updated_count > 0:
-        VAULT_VECTORS_FILE.write_text(json.dumps(vectors))
-        VAULT_INDEX_LOG.write_text(json.dumps(index_log, indent=2))
-
-        # UPDATE CACHE
-        _update_vector_cache(vectors)
-
-    return f"Indexed {updated_count} new/updated files. Total files in index: {len(index_log)}"
+                for rel_path in committed:
+                    print(f"Indexed: {rel_path}")
+    finally:
+        cancelled = cancel.is_set()
+        cancel.set()  # Unblocks any stage still waiting on a queue
+        for t in threads:
+            t.join(timeout=1)
+        _end_run(cancelled)
+
+    retry = failed_paths | unread
+    if cancelled:
+        # Whatever wasn't written may still be stale; unchanged notes are
+        # skipped again cheaply by their mtime
+        retry |= present - written
+        return f"Indexing cancelled after {len(written)} files.", retry
+
+    index = load_vault_index()
+    if journal_size() > COMPACT_JOURNAL_BYTES or (
+        index and index.dead_rows > COMPACT_DEAD_FRACTION * index.count
+    ):
+        if lease:
+            lease.heartbeat()
+        _compact(index_log)
+
+    return (
+        f"Indexed {len(written)} new/updated files, pruned {len(gone)}"
+        + (f", {len(retry)} failed (retried next run)" if retry else "")
+        + f". Total files in index: {len(index_log)}"
+    ), retry
+
+
+def _run_pass(force=False, silent=True, lease=None, extra=None):
+    """
+    One indexer pass: a full walk when needed, else just the dirty notes.
+    `extra` is a merged request handed over by other processes.
+    """
+    global _FULL_SCAN_DONE
+
+    watcher = get_vault_watcher()
+    dirty, full = watcher.drain() if watcher else (set(), True)
+    if extra:
+        dirty |= extra["paths"]
+        full = full or extra["full"]
+        force = force or extra["force"]
+    if force or full or not _FULL_SCAN_DONE:
+        _, retry = _run_indexing_logic(force, silent=silent, lease=lease)
+        # A cancelled walk didn't see the whole vault; the next pass walks
+        if not get_index_progress().get("cancelled"):
+            _FULL_SCAN_DONE = True
+    elif dirty:
+        try:
+            _, retry = _run_indexing_logic(silent=silent, paths=dirty, lease=lease)
+        except Exception:
+            if watcher:
+                watcher.mark_dirty(dirty)  # Retry them on the next trigger
+            raise
+    else:
+        return
+    if retry and watcher:
+        watcher.mark_dirty(retry)
+
+
+# --- Cross-process hand-off ---
+# A process that finds the lease taken appends its request (its dirty paths)
+# to the rerun file; the holder takes the file over before finishing. Both
+# sides hold the file's lock, so no request lands in a file being taken.
+
+
+def _request_rerun(force=False):
+    watcher = get_vault_watcher()
+    dirty, full = watcher.drain() if watcher else (set(), True)
+    request = {"paths": sorted(dirty), "full": full, "force": force}
+    with file_lock(VAULT_INDEXER_RERUN), open(VAULT_INDEXER_RERUN, "a") as f:
+        f.write(json.dumps(request) + "\n")
+
+
+def _take_rerun_requests():
+    """Merged pending requests from other processes, or None."""
+    with file_lock(VAULT_INDEXER_RERUN):
+        try:
+            lines = VAULT_INDEXER_RERUN.read_text().splitlines()
+        except FileNotFoundError:
+            return None
+        VAULT_INDEXER_RERUN.unlink()
+    merged = {"paths": set(), "full": False, "force": False}
+    for line in lines:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            continue  # Cut short by a requester that crashed mid-write
+        merged["paths"].update(request.get("paths", []))
+        merged["full"] |= bool(request.get("full"))
+        merged["force"] |= bool(request.get("force"))
+    return merged
 
 
 def _indexer_worker(force=False, silent=True):
@@ -177,7 +668,25 @@ def _indexer_worker(force=False, silent=True):
 
     while True:
         try:
-            _run_indexing_logic(force, silent=silent)
+            lease = FileLease.acquire(VAULT_INDEXER_LOCK, LEASE_STALE_SECONDS)
+            if lease is None:
+                # Another process is indexing; it picks our changes up
+                _request_rerun(force)
+                if not silent:
+                    print("Vault indexer busy in another process, rerun requested.")
+            else:
+                try:
+                    _run_pass(force, silent=silent, lease=lease)
+                    extra = _take_rerun_requests()
+                    while extra is not None:
+                        _run_pass(silent=silent, lease=lease, extra=extra)
+                        extra = _take_rerun_requests()
+                finally:
+                    lease.release()
+                # A request may have landed between the last check and release
+                if VAULT_INDEXER_RERUN.exists():
+                    continue
+                _notify_index_listeners(silent)
         except Exception as e:
             if not silent:
                 print(f"Indexer crashed: {e}")
@@ -224,41 +733,74 @@ def index_vault(force=False):
     return trigger_background_index(force)
 
 
-def search_vault(query, top_k=5):
-    """Semantic search across the vault vectors with attribution and caching."""
-    query_vector = get_embedding(query)
-    if not query_vector:
+def _to_epoch(value, end_of_day=False):
+    """Epoch seconds from a number or an ISO date/datetime string."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    moment = datetime.fromisoformat(str(value))
+    if end_of_day and len(str(value)) <= 10:
+        # A bare date as upper bound includes that whole day
+        moment += timedelta(days=1)
+    return moment.timestamp()
+
+
+def search_vault(
+    query,
+    top_k=5,
+    query_vector=None,
+    threshold=0.4,
+    path_prefix=None,
+    tags=None,
+    since=None,
+    until=None,
+    keys=None,
+):
+    """
+    Semantic search across the memmapped vault index with attribution.
+    A precomputed `query_vector` must be in the index's spec (`index.spec`).
+
+    Optional scope, applied before any scoring: `path_prefix` (a folder such
+    as "Mimi/Sessions"), `tags` (all required; nested tags count),
+    `since`/`until` (note mtime; dates or epoch seconds, both inclusive) and
+    `keys` (frontmatter keys the note must define).
+    """
+    scope = {
+        "path_prefix": path_prefix,
+        "tags": [_clean_tag(t) for t in tags or [] if _clean_tag(t)],
+        "keys": list(keys or []),
+        "after": _to_epoch(since),
+        "before": _to_epoch(until, end_of_day=True),
+    }
+    index = load_vault_index()
+    if not index:
         return []
 
-    # Use Cache
-    vectors = _load_vectors_cached()
-    if not vectors:
+    if query_vector is None:
+        query_vector = get_embedding(query, index.spec)
+    if not query_vector:
         return []
 
     results = []
-    for rel_path, chunks in vectors.items():
-        for chunk_data in chunks:
-            sim = cosine_similarity(query_vector, chunk_data["embedding"])
-            if sim > 0.4:  # Similarity threshold
-                text = chunk_data["text"]
-
-                # --- ATTRIBUTION LOGIC ---
-                is_mimi = False
-                if "Mimi/Sessions" in rel_path:
-                    is_mimi = True
-                elif "mimi_signed: true" in text or "Signed by Mimi" in text:
-                    is_mimi = True
-                elif "_Signed by Mimi" in text:
-                    is_mimi = True
-
-                if is_mimi:
-                    attributed_text = f"[AUTHOR: Mimi (Auto-Memory)]\n{text}"
-                else:
-                    attributed_text = f"[AUTHOR: Kuumin]\n{text}"
-
-                results.append(
-                    {"score": sim, "path": rel_path, "text": attributed_text}
-                )
+    hits = index.search_chunks(query_vector, top_k, threshold, scope)
+    for hit in hits:
+        rel_path, text, sim = hit["path"], hit["text"], hit["score"]
+
+        # --- ATTRIBUTION LOGIC ---
+        is_mimi = False
+        if "Mimi/Sessions" in rel_path:
+            is_mimi = True
+        elif "mimi_signed: true" in text or "Signed by Mimi" in text:
+            is_mimi = True
+        elif "_Signed by Mimi" in text:
+            is_mimi = True
+
+        if is_mimi:
+            attributed_text = f"[AUTHOR: Mimi (Auto-Memory)]\n{text}"
+        else:
+            attributed_text = f"[AUTHOR: Kuumin]\n{text}"
+
+        results.append({"score": sim, "path": rel_path, "text": attributed_text})
 
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:top_k]
+    return results
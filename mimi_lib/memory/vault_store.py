@@ -0,0 +1,874 @@
+"""
+Binary on-disk vault index.
+
+Layout inside VAULT_INDEX_DIR (one generation is live at a time):
+    header.json          -> {"version", "generation", "dim", "count", "paths",
+                             "model", "dimensions", "note_tags", "note_keys"}
+    embeddings.<gen>.npy -> float32 (count, dim), rows pre-normalized
+    chunks.<gen>.npy     -> per-row (path id, chunk index, text offset, text length)
+    text.<gen>.bin       -> UTF-8 chunk texts, back to back
+    ivf.<gen>.npz        -> optional IVF coarse quantizer (large indexes only)
+    codes.<gen>.npy      -> optional uint8 codes (count, dim) for first-pass scoring
+    quant.<gen>.npz      -> per-dimension scale/offset for those codes
+    notes.<gen>.npz      -> per-path metadata columns: mtime, plus tags and
+                            frontmatter keys as CSR lists into the header's
+                            note_tags / note_keys vocabularies
+    journal.log          -> append-only upserts/tombstones on top of the base
+
+Readers open the arrays with mmap, so the CLI, the watcher and the diary
+cron all share the same page-cached copy instead of parsing JSON. The
+indexer appends one journal record per file it (re)indexes and only folds
+the journal into a new base generation during compaction.
+
+Every vector in an index comes from one embedding spec (model, requested
+dimensions). Headers written before the spec was recorded are assumed to
+hold full-size vectors from the original model.
+
+Note metadata ({"mtime", "tags", "keys"} per path) is what scoped searches
+filter on. A chunk's folder is its path, so path-prefix filters need no
+column of their own. Paths without metadata (generations written before
+it existed) never match a tag, key or date filter until the indexer
+backfills them.
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from mimi_lib.config import (
+    VAULT_INDEX_DIR,
+    VAULT_VECTORS_FILE,
+    VAULT_ANN_MIN_CHUNKS,
+    VAULT_ANN_NPROBE,
+    VAULT_ANN_RERANK,
+    VAULT_INT8,
+    VAULT_INT8_RERANK,
+    VAULT_SEARCH_WORKERS,
+    VAULT_SHARD_ROWS,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+)
+from mimi_lib.memory.ann import IVFIndex
+from mimi_lib.memory.quantize import approx_scores, encode, fit_quantizer
+from mimi_lib.memory.vector_store import LEGACY_SPEC, normalize_rows, top_k_indices
+
+FORMAT_VERSION = 1
+HEADER_FILE = VAULT_INDEX_DIR / "header.json"
+JOURNAL_FILE = VAULT_INDEX_DIR / "journal.log"
+
+CHUNK_DTYPE = np.dtype(
+    [("path", "<i4"), ("chunk", "<i4"), ("offset", "<i8"), ("length", "<i4")]
+)
+
+# Journal record: magic, meta length, payload length | meta JSON | float32 payload | crc32
+JOURNAL_MAGIC = b"MVJ1"
+RECORD_HEAD = struct.Struct("<4sII")
+RECORD_CRC = struct.Struct("<I")
+
+
+def _gen_file(stem: str, generation: int, ext: str):
+    return VAULT_INDEX_DIR / f"{stem}.{generation}.{ext}"
+
+
+def _under(path: str, prefix: str) -> bool:
+    prefix = prefix.strip("/")
+    return not prefix or path == prefix or path.startswith(prefix + "/")
+
+
+def _tag_matches(tag: str, wanted: str) -> bool:
+    # Obsidian nested tags: #course also matches #course/math
+    return tag == wanted or tag.startswith(wanted + "/")
+
+
+def _note_matches(path: str, note: Optional[Dict], scope: Dict) -> bool:
+    """Python-side filter for journaled paths (see VaultIndex.filter_rows)."""
+    if scope.get("path_prefix") and not _under(path, scope["path_prefix"]):
+        return False
+    if not (scope.get("tags") or scope.get("keys") or _has_dates(scope)):
+        return True
+    if not note:
+        return False
+    mtime = note.get("mtime")
+    if scope.get("after") is not None and not (mtime and mtime >= scope["after"]):
+        return False
+    if scope.get("before") is not None and not (mtime and mtime < scope["before"]):
+        return False
+    tags = note.get("tags", [])
+    for wanted in scope.get("tags") or []:
+        if not any(_tag_matches(t, wanted) for t in tags):
+            return False
+    return all(k in note.get("keys", []) for k in scope.get("keys") or [])
+
+
+def _has_dates(scope: Dict) -> bool:
+    return scope.get("after") is not None or scope.get("before") is not None
+
+
+def _csr_owners(ptr: np.ndarray, ids: np.ndarray, wanted, n: int) -> np.ndarray:
+    """Bool mask of the paths whose list in (ptr, ids) contains any `wanted`."""
+    hit = np.zeros(n, dtype=bool)
+    pos = np.flatnonzero(np.isin(ids, list(wanted)))
+    hit[np.searchsorted(ptr, pos, side="right") - 1] = True
+    return hit
+
+
+def _note_columns(paths: List[str], notes: Dict[str, Optional[Dict]]):
+    """({column: array}, tag vocabulary, key vocabulary) for notes.<gen>.npz."""
+    tag_vocab: Dict[str, int] = {}
+    key_vocab: Dict[str, int] = {}
+    mtime = np.full(len(paths), np.nan)
+    tag_ptr, tag_ids, key_ptr, key_ids = [0], [], [0], []
+    for i, path in enumerate(paths):
+        note = notes.get(path)
+        if note:
+            if note.get("mtime") is not None:
+                mtime[i] = note["mtime"]
+            for tag in note.get("tags", []):
+                tag_ids.append(tag_vocab.setdefault(tag, len(tag_vocab)))
+            for key in note.get("keys", []):
+                key_ids.append(key_vocab.setdefault(key, len(key_vocab)))
+        tag_ptr.append(len(tag_ids))
+        key_ptr.append(len(key_ids))
+    columns = {
+        "mtime": mtime,
+        "tag_ptr": np.array(tag_ptr, dtype=np.int64),
+        "tag_ids": np.array(tag_ids, dtype=np.int32),
+        "key_ptr": np.array(key_ptr, dtype=np.int64),
+        "key_ids": np.array(key_ids, dtype=np.int32),
+    }
+    return columns, list(tag_vocab), list(key_vocab)
+
+
+_SHARD_POOL: Optional[Tuple[int, ThreadPoolExecutor]] = None  # (workers, pool)
+_SHARD_POOL_LOCK = threading.Lock()
+
+
+def _shard_map(n: int, score):
+    """
+    Runs score(lo, hi) over consecutive row ranges of VAULT_SHARD_ROWS and
+    returns the results in order. Shards run in parallel when there is more
+    than one of them and more than one worker.
+    """
+    global _SHARD_POOL
+    bounds = [
+        (lo, min(lo + VAULT_SHARD_ROWS, n)) for lo in range(0, n, VAULT_SHARD_ROWS)
+    ]
+    if len(bounds) < 2 or VAULT_SEARCH_WORKERS < 2:
+        return [score(lo, hi) for lo, hi in bounds]
+    with _SHARD_POOL_LOCK:
+        if _SHARD_POOL is None or _SHARD_POOL[0] != VAULT_SEARCH_WORKERS:
+            _SHARD_POOL = (
+                VAULT_SEARCH_WORKERS,
+                ThreadPoolExecutor(
+                    max_workers=VAULT_SEARCH_WORKERS, thread_name_prefix="vault-shard"
+                ),
+            )
+        pool = _SHARD_POOL[1]
+    return list(pool.map(lambda b: score(*b), bounds))
+
+
+def _header_spec(header: Dict):
+    if "model" not in header:
+        return LEGACY_SPEC
+    return (header["model"], header.get("dimensions"))
+
+
+class VaultIndex:
+    """
+    Read-only view over one base generation plus the journal applied on top.
+
+    Row numbers below `count` address the memmapped base; higher rows
+    address chunks that so far only exist in the journal.
+    """
+
+    def __init__(self, header: Dict):
+        self.header = header
+        self.generation = header["generation"]
+        self.dim = header["dim"]
+        self.count = header["count"]
+        self.paths: List[str] = header["paths"]
+        self.spec = _header_spec(header)
+        self._path_ids = {p: i for i, p in enumerate(self.paths)}
+        self._rows_by_path = None
+
+        if self.count:
+            self.embeddings = np.load(
+                _gen_file("embeddings", self.generation, "npy"), mmap_mode="r"
+            )
+            self.chunks = np.load(
+                _gen_file("chunks", self.generation, "npy"), mmap_mode="r"
+            )
+            text_path = _gen_file("text", self.generation, "bin")
+            self.text = (
+                np.memmap(text_path, dtype=np.uint8, mode="r")
+                if text_path.stat().st_size
+                else np.zeros(0, dtype=np.uint8)
+            )
+        else:
+            self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+            self.chunks = np.zeros(0, dtype=CHUNK_DTYPE)
+            self.text = np.zeros(0, dtype=np.uint8)
+
+        self.ivf = (
+            IVFIndex.load(_gen_file("ivf", self.generation, "npz"))
+            if self.count >= VAULT_ANN_MIN_CHUNKS
+            else None
+        )
+        self.codes, self.quant = None, None
+        quant_path = _gen_file("quant", self.generation, "npz")
+        if self.count and quant_path.exists():
+            with np.load(quant_path) as q:
+                self.quant = (q["scale"], q["offset"])
+            self.codes = np.load(
+                _gen_file("codes", self.generation, "npy"), mmap_mode="r"
+            )
+
+        # Per-path metadata columns of the base (None: written before notes)
+        self.notes = None
+        self.note_tags: List[str] = header.get("note_tags", [])
+        self.note_keys: List[str] = header.get("note_keys", [])
+        notes_path = _gen_file("notes", self.generation, "npz")
+        if "note_tags" in header and notes_path.exists():
+            with np.load(notes_path) as n:
+                self.notes = {k: n[k] for k in n.files}
+
+        # Journal state: path -> entries (upsert) or None (tombstone)
+        self.overlay: Dict[str, Optional[List[Dict]]] = {}
+        self.overlay_notes: Dict[str, Optional[Dict]] = {}
+        # Index-log entries carried by journal records (None = forget the path)
+        self.journal_logs: Dict[str, Optional[Dict]] = {}
+        self.journal_offset = 0
+        # (live base mask or None, extra embeddings, extra [(path, chunk, text)])
+        self._view = (None, np.zeros((0, self.dim), dtype=np.float32), [])
+
+    # --- Journal Overlay ---
+
+    def apply_journal(self, records, offset: int):
+        for meta, payload in records:
+            path = meta["path"]
+            if meta["op"] == "del":
+                self.journal_logs[path] = meta.get("log")
+                self.overlay[path] = None
+                self.overlay_notes.pop(path, None)
+                continue
+
+            dim = meta["dim"]
+            spec = (meta.get("model", LEGACY_SPEC[0]), meta.get("dimensions"))
+            if not self.count and not self._has_vectors():
+                # Nothing to be compatible with yet; the first file sets the spec
+                self.spec = spec
+            elif (self.dim and dim != self.dim) or spec != self.spec:
+                continue  # Incompatible vectors never enter the index
+            self.dim = dim
+            self.journal_logs[path] = meta.get("log")
+            self.overlay_notes[path] = meta.get("note")
+            matrix = np.frombuffer(payload, dtype=np.float32).reshape(-1, dim)
+            self.overlay[path] = [
+                {"chunk_index": c, "text": t, "embedding": matrix[i]}
+                for i, (c, t) in enumerate(zip(meta["chunks"], meta["texts"]))
+            ]
+        self.journal_offset = offset
+        self._rebuild_view()
+
+    def _has_vectors(self) -> bool:
+        return any(self.overlay.values())
+
+    def _rebuild_view(self):
+        masked = [self._path_ids[p] for p in self.overlay if p in self._path_ids]
+        live = ~np.isin(self.chunks["path"], masked) if masked else None
+
+        meta, vecs = [], []
+        for path, entries in self.overlay.items():
+            for e in entries or []:
+                meta.append((path, e["chunk_index"], e["text"]))
+                vecs.append(e["embedding"])
+        extra = (
+            normalize_rows(np.vstack(vecs)).astype(np.float32)
+            if vecs
+            else np.zeros((0, self.dim), dtype=np.float32)
+        )
+        # Swap in one assignment so concurrent searches see a consistent view
+        self._view = (live, extra, meta)
+
+    # --- Row Access ---
+
+    @property
+    def size(self) -> int:
+        return self.count + len(self._view[2])
+
+    @property
+    def dead_rows(self) -> int:
+        """Base rows hidden by the journal (deleted or re-indexed notes)."""
+        live = self._view[0]
+        return 0 if live is None else int(self.count - np.count_nonzero(live))
+
+    def path_of(self, row: int, view=None) -> str:
+        if row >= self.count:
+            return (view or self._view)[2][row - self.count][0]
+        return self.paths[int(self.chunks[row]["path"])]
+
+    def text_of(self, row: int, view=None) -> str:
+        if row >= self.count:
+            return (view or self._view)[2][row - self.count][2]
+        rec = self.chunks[row]
+        start = int(rec["offset"])
+        return bytes(self.text[start : start + int(rec["length"])]).decode(
+            "utf-8", errors="replace"
+        )
+
+    def _base_rows(self, path: str) -> np.ndarray:
+        pid = self._path_ids.get(path)
+        if pid is None or not self.count:
+            return np.empty(0, dtype=np.int64)
+        if self._rows_by_path is None:
+            ids = np.asarray(self.chunks["path"])
+            order = np.argsort(ids, kind="stable")
+            self._rows_by_path = (ids[order], order)
+        sorted_ids, order = self._rows_by_path
+        lo, hi = np.searchsorted(sorted_ids, [pid, pid + 1])
+        return order[lo:hi]
+
+    def entries_for(self, path: str) -> List[Dict]:
+        """Current [{chunk_index, text, embedding}] for one file."""
+        if path in self.overlay:
+            return list(self.overlay[path] or [])
+        return [
+            {
+                "chunk_index": int(self.chunks[row]["chunk"]),
+                "text": self.text_of(row),
+                "embedding": self.embeddings[row],
+            }
+            for row in self._base_rows(path)
+        ]
+
+    def indexed_paths(self) -> List[str]:
+        base = [p for p in self.paths if p not in self.overlay]
+        return base + [p for p, entries in self.overlay.items() if entries]
+
+    def to_entries(self) -> Dict[str, List[Dict]]:
+        """Materializes {path: [{chunk_index, text, embedding}]} for rewriting."""
+        return {p: self.entries_for(p) for p in self.indexed_paths()}
+
+    # --- Note Metadata ---
+
+    def note_for(self, path: str) -> Optional[Dict]:
+        """{"mtime", "tags", "keys"} of one indexed path, None if unknown."""
+        if path in self.overlay:
+            return self.overlay_notes.get(path)
+        pid = self._path_ids.get(path)
+        if pid is None or self.notes is None or np.isnan(self.notes["mtime"][pid]):
+            return None
+        n = self.notes
+        tags = n["tag_ids"][n["tag_ptr"][pid] : n["tag_ptr"][pid + 1]]
+        keys = n["key_ids"][n["key_ptr"][pid] : n["key_ptr"][pid + 1]]
+        return {
+            "mtime": float(n["mtime"][pid]),
+            "tags": [self.note_tags[i] for i in tags],
+            "keys": [self.note_keys[i] for i in keys],
+        }
+
+    def to_notes(self) -> Dict[str, Optional[Dict]]:
+        return {p: self.note_for(p) for p in self.indexed_paths()}
+
+    def paths_missing_notes(self) -> List[str]:
+        """Indexed paths without metadata (to be backfilled by the indexer)."""
+        if self.notes is None:
+            base = [p for p in self.paths if p not in self.overlay]
+        else:
+            unknown = np.flatnonzero(np.isnan(self.notes["mtime"]))
+            base = [self.paths[i] for i in unknown if self.paths[i] not in self.overlay]
+        return base + [
+            p
+            for p, entries in self.overlay.items()
+            if entries and not self.overlay_notes.get(p)
+        ]
+
+    def _base_path_mask(self, scope: Dict) -> np.ndarray:
+        """Vectorized _note_matches over the base's path columns."""
+        n = len(self.paths)
+        ok = np.ones(n, dtype=bool)
+        if scope.get("path_prefix"):
+            prefix = scope["path_prefix"]
+            ok &= np.fromiter((_under(p, prefix) for p in self.paths), bool, n)
+        if not (scope.get("tags") or scope.get("keys") or _has_dates(scope)):
+            return ok
+        if self.notes is None:
+            return np.zeros(n, dtype=bool)
+        with np.errstate(invalid="ignore"):  # NaN (unknown) mtimes never match
+            if scope.get("after") is not None:
+                ok &= self.notes["mtime"] >= scope["after"]
+            if scope.get("before") is not None:
+                ok &= self.notes["mtime"] < scope["before"]
+        for wanted in scope.get("tags") or []:
+            ids = [i for i, t in enumerate(self.note_tags) if _tag_matches(t, wanted)]
+            ok &= _csr_owners(self.notes["tag_ptr"], self.notes["tag_ids"], ids, n)
+        for wanted in scope.get("keys") or []:
+            ids = [i for i, k in enumerate(self.note_keys) if k == wanted]
+            ok &= _csr_owners(self.notes["key_ptr"], self.notes["key_ids"], ids, n)
+        return ok
+
+    def filter_rows(self, scope: Dict, view=None):
+        """
+        (base row mask, journal row mask) for a scope of {path_prefix, tags,
+        keys, after, before}; tags/keys must all be present, dates are
+        epoch seconds compared against the note's mtime. Only those rows
+        get scored. Returns None when the scope filters nothing.
+        """
+        if all(v is None or v == "" or v == [] for v in scope.values()):
+            return None
+        live, _, meta = view or self._view
+        base = None
+        if self.count:
+            path_ok = self._base_path_mask(scope)
+            base = path_ok[np.asarray(self.chunks["path"])]
+            if live is not None:
+                base &= live
+        matches = {
+            p: _note_matches(p, self.overlay_notes.get(p), scope) for p in self.overlay
+        }
+        extra = np.fromiter((matches[m[0]] for m in meta), bool, len(meta))
+        return base, extra
+
+    # --- Query ---
+
+    def search(
+        self,
+        query_vector,
+        top_k: int = 5,
+        threshold: float = 0.0,
+        view=None,
+        exact: bool = False,
+        allowed=None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Returns [(row, cosine)] for the best rows. Small indexes are scanned
+        exhaustively straight off the memmap; large ones go through the IVF
+        quantizer. With 8-bit codes present, candidates are first scored on
+        the codes and only the best few are rescored in full precision.
+        exact=True bypasses both approximations. `allowed` is a mask pair
+        from filter_rows(); rows outside it are never scored.
+        """
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        live, extra, meta = view or self._view
+        if not (self.count + len(meta)) or norm == 0 or q.size != self.dim:
+            return []
+        q = q / norm
+
+        base_allowed, extra_allowed = allowed or (None, None)
+        if self.count:
+            rows, scores = self._score_base(q, top_k, live, exact, base_allowed)
+        else:
+            rows, scores = np.zeros(0, np.int64), np.zeros(0, np.float32)
+
+        if len(extra):
+            extra_rows = (
+                np.arange(len(extra))
+                if extra_allowed is None
+                else np.flatnonzero(extra_allowed)
+            )
+            rows = np.concatenate([rows, self.count + extra_rows])
+            scores = np.concatenate([scores, extra[extra_rows] @ q])
+
+        best = top_k_indices(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best if scores[i] > threshold]
+
+    def _score_base(self, q, top_k, live, exact, allowed=None):
+        """(rows, exact cosine) for the base rows worth considering."""
+        rows = None  # None = every base row
+        if allowed is not None:
+            # The mask already excludes dead rows
+            rows, live = np.flatnonzero(allowed), None
+            # A scope this narrow is cheaper to score exactly than to probe
+            exact = exact or len(rows) <= VAULT_ANN_RERANK
+        if self.ivf is not None and not exact:
+            candidates = self.ivf.candidates(q, VAULT_ANN_NPROBE, VAULT_ANN_RERANK)
+            rows = (
+                np.sort(candidates)
+                if rows is None
+                else np.intersect1d(rows, candidates, assume_unique=True)
+            )
+
+        if self.codes is not None and not exact:
+            n = self.count if rows is None else len(rows)
+            approx = np.concatenate(
+                _shard_map(
+                    n,
+                    lambda lo, hi: (
+                        approx_scores(self.codes[lo:hi], *self.quant, q)
+                        if rows is None
+                        else approx_scores(self.codes, *self.quant, q, rows[lo:hi])
+                    ),
+                )
+            )
+            if live is not None:
+                approx[~live[rows if rows is not None else slice(None)]] = -np.inf
+            keep = top_k_indices(approx, max(VAULT_INT8_RERANK, top_k))
+            rows = np.sort(keep if rows is None else rows[keep])
+
+        # Each shard keeps only its own top_k; search() merges them
+        n = self.count if rows is None else len(rows)
+        parts = _shard_map(
+            n, lambda lo, hi: self._score_shard(q, top_k, rows, live, lo, hi)
+        )
+        if not parts:
+            return np.zeros(0, np.int64), np.zeros(0, np.float32)
+        return (
+            np.concatenate([p[0] for p in parts]),
+            np.concatenate([p[1] for p in parts]),
+        )
+
+    def _score_shard(self, q, top_k, rows, live, lo, hi):
+        if rows is None:
+            ids = np.arange(lo, hi)
+            block = self.embeddings[lo:hi]
+        else:
+            # Fancy-indexing the memmap only pages in the candidate rows
+            ids = rows[lo:hi]
+            block = self.embeddings[ids]
+        scores = np.asarray(block, dtype=np.float32) @ q
+        if live is not None:
+            scores = np.where(live[ids], scores, -np.inf)
+        best = top_k_indices(scores, top_k)
+        return ids[best], scores[best]
+
+    def search_chunks(
+        self, query_vector, top_k: int = 5, threshold: float = 0.0, scope=None
+    ) -> List[Dict]:
+        """
+        Like search(), but resolved to {path, text, score} against one view.
+        `scope` restricts the candidates first (see filter_rows).
+        """
+        view = self._view
+        allowed = self.filter_rows(scope, view) if scope else None
+        hits = self.search(query_vector, top_k, threshold, view, allowed=allowed)
+        return [
+            {
+                "path": self.path_of(row, view),
+                "text": self.text_of(row, view),
+                "score": score,
+            }
+            for row, score in hits
+        ]
+
+
+# --- Journal ---
+
+
+def _read_journal(offset: int = 0):
+    """
+    Parses complete records from `offset`. A torn or corrupt tail (e.g. the
+    indexer was killed mid-write) ends the scan. Returns (records, end offset).
+    """
+    try:
+        with open(JOURNAL_FILE, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+
+    records, pos = [], 0
+    while pos + RECORD_HEAD.size <= len(data):
+        magic, meta_len, payload_len = RECORD_HEAD.unpack_from(data, pos)
+        body_start = pos + RECORD_HEAD.size
+        end = body_start + meta_len + payload_len + RECORD_CRC.size
+        if magic != JOURNAL_MAGIC or end > len(data):
+            break
+        body = data[body_start : end - RECORD_CRC.size]
+        if zlib.crc32(body) != RECORD_CRC.unpack_from(data, end - RECORD_CRC.size)[0]:
+            break
+        meta = json.loads(body[:meta_len].decode("utf-8"))
+        records.append((meta, body[meta_len:]))
+        pos = end
+    return records, offset + pos
+
+
+# (inode, offset) at the end of our last append, to skip re-validating the tail
+_JOURNAL_END = None
+
+
+def _append_record(meta: Dict, payload: bytes = b""):
+    global _JOURNAL_END
+    VAULT_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    encoded = json.dumps(meta).encode("utf-8")
+    body = encoded + payload
+    record = (
+        RECORD_HEAD.pack(JOURNAL_MAGIC, len(encoded), len(payload))
+        + body
+        + RECORD_CRC.pack(zlib.crc32(body))
+    )
+    with open(JOURNAL_FILE, "r+b" if JOURNAL_FILE.exists() else "wb") as f:
+        st = os.fstat(f.fileno())
+        if _JOURNAL_END == (st.st_ino, st.st_size):
+            valid = st.st_size
+        else:
+            # Drop a torn tail left by a crash before appending after it
+            _, valid = _read_journal(0)
+            f.truncate(valid)
+        f.seek(valid)
+        f.write(record)
+        _JOURNAL_END = (st.st_ino, valid + len(record))
+
+
+def journal_put(
+    path: str,
+    entries: List[Dict],
+    log: Optional[Dict] = None,
+    spec=None,
+    note: Optional[Dict] = None,
+):
+    """
+    Records the full, current chunk list of one file, along with its note
+    metadata. `spec` is the (model, dimensions) the vectors were embedded
+    with; replay drops records whose spec differs from the index's.
+    """
+    matrix = np.asarray([e["embedding"] for e in entries], dtype=np.float32)
+    model, dimensions = spec or (EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    meta = {
+        "op": "put",
+        "path": path,
+        "model": model,
+        "dimensions": dimensions,
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "chunks": [int(e["chunk_index"]) for e in entries],
+        "texts": [e["text"] for e in entries],
+        "log": log,
+        "note": note,
+    }
+    _append_record(meta, matrix.tobytes())
+
+
+def journal_delete(path: str, log: Optional[Dict] = None):
+    """Tombstones a file; `log` keeps its index-log entry (e.g. empty notes)."""
+    _append_record({"op": "del", "path": path, "log": log})
+
+
+def journal_size() -> int:
+    try:
+        return JOURNAL_FILE.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _reset_journal():
+    tmp = JOURNAL_FILE.with_suffix(".tmp")
+    tmp.write_bytes(b"")
+    os.replace(tmp, JOURNAL_FILE)
+
+
+# --- Reader Cache (one mapped generation per process) ---
+_INDEX_CACHE: Optional[VaultIndex] = None
+_INDEX_CACHE_MTIME = 0
+_CACHE_LOCK = threading.Lock()
+
+
+def _read_header() -> Optional[Dict]:
+    try:
+        header = json.loads(HEADER_FILE.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if header.get("version") != FORMAT_VERSION:
+        return None
+    return header
+
+
+def _empty_header() -> Dict:
+    return {
+        "version": FORMAT_VERSION,
+        "generation": 0,
+        "dim": 0,
+        "count": 0,
+        "paths": [],
+        "model": EMBEDDING_MODEL,
+        "dimensions": EMBEDDING_DIMENSIONS,
+    }
+
+
+def load_vault_index() -> Optional[VaultIndex]:
+    """
+    Returns base + journal. The base is remapped only when header.json
+    changes; journal growth is applied incrementally from the last offset.
+    """
+    global _INDEX_CACHE, _INDEX_CACHE_MTIME
+
+    if not HEADER_FILE.exists() and VAULT_VECTORS_FILE.exists():
+        migrate_legacy_json()
+    if not HEADER_FILE.exists() and not JOURNAL_FILE.exists():
+        return None
+
+    try:
+        current_mtime = HEADER_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        current_mtime = 0
+    size = journal_size()
+
+    with _CACHE_LOCK:
+        index = _INDEX_CACHE
+        if (
+            index is None
+            or current_mtime != _INDEX_CACHE_MTIME
+            or size < index.journal_offset
+        ):
+            header = _read_header() if current_mtime else _empty_header()
+            if header is None:
+                return None
+            try:
+                index = VaultIndex(header)
+            except (FileNotFoundError, ValueError):
+                # Generation swapped underneath us; next call picks up the new one
+                return _INDEX_CACHE
+            _INDEX_CACHE_MTIME = current_mtime
+
+        if size > index.journal_offset or index is not _INDEX_CACHE:
+            records, offset = _read_journal(index.journal_offset)
+            if records or index is not _INDEX_CACHE:
+                index.apply_journal(records, offset)
+        _INDEX_CACHE = index
+        return index
+
+
+def index_version() -> int:
+    """
+    Identifies the live base generation: header.json is only rewritten when
+    a new one is written. Journal appends (e.g. the session note being
+    re-indexed on every autosave) don't change it, so caches keyed on this
+    are refreshed once per compaction, not once per edit.
+    """
+    try:
+        return HEADER_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def load_vault_entries() -> Dict[str, List[Dict]]:
+    index = load_vault_index()
+    return index.to_entries() if index else {}
+
+
+def write_vault_index(
+    entries: Dict[str, List[Dict]], spec=None, notes: Optional[Dict] = None
+) -> int:
+    """
+    Writes a new base generation from {path: [{chunk_index, text, embedding}]}.
+    The header is replaced last, so readers never see a half-written index.
+    `spec` defaults to the spec of the generation being replaced; `notes`
+    ({path: {"mtime", "tags", "keys"}}) becomes the metadata columns.
+    """
+    VAULT_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    old = _read_header()
+    generation = (old["generation"] + 1) if old else 1
+    if spec is None:
+        spec = _header_spec(old) if old else LEGACY_SPEC
+
+    paths = sorted(p for p, chunks in entries.items() if chunks)
+    rows, vecs = [], []
+    text_blob = bytearray()
+    for path_id, path in enumerate(paths):
+        for chunk in entries[path]:
+            encoded = chunk["text"].encode("utf-8")
+            rows.append((path_id, chunk["chunk_index"], len(text_blob), len(encoded)))
+            vecs.append(np.asarray(chunk["embedding"], dtype=np.float32))
+            text_blob += encoded
+
+    dim = vecs[0].size if vecs else (old["dim"] if old else 0)
+    matrix = (
+        normalize_rows(np.vstack(vecs)).astype(np.float32)
+        if vecs
+        else np.zeros((0, dim), dtype=np.float32)
+    )
+
+    if len(rows) >= VAULT_ANN_MIN_CHUNKS:
+        previous = (
+            IVFIndex.load(_gen_file("ivf", old["generation"], "npz")) if old else None
+        )
+        IVFIndex.build(matrix, previous).save(_gen_file("ivf", generation, "npz"))
+
+    if VAULT_INT8 and len(rows):
+        scale, offset = fit_quantizer(matrix)
+        np.save(_gen_file("codes", generation, "npy"), encode(matrix, scale, offset))
+        with open(_gen_file("quant", generation, "npz"), "wb") as f:
+            np.savez(f, scale=scale, offset=offset)
+
+    np.save(_gen_file("embeddings", generation, "npy"), matrix)
+    np.save(_gen_file("chunks", generation, "npy"), np.array(rows, dtype=CHUNK_DTYPE))
+    _gen_file("text", generation, "bin").write_bytes(bytes(text_blob))
+
+    columns, note_tags, note_keys = _note_columns(paths, notes or {})
+    with open(_gen_file("notes", generation, "npz"), "wb") as f:
+        np.savez(f, **columns)
+
+    header = {
+        "version": FORMAT_VERSION,
+        "generation": generation,
+        "dim": int(dim),
+        "count": len(rows),
+        "paths": paths,
+        "model": spec[0],
+        "dimensions": spec[1],
+        "note_tags": note_tags,
+        "note_keys": note_keys,
+    }
+    tmp = HEADER_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(header))
+    os.replace(tmp, HEADER_FILE)
+
+    _remove_stale_generations(generation)
+    return generation
+
+
+def compact_vault_index(notes: Optional[Dict] = None) -> int:
+    """
+    Folds the journal into a new base generation and empties it. Replaying a
+    journal that was already folded is harmless, so a crash between the two
+    steps loses nothing. `notes` fills in metadata the index doesn't have.
+    """
+    index = load_vault_index()
+    if index is None:
+        return 0
+    merged = index.to_notes()
+    merged.update(notes or {})
+    generation = write_vault_index(index.to_entries(), index.spec, merged)
+    _reset_journal()
+    return generation
+
+
+def replace_vault_index(
+    entries: Dict[str, List[Dict]], spec, notes: Optional[Dict] = None
+) -> int:
+    """
+    Swaps in a whole new base (e.g. re-embedded with another spec) and drops
+    the journal, whose records belong to the old one.
+    """
+    generation = write_vault_index(entries, spec, notes)
+    _reset_journal()
+    return generation
+
+
+def _remove_stale_generations(live: int):
+    # Processes that still map an old generation keep their inode alive
+    for f in VAULT_INDEX_DIR.glob("*.*.*"):
+        try:
+            if int(f.name.split(".")[1]) != live:
+                f.unlink()
+        except (ValueError, IndexError, FileNotFoundError):
+            continue
+
+
+def migrate_legacy_json():
+    """One-shot conversion of the old vault_vectors.json into the binary index."""
+    try:
+        legacy = json.loads(VAULT_VECTORS_FILE.read_text())
+    except (FileNotFoundError, ValueError):
+        return False
+    with _CACHE_LOCK:
+        if HEADER_FILE.exists():
+            return False
+        write_vault_index(legacy)
+    VAULT_VECTORS_FILE.rename(VAULT_VECTORS_FILE.with_suffix(".json.migrated"))
+    return True
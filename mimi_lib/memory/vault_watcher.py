@@ -0,0 +1,268 @@
+"""
+Long-lived vault change detection.
+
+Instead of walking the whole vault on every index trigger, a background
+watcher collects the notes that changed into a dirty set, and the indexer
+only processes that set.
+
+Two backends:
+    InotifyWatcher -> Linux inotify through ctypes, one watch per directory
+    PollingWatcher -> periodic stat scan against a snapshot persisted in
+                      VAULT_SNAPSHOT_FILE, so changes made while Mimi wasn't
+                      running are picked up on the next start as well
+
+Either backend can ask for a full scan instead (inotify queue overflow, a
+directory vanishing, the watcher dying); the indexer then falls back to
+walking the vault once.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import struct
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from mimi_lib.config import VAULT_PATH, VAULT_SNAPSHOT_FILE, VAULT_POLL_INTERVAL
+from mimi_lib.utils.docstore import write_json
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEAD = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def is_vault_note(name: str) -> bool:
+    """Same rules as get_vault_files: visible markdown files only."""
+    return name.endswith(".md") and not name.startswith(".")
+
+
+def _visible_dir(name: str) -> bool:
+    return not name.startswith(".")
+
+
+class _DirtySet:
+    """Thread-safe set of changed note paths (relative to the vault)."""
+
+    def __init__(self, root=VAULT_PATH):
+        self.root = str(root)
+        self._lock = threading.Lock()
+        self._dirty: Set[str] = set()
+        self._full_scan = False
+        self.alive = False
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def mark_dirty(self, rel_paths):
+        with self._lock:
+            self._dirty.update(rel_paths)
+
+    def request_full_scan(self):
+        with self._lock:
+            self._full_scan = True
+
+    def drain(self) -> Tuple[Set[str], bool]:
+        """Returns (dirty paths, full scan needed) and resets both."""
+        with self._lock:
+            dirty, full = self._dirty, self._full_scan or not self.alive
+            self._dirty, self._full_scan = set(), False
+            return dirty, full
+
+    def _notes_under(self, directory: str) -> Set[str]:
+        found = set()
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if _visible_dir(d)]
+            found.update(
+                self._rel(os.path.join(root, f)) for f in files if is_vault_note(f)
+            )
+        return found
+
+
+class InotifyWatcher(_DirtySet):
+    def __init__(self, root=VAULT_PATH):
+        super().__init__(root)
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, str] = {}  # watch descriptor -> directory
+
+    def _watch_tree(self, top: str):
+        for root, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if _visible_dir(d)]
+            wd = self._libc.inotify_add_watch(self._fd, root.encode(), WATCH_MASK)
+            if wd < 0:
+                # Usually fs.inotify.max_user_watches; fall back to polling
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {root}")
+            self._dirs[wd] = root
+
+    def start(self):
+        try:
+            self._watch_tree(self.root)
+        except OSError:
+            os.close(self._fd)
+            raise
+        self.alive = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            while True:
+                data = os.read(self._fd, 64 * 1024)
+                self._handle(data)
+        except Exception as e:
+            print(f"[VaultWatcher] inotify reader stopped: {e}")
+        finally:
+            self.alive = False
+
+    def _handle(self, data: bytes):
+        pos = 0
+        while pos + EVENT_HEAD.size <= len(data):
+            wd, mask, _, length = EVENT_HEAD.unpack_from(data, pos)
+            name_raw = data[pos + EVENT_HEAD.size : pos + EVENT_HEAD.size + length]
+            name = name_raw.rstrip(b"\0").decode("utf-8", errors="surrogateescape")
+            pos += EVENT_HEAD.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                self.request_full_scan()
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # We can't list what used to live there, so rescan once
+                self.request_full_scan()
+            elif mask & IN_ISDIR:
+                if not _visible_dir(name):
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may land before the new watch is in place
+                    self._watch_tree(path)
+                    self.mark_dirty(self._notes_under(path))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.request_full_scan()
+            elif is_vault_note(name):
+                self.mark_dirty([self._rel(path)])
+
+
+class PollingWatcher(_DirtySet):
+    """Pure-Python fallback: periodic stat scan diffed against a snapshot."""
+
+    def __init__(self, root=VAULT_PATH, snapshot_file=VAULT_SNAPSHOT_FILE):
+        super().__init__(root)
+        self.snapshot_file = snapshot_file
+        self._snapshot: Dict[str, list] = self._load_snapshot()
+
+    def _load_snapshot(self) -> Dict[str, list]:
+        try:
+            data = json.loads(self.snapshot_file.read_text())
+            if data.get("root") == self.root:
+                return data["files"]
+        except:
+            pass
+        return {}
+
+    def _save_snapshot(self):
+        # The CLI and the watcher process both poll; unique temp files
+        write_json(
+            self.snapshot_file, {"root": self.root, "files": self._snapshot}, None
+        )
+
+    def _scan(self) -> Dict[str, list]:
+        files = {}
+        stack = [self.root]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if _visible_dir(entry.name):
+                            stack.append(entry.path)
+                    elif is_vault_note(entry.name):
+                        st = entry.stat()
+                        files[self._rel(entry.path)] = [st.st_mtime_ns, st.st_size]
+                except OSError:
+                    continue
+        return files
+
+    def poll(self):
+        current = self._scan()
+        changed = {p for p, stamp in current.items() if self._snapshot.get(p) != stamp}
+        changed.update(p for p in self._snapshot if p not in current)
+        if changed:
+            self.mark_dirty(changed)
+            self._snapshot = current
+            self._save_snapshot()
+
+    def start(self):
+        self.alive = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    self.poll()
+                except OSError as e:
+                    # e.g. a full disk; the dirty set is already marked, and
+                    # the snapshot is saved again on the next change
+                    print(f"[VaultWatcher] poll failed: {e}")
+                time.sleep(VAULT_POLL_INTERVAL)
+        except Exception as e:
+            print(f"[VaultWatcher] polling stopped: {e}")
+        finally:
+            self.alive = False
+
+
+_WATCHER: Optional[_DirtySet] = None
+_WATCHER_LOCK = threading.Lock()
+
+
+def get_vault_watcher() -> Optional[_DirtySet]:
+    """Starts the watcher on first use; None if the vault doesn't exist."""
+    global _WATCHER
+    with _WATCHER_LOCK:
+        if _WATCHER is None and VAULT_PATH.is_dir():
+            try:
+                watcher = InotifyWatcher()
+                watcher.start()
+            except (OSError, AttributeError) as e:
+                # Not Linux, or out of inotify watches
+                print(f"[VaultWatcher] inotify unavailable ({e}), polling instead.")
+                watcher = PollingWatcher()
+                watcher.start()
+            _WATCHER = watcher
+        return _WATCHER
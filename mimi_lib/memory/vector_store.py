@@ -0,0 +1,408 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from mimi_lib.config import (
+    MEMORY_VECTORS_FILE,
+    DEFAULT_EMBEDDING_MODEL,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+)
+from mimi_lib.utils.docstore import file_lock, write_json
+
+# Pre-header vectors.json files were a bare {id: vector} dict of these
+LEGACY_SPEC = (DEFAULT_EMBEDDING_MODEL, None)
+# The log is folded into vectors.json once it's bigger than half of it
+COMPACT_LOG_MIN_BYTES = 1024 * 1024
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Returns a copy with each row L2-normalized; zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# Decimals kept on disk: within float32 resolution for normalized vectors,
+# where plain .tolist() spells out the full float64 expansion of each
+# float32 and makes vectors.json ~1.6x bigger
+SAVED_DECIMALS = 8
+
+
+def _as_floats(matrix: np.ndarray):
+    """Python floats (nested lists for a matrix), rounded for saving."""
+    return matrix.astype(np.float64).round(SAVED_DECIMALS).tolist()
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k highest scores, best first (argpartition + small sort)."""
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if scores.size > top_k:
+        idx = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class MemoryVectorStore:
+    """
+    In-memory float32 matrix of pre-normalized memory vectors.
+
+    Rows [0, size) are live and `ids[row]` is the memory ID for that row.
+    On disk the store is `vectors.json` (a snapshot) plus `vectors.log`, a
+    JSON-lines log of the puts and deletes made since; saving or deleting
+    one memory appends one line instead of rewriting the snapshot. The log
+    is folded into the snapshot once it outgrows half of it. Other
+    processes' appends are replayed from where we last stopped reading.
+
+    Persisted changes are made under the snapshot's cross-process lock, on
+    top of a fresh reload, so the CLI and the watcher can't write over each
+    other. `spec` is the (model, requested dimensions) pair every vector in
+    the store came from.
+    """
+
+    def __init__(self, path=MEMORY_VECTORS_FILE):
+        self.path = path
+        self.log_path = path.with_suffix(".log") if path is not None else None
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._stamp = None
+        self._log_seen = None  # (inode, size) of the log when last read
+        self._log_end = 0  # Offset just past the last complete log line
+        self._ops = None  # Log lines owed by the running mutation
+        self._loaded = False
+        self._spec = (EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+
+    # --- Disk Sync ---
+
+    @classmethod
+    def from_dict(
+        cls, vectors: Dict[str, List[float]], spec=LEGACY_SPEC
+    ) -> "MemoryVectorStore":
+        """Detached store over an in-memory {id: vector} dict (never touches disk)."""
+        store = cls(path=None)
+        store._load_dict(vectors, spec)
+        store._loaded = True
+        return store
+
+    def _file_stamp(self):
+        if self.path is None:
+            return None
+        try:
+            st = self.path.stat()
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _log_stamp(self):
+        try:
+            st = self.log_path.stat()
+            return (st.st_ino, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def disk_size(self) -> int:
+        """Bytes used on disk (snapshot plus log)."""
+        if self.path is None:
+            return 0
+        return sum(s[-1] for s in (self._file_stamp(), self._log_stamp()) if s)
+
+    def _read_file(self):
+        """Returns (spec, {id: vector}); a missing file keeps the current spec."""
+        if self.path is None or not self.path.exists():
+            return self._spec, {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except:
+            return self._spec, {}
+        if "vectors" in data and "model" in data:
+            return (data["model"], data.get("dimensions")), data["vectors"]
+        return LEGACY_SPEC, data
+
+    def _ensure_loaded(self):
+        if self.path is None:
+            return
+        stamp = self._file_stamp()
+        log = self._log_stamp()
+        if self._loaded and stamp == self._stamp:
+            if log == self._log_seen:
+                return
+            seen = self._log_seen
+            if log and seen and log[0] == seen[0] and log[1] >= self._log_end:
+                self._replay_log()  # Someone appended; read just the new lines
+                return
+        spec, vectors = self._read_file()
+        self._load_dict(vectors, spec)
+        self._stamp = stamp
+        self._log_seen, self._log_end = None, 0
+        self._replay_log()
+        self._loaded = True
+
+    def _replay_log(self):
+        try:
+            with open(self.log_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                f.seek(self._log_end)
+                data = f.read()
+        except FileNotFoundError:
+            self._log_seen, self._log_end = None, 0
+            return
+        pos = 0
+        while True:
+            end = data.find(b"\n", pos)
+            if end < 0:
+                break  # A torn last line (crash mid-append) is ignored
+            try:
+                op = json.loads(data[pos:end])
+            except ValueError:
+                break
+            if op.get("op") == "put":
+                vec = np.asarray(op["v"], dtype=np.float32)
+                if vec.ndim == 1 and vec.size:
+                    self._insert(str(op["id"]), vec)
+            elif op.get("op") == "del":
+                self._delete(str(op["id"]))
+            pos = end + 1
+        self._log_seen = (st.st_ino, self._log_end + len(data))
+        self._log_end += pos
+
+    def _load_dict(self, vectors: Dict[str, List[float]], spec):
+        self._spec = tuple(spec)
+        dim = next((len(v) for v in vectors.values() if v), 0)
+        ids = [str(k) for k, v in vectors.items() if v and len(v) == dim]
+        if ids:
+            matrix = np.asarray([vectors[k] for k in ids], dtype=np.float32)
+            matrix = normalize_rows(matrix)
+        else:
+            matrix = np.zeros((0, dim), dtype=np.float32)
+        self._matrix = matrix
+        self._ids = ids
+        self._rows = {mem_id: i for i, mem_id in enumerate(ids)}
+
+    def to_dict(self) -> Dict[str, List[float]]:
+        with self._lock:
+            self._ensure_loaded()
+            size = len(self._ids)
+            return dict(zip(self._ids, _as_floats(self._matrix[:size])))
+
+    def _compact(self):
+        # Caller holds the file lock. Snapshot first, then drop the log: a
+        # reader that sees the new snapshot with the old log just replays
+        # changes the snapshot already has
+        with self._lock:
+            data = {
+                "model": self._spec[0],
+                "dimensions": self._spec[1],
+                "vectors": self.to_dict(),
+            }
+            # Unique temp file + rename, since the watcher may be reading it
+            write_json(self.path, data, indent=None)
+            self._stamp = self._file_stamp()
+            try:
+                self.log_path.unlink()
+            except FileNotFoundError:
+                pass
+            self._log_seen, self._log_end = None, 0
+
+    def _append(self, ops: List[Dict]):
+        # Caller holds the file lock and has just replayed the log, so
+        # _log_end is its valid length (anything past it is a torn line)
+        lines = "".join(json.dumps(op) + "\n" for op in ops).encode("utf-8")
+        mode = "r+b" if self.log_path.exists() else "wb"
+        with open(self.log_path, mode) as f:
+            f.truncate(self._log_end)
+            f.seek(self._log_end)
+            f.write(lines)
+            ino = os.fstat(f.fileno()).st_ino
+        self._log_end += len(lines)
+        self._log_seen = (ino, self._log_end)
+
+    def save(self):
+        """Folds the log into a fresh vectors.json."""
+        if self.path is None:
+            return
+        with file_lock(self.path), self._lock:
+            self._ensure_loaded()
+            self._compact()
+
+    @contextmanager
+    def _mutation(self, persist: bool, rewrite: bool = False):
+        """
+        Read-modify-write: with persist, the file lock is held throughout,
+        other processes' writes are loaded first and the changes are
+        appended to the log (or, with `rewrite`, compacted into a snapshot).
+        """
+        if not persist or self.path is None:
+            with self._lock:
+                self._ensure_loaded()
+                yield
+            return
+        with file_lock(self.path), self._lock:
+            self._ensure_loaded()
+            self._ops = []
+            try:
+                yield
+            except:
+                self._loaded = False  # Half-applied; reload from disk
+                raise
+            finally:
+                ops, self._ops = self._ops, None
+            snapshot = self._stamp[-1] if self._stamp else 0
+            if rewrite or self._log_end > max(COMPACT_LOG_MIN_BYTES, snapshot // 2):
+                self._compact()
+            elif ops:
+                self._append(ops)
+
+    @property
+    def spec(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self._spec
+
+    def replace(self, vectors: Dict[str, List[float]], spec, persist: bool = True):
+        """Swaps in a whole new vector set (e.g. after re-embedding with a new spec)."""
+        with self._mutation(persist, rewrite=True):
+            self._load_dict(vectors, spec)
+
+    def get(self, mem_id) -> Optional[np.ndarray]:
+        """Copy of the (normalized) vector for mem_id, or None."""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._rows.get(str(mem_id))
+            return None if row is None else self._matrix[row].copy()
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._ids)
+
+    # --- Mutation Hooks (O(1) amortized, one log line each) ---
+
+    @property
+    def dim(self) -> int:
+        return self._matrix.shape[1] if self._matrix.ndim == 2 else 0
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._ids)
+
+    def __contains__(self, mem_id):
+        with self._lock:
+            self._ensure_loaded()
+            return str(mem_id) in self._rows
+
+    def add(self, mem_id, vector: List[float], persist: bool = True) -> bool:
+        """Inserts or replaces the vector for mem_id."""
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if vec.ndim != 1 or norm == 0:
+            return False
+        with self._mutation(persist):
+            return self._insert(str(mem_id), vec / norm)
+
+    def remove(self, mem_id, persist: bool = True) -> bool:
+        """Deletes mem_id by moving the last row into its slot."""
+        with self._mutation(persist):
+            return self._delete(str(mem_id))
+
+    def update(
+        self, add: Optional[Dict] = None, remove: Iterable = ()
+    ) -> Tuple[int, int]:
+        """
+        Applies several changes in one locked read-modify-write, so nothing
+        written meanwhile by another process is lost, and compacts the
+        result. Returns (added, removed).
+        """
+        remove = list(remove)
+        added = removed = 0
+        if not add and not remove:
+            return added, removed
+        with self._mutation(True, rewrite=True):
+            for mem_id in remove:
+                removed += self._delete(str(mem_id))
+            for mem_id, vector in (add or {}).items():
+                vec = np.asarray(vector, dtype=np.float32)
+                norm = float(np.linalg.norm(vec))
+                if vec.ndim == 1 and norm and self._insert(str(mem_id), vec / norm):
+                    added += 1
+        return added, removed
+
+    def _insert(self, key: str, vec: np.ndarray) -> bool:
+        size = len(self._ids)
+        if size == 0 and self.dim != vec.size:
+            self._matrix = np.zeros((8, vec.size), dtype=np.float32)
+        elif vec.size != self.dim:
+            return False
+
+        row = self._rows.get(key)
+        if row is None:
+            if size == self._matrix.shape[0]:
+                grown = np.zeros((max(8, size * 2), self.dim), dtype=np.float32)
+                grown[:size] = self._matrix[:size]
+                self._matrix = grown
+            row = size
+            self._ids.append(key)
+            self._rows[key] = row
+        self._matrix[row] = vec
+        if self._ops is not None:
+            self._ops.append({"op": "put", "id": key, "v": _as_floats(vec)})
+        return True
+
+    def _delete(self, key: str) -> bool:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+        if self._ops is not None:
+            self._ops.append({"op": "del", "id": key})
+        return True
+
+    # --- Query ---
+
+    def search(
+        self, query_vector: List[float], top_k: int = 3, threshold: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        """Returns [(mem_id, cosine)] for the best top_k rows above threshold."""
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm == 0:
+            return []
+
+        with self._lock:
+            self._ensure_loaded()
+            size = len(self._ids)
+            if size == 0 or q.size != self.dim:
+                return []
+            scores = self._matrix[:size] @ (q / norm)
+            best = top_k_indices(scores, top_k)
+            return [
+                (self._ids[i], float(scores[i])) for i in best if scores[i] > threshold
+            ]
+
+
+_STORE: Optional[MemoryVectorStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_memory_store() -> MemoryVectorStore:
+    """Process-wide memory vector store (lazily created)."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = MemoryVectorStore()
+        return _STORE
@@ -1,11 +1,13 @@
 from mimi_lib.tools.registry import register_tool
 from mimi_lib.memory.brain import save_memory, delete_memory
-from mimi_lib.memory.embeddings import semantic_search
-from mimi_lib.memory.vault_indexer import index_vault, search_vault
-from mimi_lib.config import VAULT_PATH, MEMORY_ARCHIVE_FILE
+from mimi_lib.memory.retrieval import DIARY, LEXICAL, MEMORY, TEMPORAL, VAULT, retrieve
+from mimi_lib.memory.timeline import TimeRange
+from mimi_lib.memory.vault_indexer import index_vault
+from mimi_lib.config import TOOL_RETRIEVAL_BUDGET_MS, VAULT_PATH
 import json
 import subprocess
 import os
+from datetime import datetime, timedelta
 
 
 @register_tool(
@@ -53,45 +55,127 @@ def delete_memory_tool(id: str):
 
 @register_tool(
     "search_memory",
-    "Search the internal memory store (non-vault) for facts.",
+    "Search the internal memory store (non-vault) and diary for facts. "
+    "Optionally restrict it to a date range; phrases like 'last week' in "
+    "the query are understood too.",
     {
         "type": "object",
         "properties": {
-            "query": {"type": "string", "description": "The semantic search query."}
+            "query": {"type": "string", "description": "The semantic search query."},
+            "since": {
+                "type": "string",
+                "description": "Only memories from this date on (YYYY-MM-DD).",
+            },
+            "until": {
+                "type": "string",
+                "description": "Only memories up to this date, inclusive (YYYY-MM-DD).",
+            },
         },
         "required": ["query"],
     },
 )
-def search_memory_tool(query: str):
-    results = semantic_search(query, top_k=5)
-    if not results:
+def search_memory_tool(query: str, since=None, until=None):
+    time_range = None
+    if since or until:
+        try:
+            start = datetime.fromisoformat(since) if since else datetime(1970, 1, 1)
+            end = (
+                datetime.fromisoformat(until) + timedelta(days=1)
+                if until
+                else datetime(9999, 1, 1)
+            )
+        except ValueError:
+            return "Invalid date, expected YYYY-MM-DD."
+        time_range = TimeRange(start, end, f"{since or '...'} to {until or '...'}")
+
+    hits = retrieve(
+        query,
+        top_k=5,
+        lanes=(MEMORY, LEXICAL, TEMPORAL),
+        budget_ms=TOOL_RETRIEVAL_BUDGET_MS,
+        time_range=time_range,
+    )
+    if not hits:
+        if hits.missed:
+            return _timed_out("memory", hits.missed)
         return "No relevant memories found."
 
     output = [f"Memory Search Results for '{query}':"]
-    for r in results:
-        output.append(
-            f"- [{r.get('timestamp')}] {r.get('content')} (ID: {r.get('id')})"
-        )
+    for hit in hits:
+        r = hit.item
+        if hit.source == DIARY:
+            output.append(f"- [Diary {r.get('date')}] {r.get('content', '')[:300]}")
+        else:
+            output.append(
+                f"- [{r.get('timestamp')}] {r.get('content')} (ID: {r.get('id')})"
+            )
+    if hits.missed:
+        output.append(f"(Partial results: {', '.join(hits.missed)} search timed out.)")
     return "\n".join(output)
 
 
+def _timed_out(what, lanes):
+    # Don't let a slow embedding pass for "nothing found"
+    return (
+        f"The {what} search timed out or failed ({', '.join(lanes)}); "
+        "no results are available right now. Try again shortly."
+    )
+
+
 @register_tool(
     "vault_search",
-    "Semantically search the user's Obsidian vault for relevant notes.",
+    "Semantically search the user's Obsidian vault for relevant notes. "
+    "Optionally narrow it to a folder, tags or a modification date range.",
     {
         "type": "object",
-        "properties": {"query": {"type": "string"}},
+        "properties": {
+            "query": {"type": "string"},
+            "path_prefix": {
+                "type": "string",
+                "description": "Only search under this vault folder, e.g. 'Mimi/Sessions'.",
+            },
+            "tags": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Only notes carrying all of these tags (without '#').",
+            },
+            "since": {
+                "type": "string",
+                "description": "Only notes modified on/after this date (YYYY-MM-DD).",
+            },
+            "until": {
+                "type": "string",
+                "description": "Only notes modified on/before this date (YYYY-MM-DD).",
+            },
+        },
         "required": ["query"],
     },
 )
-def vault_search(query: str):
-    results = search_vault(query)
+def vault_search(query: str, path_prefix=None, tags=None, since=None, until=None):
+    if isinstance(tags, str):
+        tags = [tags]
+    for value in (since, until):
+        if value:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                return f"Invalid date '{value}', expected YYYY-MM-DD."
+    scope = {"path_prefix": path_prefix, "tags": tags, "since": since, "until": until}
+    results = retrieve(
+        query,
+        top_k=5,
+        lanes=(VAULT,),
+        budget_ms=TOOL_RETRIEVAL_BUDGET_MS,
+        vault_scope=scope,
+    )
+    if results.missed:
+        return _timed_out("vault", results.missed)
     if not results:
         return "No relevant notes found in the vault."
 
     output = [f"Semantic search results for '{query}':"]
     for r in results:
-        output.append(f"\n--- {r['path']} (Score: {r['score']:.2f}) ---\n{r['text']}")
+        output.append(f"\n--- {r.path} (Score: {r.lanes[VAULT]:.2f}) ---\n{r.text}")
     return "\n".join(output)
 
 
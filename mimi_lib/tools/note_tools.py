@@ -1,11 +1,9 @@
 from mimi_lib.tools.registry import register_tool
 from mimi_lib.memory.brain import save_memory, get_literal_matches
+from mimi_lib.memory import brain
 import subprocess
 import os
-import uuid
-from datetime import datetime
 from mimi_lib.config import NOTES_STORE_FILE
-import json
 
 
 @register_tool(
@@ -22,26 +20,7 @@ import json
     },
 )
 def add_note(content: str, priority: str = "Medium", tags: list = None):
-    tags = tags or []
-    notes = []
-    if NOTES_STORE_FILE.exists():
-        try:
-            notes = json.loads(NOTES_STORE_FILE.read_text())
-        except:
-            pass
-
-    note_id = str(uuid.uuid4())[:8]
-    notes.append(
-        {
-            "id": note_id,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "content": content,
-            "priority": priority,
-            "tags": tags,
-        }
-    )
-
-    NOTES_STORE_FILE.write_text(json.dumps(notes, indent=2))
+    note_id = brain.add_note(content, priority, tags or [])
     return f"Note added (ID: {note_id})."
 
 
@@ -58,11 +37,7 @@ def delete_note(note_id: str):
     if not NOTES_STORE_FILE.exists():
         return "No notes found."
     try:
-        notes = json.loads(NOTES_STORE_FILE.read_text())
-        initial = len(notes)
-        notes = [n for n in notes if n["id"] != note_id]
-        if len(notes) < initial:
-            NOTES_STORE_FILE.write_text(json.dumps(notes, indent=2))
+        if brain.delete_note(note_id):
             return f"Note {note_id} deleted."
         return "Note ID not found."
     except:
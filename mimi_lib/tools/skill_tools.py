@@ -1,13 +1,140 @@
 from mimi_lib.tools.registry import register_tool
 from mimi_lib.skills.manager import SkillManager
-from mimi_lib.memory.embeddings import semantic_search
-from mimi_lib.memory.vault_indexer import search_vault
+from mimi_lib.memory.retrieval import MEMORY, VAULT, retrieve
+from mimi_lib.memory.vault_indexer import add_index_listener
+from mimi_lib.memory.vault_store import index_version
+from mimi_lib.memory.memory_db import ARCHIVE, get_memory_db
+from mimi_lib.config import MEMORY_VECTORS_FILE, SKILL_INIT_CACHE_FILE
+from mimi_lib.utils.docstore import write_json
 from pathlib import Path
+import json
+import threading
 
 # Initialize singleton with relative path
 SKILLS_DIR = Path(__file__).parent.parent / "skills"
 _manager = SkillManager(SKILLS_DIR)
 
+# TURBO: Fused Initialization - fixed memory queries run when a skill loads
+SKILL_INIT_QUERIES = {
+    "latex_wizard": "LaTeX preferences mathematical notation style",
+    "git_master": "Git sync preferences repository management",
+    "obsidian_expert": "Obsidian vault organization note structure",
+    "academic_strategist": "Learning philosophy study habits preferences",
+    "productivity_master": "Daily routine schedule deadlines",
+    "telegram_curator": "Telegram channel persona PASUM notes style",
+    "engineering": "STEM tutoring style math physics preferences",
+    "software_architect": "Code refactoring standards project structure",
+    "researcher": "Web research depth source synthesis preferences",
+    "counsellor": "Emotional support preferences self-reflection therapeutic style",
+    "companion": "Inside jokes hobbies favorite foods friendship dynamics",
+}
+
+# --- INIT RESULT CACHE ---
+# skill -> {"query", "version", "block"}; a block is reused until the vault
+# index generation or the memory archive/vectors change
+_INIT_CACHE = None
+_INIT_LOCK = threading.Lock()
+
+
+def _file_stamp(path):
+    try:
+        st = path.stat()
+        return [st.st_mtime_ns, st.st_size]
+    except FileNotFoundError:
+        return None
+
+
+def _data_version():
+    return {
+        "vault": index_version(),
+        "memory": [
+            get_memory_db().version(ARCHIVE),
+            _file_stamp(MEMORY_VECTORS_FILE),
+            _file_stamp(MEMORY_VECTORS_FILE.with_suffix(".log")),
+        ],
+    }
+
+
+def _load_init_cache():
+    global _INIT_CACHE
+    if _INIT_CACHE is None:
+        try:
+            _INIT_CACHE = json.loads(SKILL_INIT_CACHE_FILE.read_text(encoding="utf-8"))
+        except:
+            _INIT_CACHE = {}
+    return _INIT_CACHE
+
+
+def _save_init_cache():
+    # The CLI and the watcher process both warm the cache; unique temp files
+    write_json(SKILL_INIT_CACHE_FILE, _INIT_CACHE, None)
+
+
+NO_INIT_RESULTS = "\n\n(No specific preferences found in memory for this skill. I will use my default expert protocols.)"
+
+
+def _build_init_block(query):
+    """
+    The "Fused Initialization" block: vault + session memory, fused.
+    Returns (block or None, whether every lane answered in time).
+    """
+    init_data = "\n\n**Fused Initialization (Memory Discovery):**\n"
+    found = False
+    hits = retrieve(query, top_k=4, lanes=(VAULT, MEMORY))
+    for hit in hits:
+        if hit.source == VAULT:
+            init_data += f"- [Vault] {hit.path}: {hit.text[:300]}\n"
+        else:
+            init_data += f"- [Memory] {hit.text}\n"
+        found = True
+    return (init_data if found else None), hits.complete
+
+
+def get_skill_init_block(name, refresh=True):
+    """
+    Cached init block for a skill, rebuilt only when the data it was
+    computed from has changed. None when nothing was found (or, with
+    refresh=False, when the cached block is stale).
+    """
+    query = SKILL_INIT_QUERIES.get(name)
+    if not query:
+        return None
+    version = _data_version()
+    with _INIT_LOCK:
+        entry = _load_init_cache().get(name)
+        if entry and entry["query"] == query and entry["version"] == version:
+            return entry["block"]
+    if not refresh:
+        return None
+
+    block, complete = _build_init_block(query)
+    # A block missing a lane (slow or failed embedding) isn't cached, or
+    # it would stick until the data next changes
+    if block and complete:
+        with _INIT_LOCK:
+            _load_init_cache()[name] = {
+                "query": query,
+                "version": version,
+                "block": block,
+            }
+            try:
+                _save_init_cache()
+            except OSError:
+                pass
+    return block
+
+
+def warm_skill_init_cache():
+    """Rebuilds the stale blocks of skills that have been loaded before."""
+    with _INIT_LOCK:
+        names = list(_load_init_cache())
+    for name in names:
+        get_skill_init_block(name)
+
+
+# Reindexing changes the vault version; rebuild while nobody is waiting
+add_index_listener(warm_skill_init_cache)
+
 
 @register_tool(
     "load_skill",
@@ -42,48 +169,13 @@ def load_skill(name: str) -> str:
     if _manager.load_skill(name):
         res = f"Skill '{name}' loaded successfully. I am now ready!"
 
-        # TURBO: Fused Initialization - Auto-search memory for relevant preferences
-        queries = {
-            "latex_wizard": "LaTeX preferences mathematical notation style",
-            "git_master": "Git sync preferences repository management",
-            "obsidian_expert": "Obsidian vault organization note structure",
-            "academic_strategist": "Learning philosophy study habits preferences",
-            "productivity_master": "Daily routine schedule deadlines",
-            "telegram_curator": "Telegram channel persona PASUM notes style",
-            "engineering": "STEM tutoring style math physics preferences",
-            "software_architect": "Code refactoring standards project structure",
-            "researcher": "Web research depth source synthesis preferences",
-            "counsellor": "Emotional support preferences self-reflection therapeutic style",
-            "companion": "Inside jokes hobbies favorite foods friendship dynamics",
-        }
-
-        query = queries.get(name)
-        if query:
-            init_data = "\n\n**Fused Initialization (Memory Discovery):**\n"
-            found = False
-
-            # 1. Vault Search
+        # Served from the init cache unless the vault/memory changed
+        if name in SKILL_INIT_QUERIES:
             try:
-                vault_res = search_vault(query, top_k=2)
-                for r in vault_res:
-                    init_data += f"- [Vault] {r['path']}: {r['text'][:300]}\n"
-                    found = True
+                block = get_skill_init_block(name)
             except:
-                pass
-
-            # 2. Session Memory Search
-            try:
-                mem_res = semantic_search(query, top_k=2)
-                for r in mem_res:
-                    init_data += f"- [Memory] {r['content']}\n"
-                    found = True
-            except:
-                pass
-
-            if found:
-                res += init_data
-            else:
-                res += "\n\n(No specific preferences found in memory for this skill. I will use my default expert protocols.)"
+                block = None
+            res += block or NO_INIT_RESULTS
 
         return res
     return f"Error: Skill '{name}' not found. Available: {_manager.list_skills()}"
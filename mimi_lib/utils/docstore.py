@@ -0,0 +1,224 @@
+"""
+Small JSON document store (notes, diary, persona, working set, counters).
+
+Every write goes to a temp file that is fsynced and renamed over the
+document, so readers see either the old or the new version, never half
+of one. Read-modify-write happens inside `transaction()`, which holds an
+fcntl lock on a sidecar `<name>.lock` file, so the CLI, the watcher and
+the diary cron can't drop each other's updates.
+
+Reads are served from an in-process cache keyed by (inode, mtime, size);
+an atomic rename always changes the inode, so writes from other
+processes are never missed.
+
+`save_doc(..., delay=...)` is write-behind for hot, single-writer keys
+(the working set, the message counter): the latest value is kept in
+memory and flushed after `delay` seconds, or at exit.
+"""
+
+import atexit
+import copy
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+WRITE_BEHIND_SECONDS = 2.0
+
+_LOCK = threading.RLock()
+_CACHE = {}  # path -> ((ino, mtime_ns, size), data)
+_PENDING = {}  # path -> data waiting for its write-behind flush
+_TIMERS = {}  # path -> threading.Timer
+
+
+def _key(path):
+    return os.fspath(path)
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read(path):
+    """(data, found) straight from disk, through the stat cache."""
+    key = _key(path)
+    stamp = _stamp(key)
+    if stamp is None:
+        return None, False
+    cached = _CACHE.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1], True
+    try:
+        with open(key, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None, False
+    _CACHE[key] = (stamp, data)
+    return data, True
+
+
+def write_json(path, data, indent=2):
+    """
+    Atomically replaces `path` with `data` (unique temp file, fsync, rename).
+    No locking or caching; use save_doc/transaction for documents.
+    """
+    key = _key(path)
+    directory = os.path.dirname(key) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, key)
+    except:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _write(path, data):
+    key = _key(path)
+    write_json(key, data)
+    _CACHE[key] = (_stamp(key), copy.deepcopy(data))
+
+
+_PATH_LOCKS = {}  # path -> threading.RLock for file_lock
+
+
+@contextmanager
+def _flock(key):
+    """Exclusive cross-process lock on `<key>.lock`."""
+    fd = os.open(key + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@contextmanager
+def _doc_lock(path):
+    """Cross-process lock for a document, plus the module lock (cache state)."""
+    with _LOCK, _flock(_key(path)):
+        yield
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive cross-process lock on `<path>.lock`, plus a thread lock for
+    that path only. For files that aren't documents (like the memory
+    vectors), so a slow write doesn't hold up every document in the
+    process.
+    """
+    key = _key(path)
+    with _LOCK:
+        thread_lock = _PATH_LOCKS.setdefault(key, threading.RLock())
+    with thread_lock, _flock(key):
+        yield
+
+
+def _default(default):
+    return copy.deepcopy(default) if default is not None else []
+
+
+def load_doc(path, default=None):
+    """A private copy of the document (or `default`, [] if not given)."""
+    with _LOCK:
+        key = _key(path)
+        if key in _PENDING:
+            return copy.deepcopy(_PENDING[key])
+        data, found = _read(key)
+        return copy.deepcopy(data) if found else _default(default)
+
+
+def doc_stamp(path):
+    """(inode, mtime, size) of the document on disk; None if missing."""
+    return _stamp(_key(path))
+
+
+def save_doc(path, data, delay=None):
+    """Replaces the document; with `delay`, coalesces writes for that long."""
+    key = _key(path)
+    if not delay:
+        with _doc_lock(key):
+            _PENDING.pop(key, None)
+            _write(key, data)
+        return
+    with _LOCK:
+        _PENDING[key] = copy.deepcopy(data)
+        if key not in _TIMERS:
+            timer = threading.Timer(delay, flush, args=(key,))
+            timer.daemon = True
+            _TIMERS[key] = timer
+            timer.start()
+
+
+def flush(path=None):
+    """Writes pending write-behind documents (all of them if path is None)."""
+    with _LOCK:
+        keys = list(_PENDING) if path is None else [_key(path)]
+        for key in keys:
+            timer = _TIMERS.pop(key, None)
+            if timer:
+                timer.cancel()
+            if key in _PENDING:
+                with _doc_lock(key):
+                    _write(key, _PENDING.pop(key))
+
+
+atexit.register(flush)
+
+
+class Doc:
+    """The document being edited inside a transaction; assign to `.data`."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+@contextmanager
+def transaction(path, default=None):
+    """
+    Locked read-modify-write:
+
+        with transaction(NOTES_STORE_FILE, []) as doc:
+            doc.data.append(note)
+
+    The document is re-read under the lock and written back atomically on
+    a clean exit, unless it is unchanged.
+    """
+    key = _key(path)
+    with _doc_lock(key):
+        pending = key in _PENDING
+        if pending:
+            timer = _TIMERS.pop(key, None)
+            if timer:
+                timer.cancel()
+            original = _PENDING.pop(key)
+        else:
+            original, found = _read(key)
+            if not found:
+                original = None
+        doc = Doc(
+            copy.deepcopy(original) if original is not None else _default(default)
+        )
+        try:
+            yield doc
+        except:
+            if pending:
+                _PENDING[key] = original  # Still owed to disk
+                flush(key)
+            raise
+        if pending or doc.data != original:
+            _write(key, doc.data)
@@ -0,0 +1,105 @@
+"""
+Cross-process lease on a lock file (fcntl.flock).
+
+The kernel drops a flock when its holder exits, so crashed holders never
+block anyone. A holder that is alive but wedged is detected through the
+heartbeat it writes into the lock file: once that is older than
+`stale_after`, the next contender unlinks the file and locks a fresh one.
+The old holder notices on its next heartbeat() that the path no longer
+points at its inode and must stop writing.
+"""
+
+import fcntl
+import json
+import os
+import socket
+import time
+from typing import Dict, Optional
+
+
+class LeaseLost(RuntimeError):
+    pass
+
+
+class FileLease:
+    def __init__(self, path, stale_after: float = 600):
+        self.path = path
+        self.stale_after = stale_after
+        self._fd: Optional[int] = None
+        self._started = 0.0
+
+    @classmethod
+    def acquire(cls, path, stale_after: float = 600) -> Optional["FileLease"]:
+        """Returns a held lease, or None if a live process holds it."""
+        lease = cls(path, stale_after)
+        for _ in range(2):
+            if lease._try_lock():
+                return lease
+            holder = lease.holder()
+            if holder is None or time.time() - holder["heartbeat"] < stale_after:
+                return None
+            print(
+                f"[Lease] Breaking stale lease on {path.name} "
+                f"(pid {holder.get('pid')}, silent for "
+                f"{int(time.time() - holder['heartbeat'])}s)"
+            )
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return None
+
+    def _try_lock(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # The file may have been unlinked (lease broken) between open and lock
+        if not self._same_file(fd):
+            os.close(fd)
+            return False
+        self._fd = fd
+        self._started = time.time()
+        self.heartbeat()
+        return True
+
+    def _same_file(self, fd: int) -> bool:
+        try:
+            return os.fstat(fd).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def holder(self) -> Optional[Dict]:
+        """{pid, host, started, heartbeat} of whoever wrote the lock file last."""
+        try:
+            with open(self.path, "r") as f:
+                info = json.load(f)
+            info["heartbeat"] = float(info["heartbeat"])
+            return info
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def heartbeat(self):
+        """Refreshes the lease; raises LeaseLost if it was broken meanwhile."""
+        if self._fd is None or not self._same_file(self._fd):
+            raise LeaseLost(f"lease on {self.path} was taken over")
+        info = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "started": self._started,
+            "heartbeat": time.time(),
+        }
+        data = json.dumps(info).encode("utf-8")
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, data, 0)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
@@ -21,14 +21,17 @@ from mimi_lib.memory.brain import (
     load_json,
     save_json,
     save_memory,
-    add_note,
-    delete_note,
+    upsert_diary_entry,
+    find_restated_memory,
+    merge_near_duplicate,
 )
+from mimi_lib.memory.near_dup import get_near_dup_index
+from mimi_lib.utils.docstore import WRITE_BEHIND_SECONDS, save_doc, transaction
+from mimi_lib.memory.memory_db import ACTIVE, ARCHIVE, get_memory_db
+from mimi_lib.memory.timeline import latest_memories
 
 from mimi_lib.config import (
     SESSION_DIR,
-    MEMORY_ARCHIVE_FILE,
-    MEMORY_STORE_FILE,
     PERSONA_CORE_FILE,
     DIARY_STORE_FILE,
     NOTES_STORE_FILE,
@@ -76,13 +79,14 @@ def send_notification(message):
         pass
 
 
-def save_json_with_export(path, data):
-    save_json(path, data)
-    # Trigger exports based on file type
-    if path == MEMORY_STORE_FILE:
-        export_memories_to_obsidian(data)
-    elif path == NOTES_STORE_FILE:
-        export_notes_to_obsidian(data)
+def load_active_memories():
+    return get_memory_db().load(ACTIVE)
+
+
+def save_active_memories(memories):
+    # One transaction, so the CLI never sees a half-compressed store
+    get_memory_db().replace(memories, ACTIVE)
+    export_memories_to_obsidian(memories)
 
 
 def export_memories_to_obsidian(memories):
@@ -196,10 +200,8 @@ def generate_memory_section():
     persona_narrative = persona.get("narrative", "I am Mimi.")
 
     # 1. Load Recent Memories (Keep this very light, rely on RAG)
-    memories = load_json(MEMORY_STORE_FILE, [])
-    # Sort memories by timestamp (newest first for prompt context)
-    memories.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-    recent_memories = memories[:5] if memories else []
+    # Newest first, straight off the timestamp index
+    recent_memories = latest_memories(5, ACTIVE)
 
     memory_text = ""
     for m in reversed(recent_memories):  # Print in chronological order for the block
@@ -234,7 +236,7 @@ The user is ALWAYS 'Kuumin'. You have a permanent "Intuition" system that automa
 
 
 def migrate_categories():
-    memories = load_json(MEMORY_STORE_FILE, [])
+    memories = load_active_memories()
     uncategorized = [m for m in memories if "category" not in m]
 
     if uncategorized:
@@ -261,7 +263,7 @@ def migrate_categories():
                         if "category" not in m_item:
                             m_item["category"] = "Kuumin"
 
-            save_json_with_export(MEMORY_STORE_FILE, memories)
+            save_active_memories(memories)
             print("Migration complete.")
         except Exception as e:
             print(f"Migration failed: {e}")
@@ -417,7 +419,7 @@ def check_profiling_trigger():
 
         count = load_json(COUNTER_FILE, {"count": 0}).get("count", 0)
         if count > 0 and count % PROFILE_INTERVAL == 0:
-            memories = load_json(MEMORY_STORE_FILE, [])
+            memories = load_active_memories()
 
             # Profile Kuumin
             insight_kuumin = mimi_deepseek_integration.generate_psych_profile(memories)
@@ -439,7 +441,7 @@ def check_profiling_trigger():
 
 
 def check_and_compress():
-    memories = load_json(MEMORY_STORE_FILE, [])
+    memories = load_active_memories()
     if len(memories) > COMPRESSION_THRESHOLD:
         print(
             f"[Maintenance] Triggering compression for {len(memories)} total items..."
@@ -480,7 +482,7 @@ def check_and_compress():
                 else:
                     new_memory_store.extend(items)
 
-            save_json_with_export(MEMORY_STORE_FILE, new_memory_store)
+            save_active_memories(new_memory_store)
             sync_instructions_with_store()
             print("[Maintenance] Compression complete.")
 
@@ -502,42 +504,44 @@ def add_memory(data):
     if not content or any(x in content for x in ["Querying", "Searching"]):
         return
 
-    # 1. Update Archive (Permanent)
-    archive = load_json(MEMORY_ARCHIVE_FILE, [])
-    if not any(m.get("content") == content for m in archive):
-        mem_id = int(datetime.now().timestamp() * 1000)
-        new_item = {
-            "id": mem_id,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "content": content,
-            "category": category,
-        }
-        archive.append(new_item)
-        save_json(MEMORY_ARCHIVE_FILE, archive)
+    # 0. Paraphrase of something already remembered: merge, don't append
+    try:
+        existing = find_restated_memory(content)
+    except:
+        existing = None
+    if existing:
+        _, updated = merge_near_duplicate(existing, content)
+        if updated:
+            export_memories_to_obsidian(get_memory_db().load(ACTIVE))
+        return
+
+    db = get_memory_db()
+    item = {
+        "id": int(datetime.now().timestamp() * 1000),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "content": content,
+        "category": category,
+    }
+
+    # 1. Update Archive (Permanent); duplicate content is a no-op
+    mem_id, inserted = db.add(item, ARCHIVE)
+    if inserted:
+        get_near_dup_index().add(dict(item, id=mem_id))
 
         # 1b. Generate Vector (Semantic Index)
         if mimi_embeddings:
             try:
-                vector = mimi_embeddings.get_embedding(content)
+                vectors = mimi_embeddings.get_memory_store()
+                vector = mimi_embeddings.get_embedding(content, vectors.spec)
                 if vector:
-                    vectors = mimi_embeddings.load_vectors()
-                    vectors[str(mem_id)] = vector
-                    mimi_embeddings.save_vectors(vectors)
+                    vectors.add(mem_id, vector)
             except:
                 pass
 
     # 2. Update Active Store (For Prompt)
-    memories = load_json(MEMORY_STORE_FILE, [])
-    if not any(m.get("content") == content for m in memories):
-        memories.append(
-            {
-                "id": int(datetime.now().timestamp() * 1000),
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "content": content,
-                "category": category,
-            }
-        )
-        save_json_with_export(MEMORY_STORE_FILE, memories)
+    _, added = db.add(dict(item, id=mem_id), ACTIVE)
+    if added:
+        export_memories_to_obsidian(db.load(ACTIVE))
         sync_instructions_with_store()
         send_notification(f"Mimi remembered ({category}): {content}")
     # Compression is now handled by the background loop to prevent timeouts
@@ -547,31 +551,32 @@ def add_memory(data):
 def add_note(content, priority="Medium", tags=None):
     if tags is None:
         tags = []
-    notes = load_json(NOTES_STORE_FILE, [])
-
     note_id = str(uuid.uuid4())[:8]
-    notes.append(
-        {
-            "id": note_id,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "content": content,
-            "priority": priority,
-            "tags": tags,
-        }
-    )
-
-    save_json_with_export(NOTES_STORE_FILE, notes)
+    with transaction(NOTES_STORE_FILE, []) as doc:
+        doc.data.append(
+            {
+                "id": note_id,
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                "content": content,
+                "priority": priority,
+                "tags": tags,
+            }
+        )
+        notes = doc.data
+
+    export_notes_to_obsidian(list(notes))
     sync_instructions_with_store()
     return note_id
 
 
 def delete_note(note_id):
-    notes = load_json(NOTES_STORE_FILE, [])
-    initial_len = len(notes)
-    notes = [n for n in notes if n.get("id") != note_id]
+    with transaction(NOTES_STORE_FILE, []) as doc:
+        initial_len = len(doc.data)
+        doc.data = [n for n in doc.data if n.get("id") != note_id]
+        notes = doc.data
 
     if len(notes) < initial_len:
-        save_json_with_export(NOTES_STORE_FILE, notes)
+        export_notes_to_obsidian(list(notes))
         sync_instructions_with_store()
         return True
     return False
@@ -599,21 +604,13 @@ def perform_session_synthesis():
         )
         if diary_content:
             today_str = datetime.now().strftime("%Y-%m-%d")
-            diary_store = load_json(DIARY_STORE_FILE, [])
-            # Check for existing
-            existing_idx = next(
-                (i for i, d in enumerate(diary_store) if d["date"] == today_str), None
-            )
             entry = {
                 "date": today_str,
                 "content": diary_content,
                 "timestamp": int(datetime.now().timestamp()),
             }
-            if existing_idx is not None:
-                diary_store[existing_idx] = entry
-            else:
-                diary_store.append(entry)
-            save_json_with_export(DIARY_STORE_FILE, diary_store)
+            with transaction(DIARY_STORE_FILE, []) as doc:
+                upsert_diary_entry(doc.data, entry)
             export_diary_to_obsidian()
             add_memory(
                 {
@@ -623,7 +620,7 @@ def perform_session_synthesis():
             )
 
         # 2. Personality Evolution (The core upgrade)
-        memories = load_json(MEMORY_STORE_FILE, [])
+        memories = load_active_memories()
         current_persona = load_json(PERSONA_CORE_FILE, {"narrative": "I am Mimi."})
 
         new_narrative = mimi_deepseek_integration.evolve_personality_narrative(
@@ -631,9 +628,10 @@ def perform_session_synthesis():
         )
 
         if new_narrative:
-            current_persona["narrative"] = new_narrative
-            current_persona["last_updated"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-            save_json_with_export(PERSONA_CORE_FILE, current_persona)
+            # Re-read under the lock: the model call above can take a while
+            with transaction(PERSONA_CORE_FILE, {}) as doc:
+                doc.data["narrative"] = new_narrative
+                doc.data["last_updated"] = datetime.now().strftime("%Y-%m-%d %H:%M")
             print("[Evolution] Personality core updated.")
             sync_instructions_with_store()
 
@@ -665,9 +663,10 @@ def process_file(thread_file, processed_ids, last_user_messages):
                     last_activity_time = time.time()
                     synthesis_pending = True
 
+                    # Bumped per message; only this process writes it
                     c = load_json(COUNTER_FILE, {"count": 0})
                     c["count"] += 1
-                    save_json(COUNTER_FILE, c)
+                    save_doc(COUNTER_FILE, c, delay=WRITE_BEHIND_SECONDS)
                     check_profiling_trigger()
 
                     if msg.get("role") == "user":
@@ -717,11 +716,9 @@ def import_memories_from_obsidian():
         return
 
     md_mtime = os.path.getmtime(OBSIDIAN_MEMORY_FILE)
-    json_mtime = (
-        os.path.getmtime(MEMORY_STORE_FILE) if os.path.exists(MEMORY_STORE_FILE) else 0
-    )
+    store_mtime = get_memory_db().modified(ACTIVE)
 
-    if md_mtime <= json_mtime:
+    if md_mtime <= store_mtime:
         return
 
     print("Obsidian memories are newer. Importing...")
@@ -760,7 +757,7 @@ def import_memories_from_obsidian():
             # Simple merge: replace if same content or just use the new list
             # For simplicity and given the user's "sync" request, we replace with the Obsidian version
             # as it's the "newer" source.
-            save_json_with_export(MEMORY_STORE_FILE, new_memories)
+            save_active_memories(new_memories)
             print(f"Imported {len(new_memories)} memories from Obsidian.")
     except Exception as e:
         print(f"Failed to import memories from Obsidian: {e}")
@@ -773,7 +770,7 @@ def watch_threads():
     import_memories_from_obsidian()  # NEW: Import first if needed
     export_diary_to_obsidian()
     export_notes_to_obsidian()
-    memories = load_json(MEMORY_STORE_FILE, [])
+    memories = load_active_memories()
     export_memories_to_obsidian(memories)
     sync_sessions_to_obsidian()  # Sync session files to Obsidian
 
@@ -803,6 +800,17 @@ def watch_threads():
             if loop_count % 30 == 0:
                 check_and_compress()
 
+            # Daily: drop orphan vectors, embed archive items that have none
+            if mimi_embeddings and loop_count % 1440 == 1:
+                report = mimi_embeddings.reconcile_memory_vectors()
+                if report["orphans"] or report["missing"]:
+                    print(
+                        "[Maintenance] "
+                        + mimi_embeddings.format_reconcile_report(report).replace(
+                            "\n", "; "
+                        )
+                    )
+
             loop_count += 1
         except Exception as e:
             print(f"Watcher loop error: {e}")
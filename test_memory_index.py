@@ -0,0 +1,1420 @@
+import json
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.insert(0, "/home/kuumin/Projects/mimi-cli")
+
+from mimi_lib.memory import (
+    embeddings,
+    lexical,
+    near_dup,
+    vault_indexer,
+    vault_store,
+    vault_watcher,
+)
+from mimi_lib.memory.memory_db import ACTIVE, ARCHIVE, MemoryDB
+from mimi_lib.memory import retrieval
+from mimi_lib.memory.retrieval import RetrievalHit, RetrievalHits, fuse
+from mimi_lib.memory.timeline import DiaryIndex, parse_time_range
+from mimi_lib.utils import docstore
+from mimi_lib.utils.lease import FileLease, LeaseLost
+from mimi_lib.memory.embedding_cache import EmbeddingCache
+from mimi_lib.tools import memory_tools, skill_tools
+from mimi_lib.memory.embeddings import (
+    BACKGROUND,
+    FOREGROUND,
+    EmbeddingClient,
+    TokenBucket,
+    _retry_after,
+)
+from mimi_lib.memory.vector_store import MemoryVectorStore
+
+
+class TestMemoryVectorStore(unittest.TestCase):
+    """Test the matrix-backed memory vector store."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "vectors.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_search_ranks_by_cosine(self):
+        store = MemoryVectorStore(self.path)
+        store.add(1, [1.0, 0.0, 0.0])
+        store.add(2, [0.7, 0.7, 0.0])
+        store.add(3, [0.0, 0.0, 1.0])
+        hits = store.search([1.0, 0.1, 0.0], top_k=2)
+        self.assertEqual([h[0] for h in hits], ["1", "2"])
+
+    def test_remove_swaps_last_row(self):
+        store = MemoryVectorStore(self.path)
+        for i in range(5):
+            store.add(i, np.eye(5)[i].tolist(), persist=False)
+        store.remove(1, persist=False)
+        self.assertEqual(len(store), 4)
+        self.assertNotIn(1, store)
+        hits = store.search(np.eye(5)[4].tolist(), top_k=1)
+        self.assertEqual(hits[0][0], "4")
+
+    def test_reloads_when_file_changes(self):
+        store = MemoryVectorStore(self.path)
+        store.add(1, [1.0, 0.0])
+        other = MemoryVectorStore(self.path)
+        other.add(2, [0.0, 1.0])
+        self.assertIn(2, store)
+        self.assertEqual(len(store), 2)
+
+    def test_writers_in_parallel_keep_each_others_rows(self):
+        # e.g. the CLI saving a memory while the watcher adds another
+        stores = [MemoryVectorStore(self.path), MemoryVectorStore(self.path)]
+
+        def write(n):
+            for i in range(20):
+                stores[n].add(f"{n}-{i}", [1.0, float(i)])
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in (0, 1)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(MemoryVectorStore(self.path)), 40)
+        self.assertEqual([n for n in os.listdir(self.tmp.name) if "tmp" in n], [])
+
+    def test_saves_append_to_the_log(self):
+        store = MemoryVectorStore(self.path)
+        store.replace({"1": [1.0, 0.0]}, ("m", 2))
+        snapshot = self.path.stat()
+        other = MemoryVectorStore(self.path)
+        self.assertEqual(len(other), 1)
+
+        store.add(2, [0.0, 1.0])
+        store.remove(1)
+        log = self.path.with_suffix(".log").read_text().splitlines()
+        self.assertEqual([json.loads(line)["op"] for line in log], ["put", "del"])
+        self.assertEqual(self.path.stat().st_mtime_ns, snapshot.st_mtime_ns)
+        self.assertEqual(other.ids(), ["2"])  # Replays just the new lines
+
+        # A torn line from a crash is skipped, then overwritten by the next put
+        with open(self.path.with_suffix(".log"), "a") as f:
+            f.write('{"op": "put", "id": "9", "v": [1.')
+        self.assertEqual(MemoryVectorStore(self.path).ids(), ["2"])
+        store.add(3, [1.0, 1.0])
+        self.assertEqual(sorted(MemoryVectorStore(self.path).ids()), ["2", "3"])
+
+        with patch("mimi_lib.memory.vector_store.COMPACT_LOG_MIN_BYTES", 0):
+            store.add(4, [1.0, 2.0])
+        self.assertFalse(self.path.with_suffix(".log").exists())
+        self.assertEqual(sorted(MemoryVectorStore(self.path).ids()), ["2", "3", "4"])
+
+    def test_snapshot_is_rounded_to_float32_precision(self):
+        rng = np.random.default_rng(1)
+        vectors = {str(i): rng.normal(size=64).tolist() for i in range(4)}
+        store = MemoryVectorStore(self.path)
+        store.replace(vectors, ("m", None))
+        full = json.dumps(store._matrix[:4].tolist())
+        self.assertLess(self.path.stat().st_size, 0.7 * len(full))
+        written = json.loads(self.path.read_text())["vectors"]
+        rows = np.asarray([written[i] for i in store.ids()], dtype=np.float32)
+        self.assertLess(np.abs(rows - store._matrix[:4]).max(), 1e-8)
+
+    def test_empty_update_leaves_the_files_alone(self):
+        store = MemoryVectorStore(self.path)
+        store.replace({"1": [1.0, 0.0]}, ("m", 2))
+        store.add(2, [0.0, 1.0])
+        before = (self.path.stat().st_mtime_ns, self.path.with_suffix(".log").exists())
+        self.assertEqual(store.update(add={}, remove=[]), (0, 0))
+        after = (self.path.stat().st_mtime_ns, self.path.with_suffix(".log").exists())
+        self.assertEqual(after, before)
+
+    def test_vector_lock_does_not_block_documents(self):
+        notes = Path(self.tmp.name) / "notes.json"
+        done = threading.Event()
+        with docstore.file_lock(self.path):
+            t = threading.Thread(
+                target=lambda: (docstore.save_doc(notes, [1]), done.set())
+            )
+            t.start()
+            self.assertTrue(done.wait(2))
+        t.join()
+
+    def test_legacy_file_keeps_legacy_spec(self):
+        self.path.write_text('{"1": [1.0, 0.0]}')
+        store = MemoryVectorStore(self.path)
+        self.assertEqual(store.spec, ("openai/text-embedding-3-small", None))
+        store.replace({"1": [0.0, 1.0]}, ("m", 2))
+        self.assertEqual(MemoryVectorStore(self.path).spec, ("m", 2))
+
+
+class TestVaultStore(unittest.TestCase):
+    """Test the binary, memmapped vault index."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        index_dir = Path(self.tmp.name) / "vault_index"
+        self.patches = [
+            patch.object(vault_store, "VAULT_INDEX_DIR", index_dir),
+            patch.object(vault_store, "HEADER_FILE", index_dir / "header.json"),
+            patch.object(vault_store, "JOURNAL_FILE", index_dir / "journal.log"),
+            patch.object(vault_store, "_JOURNAL_END", None),
+            patch.object(
+                vault_store, "VAULT_VECTORS_FILE", Path(self.tmp.name) / "none.json"
+            ),
+            patch.object(vault_store, "_INDEX_CACHE", None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_round_trip_and_search(self):
+        entries = {
+            "a.md": [
+                {"chunk_index": 0, "text": "alpha", "embedding": [1.0, 0.0]},
+                {"chunk_index": 1, "text": "ünïcode", "embedding": [0.0, 2.0]},
+            ],
+            "b.md": [{"chunk_index": 0, "text": "beta", "embedding": [1.0, 1.0]}],
+        }
+        vault_store.write_vault_index(entries)
+        index = vault_store.load_vault_index()
+        self.assertEqual(index.count, 3)
+
+        row, score = index.search([0.0, 1.0], top_k=1)[0]
+        self.assertEqual(index.path_of(row), "a.md")
+        self.assertEqual(index.text_of(row), "ünïcode")
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_scoped_search_over_base_and_journal(self):
+        vec = {"chunk_index": 0, "text": "x", "embedding": [1.0, 0.0]}
+        vault_store.write_vault_index(
+            {"Mimi/Sessions/s.md": [vec], "Uni/Math/m.md": [vec], "old.md": [vec]},
+            notes={
+                "Mimi/Sessions/s.md": {"mtime": 100.0, "tags": ["diary"], "keys": []},
+                "Uni/Math/m.md": {"mtime": 200.0, "tags": ["course/math"]},
+            },
+        )
+        vault_store.journal_put(
+            "Uni/new.md", [vec], note={"mtime": 300.0, "tags": ["course"]}
+        )
+        index = vault_store.load_vault_index()
+
+        def paths(**scope):
+            return sorted(h["path"] for h in index.search_chunks([1, 0], 10, 0, scope))
+
+        self.assertEqual(paths(path_prefix="Uni"), ["Uni/Math/m.md", "Uni/new.md"])
+        self.assertEqual(paths(tags=["course"]), ["Uni/Math/m.md", "Uni/new.md"])
+        self.assertEqual(paths(after=150.0, before=250.0), ["Uni/Math/m.md"])
+        self.assertEqual(paths(path_prefix="Mimi/Sess"), [])
+        self.assertEqual(index.paths_missing_notes(), ["old.md"])
+
+        # Compaction carries the journaled note into the base columns
+        vault_store.compact_vault_index()
+        index = vault_store.load_vault_index()
+        self.assertEqual(index.note_for("Uni/new.md")["tags"], ["course"])
+        self.assertEqual(paths(tags=["course"]), ["Uni/Math/m.md", "Uni/new.md"])
+
+    def test_sharded_scoring_matches_single_thread(self):
+        rng = np.random.default_rng(1)
+        entries = {
+            f"n{i}.md": [{"chunk_index": 0, "text": str(i), "embedding": v}]
+            for i, v in enumerate(rng.standard_normal((300, 8)))
+        }
+        vault_store.write_vault_index(entries)
+        vault_store.journal_delete("n7.md")
+        index = vault_store.load_vault_index()
+        q = rng.standard_normal(8)
+        expected = index.search(q, top_k=10)
+        with patch.object(vault_store, "VAULT_SHARD_ROWS", 64), patch.object(
+            vault_store, "VAULT_SEARCH_WORKERS", 3
+        ):
+            sharded = index.search(q, top_k=10)
+        self.assertEqual([r for r, _ in sharded], [r for r, _ in expected])
+        np.testing.assert_allclose(
+            [s for _, s in sharded], [s for _, s in expected], rtol=1e-5
+        )
+        self.assertNotIn("n7.md", [index.path_of(r) for r, _ in expected])
+
+    def test_new_generation_replaces_old_files(self):
+        one = {"a.md": [{"chunk_index": 0, "text": "x", "embedding": [1.0, 0.0]}]}
+        vault_store.write_vault_index(one)
+        vault_store.write_vault_index(vault_store.load_vault_entries())
+        index = vault_store.load_vault_index()
+        self.assertEqual(index.generation, 2)
+        leftovers = list(vault_store.VAULT_INDEX_DIR.glob("*.1.*"))
+        self.assertEqual(leftovers, [])
+
+    def test_journal_overlays_base_and_survives_torn_tail(self):
+        base = {
+            "a.md": [{"chunk_index": 0, "text": "old a", "embedding": [1.0, 0.0]}],
+            "b.md": [{"chunk_index": 0, "text": "b", "embedding": [0.0, 1.0]}],
+        }
+        vault_store.write_vault_index(base)
+        vault_store.journal_put(
+            "a.md",
+            [{"chunk_index": 0, "text": "new a", "embedding": [0.0, 1.0]}],
+            {"mtime": 2},
+        )
+        vault_store.journal_delete("b.md")
+        with open(vault_store.JOURNAL_FILE, "ab") as f:
+            f.write(b"MVJ1\x10\x00")  # Killed mid-append
+
+        index = vault_store.load_vault_index()
+        hits = index.search_chunks([0.0, 1.0], top_k=5)
+        self.assertEqual([(h["path"], h["text"]) for h in hits], [("a.md", "new a")])
+        self.assertEqual(index.journal_logs, {"a.md": {"mtime": 2}, "b.md": None})
+
+        vault_store.journal_put(
+            "c.md", [{"chunk_index": 0, "text": "c", "embedding": [1.0, 1.0]}]
+        )
+        self.assertEqual(
+            sorted(vault_store.load_vault_index().indexed_paths()), ["a.md", "c.md"]
+        )
+
+    def test_ivf_search_matches_exact_top_hit(self):
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 32))
+        matrix = centers[rng.integers(0, 20, 3000)] + 0.3 * rng.normal(size=(3000, 32))
+        entries = {
+            f"n{i}.md": [{"chunk_index": 0, "text": str(i), "embedding": row}]
+            for i, row in enumerate(matrix)
+        }
+        with patch.object(vault_store, "VAULT_ANN_MIN_CHUNKS", 1000):
+            vault_store.write_vault_index(entries)
+            index = vault_store.load_vault_index()
+        self.assertIsNotNone(index.ivf)
+
+        for i in (0, 1234, 2999):
+            ann = index.search(matrix[i], top_k=1)
+            exact = index.search(matrix[i], top_k=1, exact=True)
+            self.assertEqual(ann[0][0], exact[0][0])
+            self.assertEqual(index.text_of(ann[0][0]), str(i))
+
+    def test_int8_first_pass_keeps_results(self):
+        rng = np.random.default_rng(2)
+        matrix = rng.normal(size=(2000, 64))
+        entries = {
+            f"n{i}.md": [{"chunk_index": 0, "text": str(i), "embedding": row}]
+            for i, row in enumerate(matrix)
+        }
+        with patch.object(vault_store, "VAULT_INT8", True):
+            vault_store.write_vault_index(entries)
+        index = vault_store.load_vault_index()
+        self.assertEqual(index.codes.dtype, np.uint8)
+
+        for q in rng.normal(size=(5, 64)):
+            fast = index.search(q, top_k=5)
+            exact = index.search(q, top_k=5, exact=True)
+            self.assertEqual([r for r, _ in fast], [r for r, _ in exact])
+            self.assertAlmostEqual(fast[0][1], exact[0][1], places=5)
+
+    def test_compaction_folds_journal(self):
+        vault_store.journal_put(
+            "a.md", [{"chunk_index": 0, "text": "a", "embedding": [1.0, 0.0]}]
+        )
+        vault_store.compact_vault_index()
+        self.assertEqual(vault_store.journal_size(), 0)
+        index = vault_store.load_vault_index()
+        self.assertEqual((index.count, index.paths), (1, ["a.md"]))
+
+    def test_tombstones_count_as_dead_rows(self):
+        entry = {"chunk_index": 0, "text": "a", "embedding": [1.0, 0.0]}
+        vault_store.write_vault_index({"a.md": [entry], "b.md": [entry, entry]})
+        vault_store.journal_delete("b.md")
+        index = vault_store.load_vault_index()
+        self.assertEqual((index.dead_rows, index.indexed_paths()), (2, ["a.md"]))
+        vault_store.compact_vault_index()
+        index = vault_store.load_vault_index()
+        self.assertEqual((index.dead_rows, index.count), (0, 1))
+
+    def test_journal_refuses_other_spec(self):
+        entry = {"chunk_index": 0, "text": "a", "embedding": [1.0, 0.0]}
+        vault_store.write_vault_index({"a.md": [entry]}, ("m", 2))
+        vault_store.journal_put("b.md", [entry], {"mtime": 1}, ("m", 2))
+        vault_store.journal_put("c.md", [entry], {"mtime": 1}, ("other", 2))
+        index = vault_store.load_vault_index()
+        self.assertEqual(index.spec, ("m", 2))
+        self.assertEqual(sorted(index.indexed_paths()), ["a.md", "b.md"])
+        self.assertNotIn("c.md", index.journal_logs)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Test the content-addressed SQLite embedding cache."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "cache.sqlite3"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_keyed_by_model_and_text(self):
+        cache = EmbeddingCache(self.path)
+        cache.put("m1", "hello", [0.5, 0.25])
+        self.assertEqual(cache.get("m1", "hello"), [0.5, 0.25])
+        self.assertIsNone(cache.get("m2", "hello"))
+        self.assertIsNone(cache.get("m1", "hello "))
+
+    def test_get_many_maps_positions(self):
+        cache = EmbeddingCache(self.path)
+        cache.put_many("m", ["a", "b"], [[1.0], [2.0]])
+        self.assertEqual(cache.get_many("m", ["b", "x", "a"]), {0: [2.0], 2: [1.0]})
+
+    def test_evicts_least_recently_used(self):
+        cache = EmbeddingCache(self.path, max_bytes=64 * 1024)
+        vec = [0.0] * 256
+        cache.put("m", "keep", vec)
+        cache._conn.execute("UPDATE embeddings SET last_used = 2000000000")
+        for i in range(300):
+            cache.put("m", f"filler {i}", vec)
+        self.assertIsNotNone(cache.get("m", "keep"))
+        self.assertIsNone(cache.get("m", "filler 0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestLexicalIndex(unittest.TestCase):
+    """Test the BM25 recall index and its archive sync."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = MemoryDB(Path(self.tmp.name) / "memories.sqlite3", ())
+        self.patch = patch.object(lexical, "get_memory_db", lambda: self.db)
+        self.patch.start()
+        self.index = lexical.LexicalIndex(Path(self.tmp.name) / "lexical.json")
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def test_rare_terms_outrank_common_ones(self):
+        items = [
+            {"id": 1, "content": "Kuumin likes coffee in the morning"},
+            {"id": 2, "content": "Kuumin adopted a cat named Miso"},
+            {"id": 3, "content": "Kuumin went to the coffee shop"},
+        ]
+        for item in items:
+            self.db.add(item, ARCHIVE)
+        hits = self.index.search("what is Kuumin's cat called?", top_k=3)
+        self.assertEqual(hits[0][0]["id"], 2)
+        self.assertEqual(self.index.search("the about", top_k=3), [])
+
+    def test_incremental_updates_and_reload(self):
+        self.index.search("moog")  # Synced with the (empty) archive
+        item = {"id": 7, "content": "favourite synth is a Moog"}
+        self.db.add(item, ARCHIVE)
+        self.index.add(item)
+        self.assertEqual(self.index.search("moog")[0][0]["id"], 7)
+        self.assertFalse(self.index.path.exists())  # Saved after a delay
+        self.index.flush()
+        reloaded = lexical.LexicalIndex(self.index.path)
+        self.assertEqual(reloaded.search("moog")[0][0]["id"], 7)
+        self.db.delete(7, ARCHIVE)
+        reloaded.remove(7)
+        self.assertEqual(reloaded.search("moog"), [])
+
+    def test_other_writers_are_not_skipped(self):
+        self.index.search("moog")
+        # The watcher saves a memory, then this process saves its own
+        self.db.add({"id": 1, "content": "Kuumin bought a Moog"}, ARCHIVE)
+        item = {"id": 2, "content": "Kuumin plays the Moog daily"}
+        self.db.add(item, ARCHIVE)
+        self.index.add(item)
+        self.assertEqual(
+            sorted(hit["id"] for hit, _ in self.index.search("moog")), [1, 2]
+        )
+        self.index.flush()
+
+
+class TestMemoryDB(unittest.TestCase):
+    """Test the SQLite memory store and its JSON migration."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_content_hash_dedupes_per_store(self):
+        db = MemoryDB(self.dir / "m.sqlite3", ())
+        item = {"id": 5, "timestamp": "2026-01-01 10:00", "content": "likes tea"}
+        self.assertEqual(db.add(item, ARCHIVE), (5, True))
+        self.assertEqual(db.add(dict(item, id=9), ARCHIVE), (5, False))
+        self.assertEqual(db.add(item, ACTIVE), (5, True))
+        version = db.version(ARCHIVE)
+        self.assertTrue(db.delete(5, ARCHIVE))
+        self.assertGreater(db.version(ARCHIVE), version)
+        self.assertEqual(db.load(ARCHIVE), [])
+        self.assertEqual(db.get_many([5, "x"], ACTIVE)["5"]["content"], "likes tea")
+
+    def test_version_only_moves_when_rows_change(self):
+        db = MemoryDB(self.dir / "m.sqlite3", ())
+        item = {"id": 5, "timestamp": "2026-01-01 10:00", "content": "likes tea"}
+        db.add(item, ARCHIVE)
+        version = db.version(ARCHIVE)
+        db.add(dict(item, id=9), ARCHIVE)  # Duplicate content
+        self.assertFalse(db.delete(42, ARCHIVE))
+        self.assertFalse(db.update_content(42, "likes coffee", ARCHIVE))
+        self.assertEqual(db.version(ARCHIVE), version)
+        self.assertTrue(db.update_content(5, "likes green tea", ARCHIVE))
+        self.assertEqual(db.version(ARCHIVE), version + 1)
+
+    def test_json_files_are_migrated_once(self):
+        archive = self.dir / "archive.json"
+        items = [
+            {"id": 1, "timestamp": "t", "content": "a", "category": "Mimi"},
+            {"id": 2, "timestamp": "t", "content": "a"},
+            {"id": 3, "timestamp": "t", "content": "b", "pinned": True},
+        ]
+        archive.write_text(json.dumps(items))
+        db = MemoryDB(self.dir / "m.sqlite3", ((ARCHIVE, archive),))
+        loaded = db.load(ARCHIVE)
+        self.assertEqual([m["id"] for m in loaded], [1, 3])
+        self.assertEqual(loaded[0]["category"], "Mimi")
+        self.assertTrue(loaded[1]["pinned"])
+        self.assertFalse(archive.exists())
+
+        # A reopened DB must not import a recreated file again
+        archive.write_text(json.dumps([{"id": 4, "timestamp": "t", "content": "c"}]))
+        reopened = MemoryDB(self.dir / "m.sqlite3", ((ARCHIVE, archive),))
+        self.assertEqual(len(reopened.load(ARCHIVE)), 2)
+
+
+class TestNearDuplicates(unittest.TestCase):
+    """Test MinHash/LSH near-duplicate detection over the archive."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = MemoryDB(Path(self.tmp.name) / "m.sqlite3", ())
+        self.patch = patch.object(near_dup, "get_memory_db", lambda: self.db)
+        self.patch.start()
+        self.index = near_dup.NearDupIndex()
+        self.store = MemoryVectorStore(Path(self.tmp.name) / "vectors.json")
+        for i, text in enumerate(
+            [
+                "Kuumin prefers dark mode in all of his editors",
+                "Kuumin has a Linear Algebra exam on March 3rd",
+                "Kuumin adopted a cat named Miso",
+            ]
+        ):
+            self.db.add({"id": i, "timestamp": "t", "content": text}, ARCHIVE)
+            self.store.add(i, [float(i == j) for j in range(3)])
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def find(self, text, vector=None):
+        calls = []
+
+        def embed():
+            calls.append(text)
+            return vector
+
+        found = near_dup.find_near_duplicate(text, embed, self.store, self.index)
+        return (found[0]["id"] if found else None), len(calls)
+
+    def test_restatements_are_caught(self):
+        # Near-verbatim: MinHash alone decides, no embedding needed
+        self.assertEqual(self.find("Kuumin prefers dark mode in all editors."), (0, 0))
+        # Same fact, reworded: a weak candidate confirmed by its embedding
+        text = "Kuumin's exam for Linear Algebra is on March 3rd"
+        self.assertEqual(self.find(text, [0.05, 1.0, 0.0]), (1, 1))
+        self.assertEqual(self.find(text, [1.0, 0.2, 0.0])[0], None)
+        self.assertEqual(self.find("Kuumin went to the coffee shop"), (None, 0))
+
+    def test_corrections_are_not_merged(self):
+        self.db.add(
+            {"id": 3, "timestamp": "t", "content": "Kuumin is allergic to peanuts"},
+            ARCHIVE,
+        )
+        self.store.add(3, [0.0, 1.0, 1.0])
+        same = [0.0, 1.0, 1.0]  # Embeddings barely notice a "not"
+        self.assertEqual(self.find("Kuumin is allergic to peanuts!", same)[0], 3)
+        self.assertEqual(self.find("Kuumin is not allergic to peanuts", same)[0], None)
+        self.assertEqual(self.find("Kuumin isn't allergic to peanuts", same)[0], None)
+        text = "Kuumin has a Linear Algebra exam on March 5th"
+        self.assertEqual(self.find(text, [0.0, 1.0, 0.0])[0], None)
+
+    def test_index_follows_other_writers(self):
+        self.assertEqual(self.find("Kuumin adopted a cat named Miso!")[0], 2)
+        self.db.delete(2, ARCHIVE)  # e.g. the watcher
+        self.assertEqual(self.find("Kuumin adopted a cat named Miso!")[0], None)
+
+        # The watcher writes right before this process saves (and adopts)
+        self.db.add({"id": 4, "timestamp": "t", "content": "Kuumin owns a Moog"})
+        item = {"id": 5, "timestamp": "t", "content": "Kuumin learned to juggle"}
+        self.db.add(item, ARCHIVE)
+        self.index.add(item)
+        self.assertEqual(self.find("Kuumin owns a Moog.")[0], 4)
+
+
+class TestReconcile(unittest.TestCase):
+    """Test reconciling the memory vector store against the archive."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = MemoryDB(Path(self.tmp.name) / "m.sqlite3", ())
+        self.store = MemoryVectorStore(Path(self.tmp.name) / "vectors.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_orphans_dropped_and_missing_embedded(self):
+        for i in (1, 2, 3):
+            self.db.add({"id": i, "timestamp": "t", "content": f"m{i}"}, ARCHIVE)
+        self.store.add(1, [1.0, 0.0])
+        self.store.add(99, [0.0, 1.0])  # Deleted from the archive long ago
+
+        calls = []
+
+        def fake_embeddings(texts, spec=None, priority=None):
+            calls.append(list(texts))
+            return [[0.5, 0.5] if t == "m2" else None for t in texts]
+
+        with patch.object(embeddings, "get_embeddings", fake_embeddings):
+            dry = embeddings.reconcile_memory_vectors(self.store, self.db, True)
+            self.assertEqual((dry["orphans"], dry["missing"]), (1, 2))
+            self.assertEqual(sorted(self.store.ids()), ["1", "99"])
+            report = embeddings.reconcile_memory_vectors(self.store, self.db)
+
+        self.assertEqual(calls, [["m2", "m3"]])
+        self.assertEqual((report["embedded"], report["failed"]), (1, 1))
+        reloaded = MemoryVectorStore(self.store.path)
+        self.assertEqual(sorted(reloaded.ids()), ["1", "2"])
+
+    def test_memory_saved_during_the_scan_is_kept(self):
+        self.db.add({"id": 1, "timestamp": "t", "content": "m1"}, ARCHIVE)
+        self.store.add(1, [1.0, 0.0])
+        load = self.db.load
+
+        def load_then_save(store):
+            snapshot = load(store)
+            # The CLI saves a memory right after the archive was read
+            self.db.add({"id": 7, "timestamp": "t", "content": "m7"}, ARCHIVE)
+            MemoryVectorStore(self.store.path).add(7, [0.0, 1.0])
+            return snapshot
+
+        with patch.object(self.db, "load", load_then_save):
+            report = embeddings.reconcile_memory_vectors(self.store, self.db)
+        self.assertEqual(report["orphans"], 0)
+        self.assertEqual(sorted(MemoryVectorStore(self.store.path).ids()), ["1", "7"])
+
+    def test_writes_during_embedding_survive(self):
+        self.db.add({"id": 1, "timestamp": "t", "content": "m1"}, ARCHIVE)
+        self.store.add(99, [0.0, 1.0])  # Orphan
+        other = MemoryVectorStore(self.store.path)  # e.g. the CLI
+
+        def fake_embeddings(texts, spec=None, priority=None):
+            self.db.add({"id": 5, "timestamp": "t", "content": "m5"}, ARCHIVE)
+            other.add(5, [1.0, 1.0])
+            return [[1.0, 0.0] for _ in texts]
+
+        with patch.object(embeddings, "get_embeddings", fake_embeddings):
+            report = embeddings.reconcile_memory_vectors(self.store, self.db)
+        self.assertEqual((report["orphans"], report["embedded"]), (1, 1))
+        reloaded = MemoryVectorStore(self.store.path)
+        self.assertEqual(sorted(reloaded.ids()), ["1", "5"])
+
+
+class TestTimeline(unittest.TestCase):
+    """Test temporal phrase parsing and the time-range lookups."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_phrases_become_windows(self):
+        now = datetime(2026, 3, 18, 15, 30)  # A Wednesday
+        cases = {
+            "what did we do last week?": ("2026-03-09", "2026-03-16"),
+            "anything yesterday": ("2026-03-17", "2026-03-18"),
+            "back in January": ("2026-01-01", "2026-02-01"),
+            "march 2025": ("2025-03-01", "2025-04-01"),
+            "on monday": ("2026-03-16", "2026-03-17"),
+        }
+        for text, (start, end) in cases.items():
+            span = parse_time_range(text, now)
+            self.assertEqual(span.start.strftime("%Y-%m-%d"), start, text)
+            self.assertEqual(span.end.strftime("%Y-%m-%d"), end, text)
+        self.assertIsNone(parse_time_range("may I ask something", now))
+
+    def test_range_and_latest_queries(self):
+        db = MemoryDB(self.dir / "m.sqlite3", ())
+        for i, ts in enumerate(["2026-03-02 09:00", "2026-03-10 12:00", "2026-03-15"]):
+            db.add({"id": i, "timestamp": ts, "content": f"m{i}"}, ARCHIVE)
+        span = parse_time_range("last week", datetime(2026, 3, 18))
+        hits = db.between(ARCHIVE, span.start, span.end, newest_first=True)
+        self.assertEqual([m["id"] for m in hits], [2, 1])
+        self.assertEqual(db.between(ARCHIVE, limit=1, newest_first=True)[0]["id"], 2)
+
+        diary_path = self.dir / "diary.json"
+        diary_path.write_text(
+            json.dumps(
+                [{"date": d, "content": d} for d in ["2026-03-15", "2026-03-01"]]
+            )
+        )
+        diary = DiaryIndex(diary_path)
+        self.assertEqual(
+            [e["date"] for e in diary.between(span.start, span.end)], ["2026-03-15"]
+        )
+        self.assertEqual(diary.latest(5)[-1]["date"], "2026-03-01")
+
+    def _lanes_with(self, memories, diary):
+        index = DiaryIndex(self.dir / "diary.json")
+        (self.dir / "diary.json").write_text(json.dumps(diary))
+        return (
+            patch.object(retrieval, "memories_between", lambda *a, **k: memories),
+            patch.object(retrieval, "get_diary_index", lambda: index),
+        )
+
+    def test_temporal_lane_mixes_memories_and_diary(self):
+        # Diary entries carry an epoch int timestamp, memories a string
+        memories = [
+            {"id": 1, "timestamp": "2026-03-12 09:00", "content": "m1"},
+            {"id": 2, "timestamp": "2026-03-14 18:00", "content": "m2"},
+        ]
+        diary = [{"date": "2026-03-13", "timestamp": 1773360000, "content": "d"}]
+        span = parse_time_range("last week", datetime(2026, 3, 18))
+        mem_patch, diary_patch = self._lanes_with(memories, diary)
+        with mem_patch, diary_patch:
+            hits = retrieval._temporal_lane(span, 8)
+        self.assertEqual([h.text for h in hits], ["m2", "d", "m1"])
+
+    def test_only_explicit_ranges_filter_other_lanes(self):
+        old = {"id": 7, "timestamp": "2025-01-01 10:00", "content": "homework"}
+        lexical_lane = lambda query, depth: [
+            RetrievalHit("memory", old["content"], item=old, lanes={"lexical": 1.0})
+        ]
+        mem_patch, diary_patch = self._lanes_with([], [])
+        with mem_patch, diary_patch, patch.object(
+            retrieval, "_lexical_lane", lexical_lane
+        ):
+            lanes = (retrieval.LEXICAL, retrieval.TEMPORAL)
+            hits = retrieval.retrieve("help with my homework today?", lanes=lanes)
+            self.assertEqual([h.item["id"] for h in hits], [7])
+            span = parse_time_range("last week", datetime(2026, 3, 18))
+            hits = retrieval.retrieve("homework", lanes=lanes, time_range=span)
+            self.assertEqual(hits, [])
+
+
+class TestDocStore(unittest.TestCase):
+    """Test atomic writes, locked transactions and write-behind."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "notes.json"
+
+    def tearDown(self):
+        docstore.flush()
+        self.tmp.cleanup()
+
+    def test_transactions_see_outside_writes(self):
+        with docstore.transaction(self.path, []) as doc:
+            doc.data.append(1)
+        self.assertEqual(docstore.load_doc(self.path), [1])
+
+        # Another process replaces the file (new inode): the cache must notice
+        tmp = self.path.with_name("other.json")
+        tmp.write_text("[1, 2]")
+        os.replace(tmp, self.path)
+        with docstore.transaction(self.path, []) as doc:
+            doc.data.append(3)
+        self.assertEqual(json.loads(self.path.read_text()), [1, 2, 3])
+
+        # Callers get copies, and a failed transaction writes nothing
+        docstore.load_doc(self.path).append("leak")
+        with self.assertRaises(RuntimeError):
+            with docstore.transaction(self.path) as doc:
+                doc.data.append("half")
+                raise RuntimeError
+        self.assertEqual(docstore.load_doc(self.path), [1, 2, 3])
+
+    def test_write_behind_coalesces_until_flush(self):
+        docstore.save_doc(self.path, {"count": 1}, delay=60)
+        docstore.save_doc(self.path, {"count": 2}, delay=60)
+        self.assertFalse(self.path.exists())
+        self.assertEqual(docstore.load_doc(self.path), {"count": 2})
+        docstore.flush(self.path)
+        self.assertEqual(json.loads(self.path.read_text()), {"count": 2})
+
+
+class TestFusion(unittest.TestCase):
+    """Test reciprocal-rank fusion across retrieval lanes."""
+
+    def test_hits_found_by_several_lanes_rise(self):
+        a = {"id": 1, "content": "a"}
+        b = {"id": 2, "content": "b"}
+        vector_lane = [
+            RetrievalHit("memory", "b", item=b, lanes={"memory": 0.9}),
+            RetrievalHit("memory", "a", item=a, lanes={"memory": 0.8}),
+        ]
+        lexical_lane = [RetrievalHit("memory", "a", item=a, lanes={"lexical": 3.0})]
+        vault_lane = [RetrievalHit("vault", "v", path="n.md", lanes={"vault": 0.7})]
+        hits = fuse([vault_lane, vector_lane, lexical_lane], top_k=3)
+        self.assertEqual(hits[0].item["id"], 1)
+        self.assertEqual(set(hits[0].lanes), {"memory", "lexical"})
+        self.assertEqual(len(hits), 3)
+
+    def test_late_and_failed_lanes_are_reported(self):
+        a = {"id": 1, "content": "a"}
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_lane(query, depth):
+            release.wait(5)
+            return []
+
+        def lexical_lane(query, depth):
+            return [RetrievalHit("memory", "a", item=a, lanes={"lexical": 1.0})]
+
+        with patch.object(retrieval, "_lexical_lane", lexical_lane), patch.object(
+            retrieval, "get_memory_store"
+        ), patch.object(retrieval, "get_embedding", lambda q, spec: None):
+            hits = retrieval.retrieve("a", lanes=(retrieval.MEMORY, retrieval.LEXICAL))
+            self.assertEqual([h.item["id"] for h in hits], [1])
+            # No query vector: the memory lane failed rather than found nothing
+            self.assertEqual(hits.missed, (retrieval.MEMORY,))
+
+            with patch.object(retrieval, "_lexical_lane", slow_lane):
+                hits = retrieval.retrieve("a", lanes=(retrieval.LEXICAL,), budget_ms=20)
+                self.assertEqual(hits.missed, (retrieval.LEXICAL,))
+                self.assertFalse(hits.complete)
+
+
+class TestVaultIndexer(unittest.TestCase):
+    """Test the indexing pipeline end to end against a temporary vault."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self.tmp.name)
+        self.vault = tmp / "vault"
+        self.vault.mkdir()
+        index_dir = tmp / "vault_index"
+        self.watcher = vault_watcher._DirtySet(self.vault)
+        self.watcher.alive = True
+        self.embedded = []  # Texts sent to the provider, per call
+        self.broken = set()  # Notes whose chunks the provider can't embed
+        self.on_embed = None
+        self.patches = [
+            patch.object(vault_store, "VAULT_INDEX_DIR", index_dir),
+            patch.object(vault_store, "HEADER_FILE", index_dir / "header.json"),
+            patch.object(vault_store, "JOURNAL_FILE", index_dir / "journal.log"),
+            patch.object(vault_store, "_JOURNAL_END", None),
+            patch.object(vault_store, "VAULT_VECTORS_FILE", tmp / "none.json"),
+            patch.object(vault_store, "_INDEX_CACHE", None),
+            patch.object(vault_indexer, "VAULT_PATH", self.vault),
+            patch.object(vault_indexer, "VAULT_INDEX_LOG", tmp / "log.json"),
+            patch.object(vault_indexer, "_FULL_SCAN_DONE", False),
+            patch.object(vault_indexer, "current_spec", lambda: ("test", None)),
+            patch.object(vault_indexer, "migrate_memory_vectors", lambda: False),
+            patch.object(vault_indexer, "get_embeddings", self._embed),
+            patch.object(vault_indexer, "get_vault_watcher", lambda: self.watcher),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def _embed(self, texts, spec):
+        self.embedded.append(list(texts))
+        if self.on_embed:
+            self.on_embed()
+        return [
+            None if any(f"File: {n}\n" in t for n in self.broken) else [1.0, len(t)]
+            for t in texts
+        ]
+
+    def _indexed(self):
+        return set(vault_store.load_vault_index().indexed_paths())
+
+    def test_failed_notes_are_retried_next_pass(self):
+        (self.vault / "a.md").write_text("alpha")
+        (self.vault / "b.md").write_text("beta")
+        self.broken = {"b.md"}
+        vault_indexer._run_pass()
+        self.assertEqual(self._indexed(), {"a.md"})
+        self.assertTrue(vault_indexer._FULL_SCAN_DONE)
+
+        # The provider recovers; nothing changed on disk, but b.md is owed
+        self.broken = set()
+        vault_indexer._run_pass()
+        self.assertEqual(self._indexed(), {"a.md", "b.md"})
+        self.assertEqual(self.watcher.drain()[0], set())
+
+    def test_cancelled_pass_keeps_its_paths(self):
+        for name in ("a.md", "b.md"):
+            (self.vault / name).write_text(name)
+        self.on_embed = vault_indexer.cancel_indexing
+        vault_indexer._run_pass()
+        self.assertFalse(vault_indexer._FULL_SCAN_DONE)
+        self.assertEqual(self.watcher.drain()[0], {"a.md", "b.md"})
+
+        # A cancelled dirty-path pass hands its paths back as well
+        vault_indexer._FULL_SCAN_DONE = True
+        self.watcher.mark_dirty({"a.md"})
+        vault_indexer._run_pass()
+        self.assertEqual(self.watcher.drain()[0], {"a.md"})
+
+    def test_only_new_chunks_are_embedded(self):
+        paragraphs = [f"{word} " * 200 for word in ("alpha", "beta", "gamma")]
+        note = self.vault / "session.md"
+        note.write_text("\n\n".join(paragraphs[:2]))
+        vault_indexer._run_pass()
+        self.assertEqual(len(self.embedded[-1]), 2)
+
+        # Appending a paragraph adds one chunk; the other two are reused
+        note.write_text("\n\n".join(paragraphs))
+        self.watcher.mark_dirty({"session.md"})
+        vault_indexer._run_pass()
+        self.assertEqual(len(self.embedded), 2)
+        self.assertEqual(len(self.embedded[-1]), 1)
+        self.assertIn("gamma", self.embedded[-1][0])
+        index = vault_store.load_vault_index()
+        self.assertEqual(len(index.entries_for("session.md")), 3)
+
+        # A forced run re-embeds everything
+        vault_indexer._run_pass(force=True)
+        self.assertEqual(len(self.embedded[-1]), 3)
+
+    def test_index_log_survives_a_failed_compaction(self):
+        (self.vault / "a.md").write_text("alpha")
+        (self.vault / "b.md").write_text("beta")
+        vault_indexer._run_pass()
+        self.embedded.clear()
+        index_log = vault_indexer._load_index_log(vault_store.load_vault_index())
+
+        def crash(notes=None):
+            raise OSError("disk full")
+
+        with patch.object(vault_indexer, "compact_vault_index", crash):
+            with self.assertRaises(OSError):
+                vault_indexer._compact(index_log)
+        log_file = Path(self.tmp.name) / "log.json"
+        self.assertEqual(set(json.loads(log_file.read_text())), {"a.md", "b.md"})
+        self.assertEqual(list(log_file.parent.glob("*.tmp")), [])
+
+        # Nothing is re-embedded after the failed compaction
+        vault_indexer._run_indexing_logic()
+        self.assertEqual(self._indexed(), {"a.md", "b.md"})
+        self.assertEqual(self.embedded, [])
+
+    def test_deleted_note_is_pruned(self):
+        (self.vault / "a.md").write_text("alpha")
+        (self.vault / "b.md").write_text("beta")
+        vault_indexer._run_indexing_logic()
+        self.embedded.clear()
+
+        (self.vault / "b.md").unlink()
+        vault_indexer._run_indexing_logic()
+        self.assertEqual(self._indexed(), {"a.md"})
+        self.assertEqual(vault_store.load_vault_index().entries_for("b.md"), [])
+        self.assertNotIn("b.md", vault_indexer._load_index_log(None))
+        self.assertEqual(self.embedded, [])
+
+    def test_renamed_note_reuses_its_vectors(self):
+        text = "\n\n".join(f"{word} " * 200 for word in ("alpha", "beta"))
+        (self.vault / "draft.md").write_text(text)
+        vault_indexer._run_indexing_logic()
+        before = vault_store.load_vault_index().entries_for("draft.md")
+        self.embedded.clear()
+
+        (self.vault / "draft.md").rename(self.vault / "final.md")
+        # The dirty-path route sees both names, like the watcher reports them
+        vault_indexer._run_indexing_logic(paths={"draft.md", "final.md"})
+        self.assertEqual(self._indexed(), {"final.md"})
+        after = vault_store.load_vault_index().entries_for("final.md")
+        self.assertEqual(
+            [np.asarray(e["embedding"]).tolist() for e in after],
+            [np.asarray(e["embedding"]).tolist() for e in before],
+        )
+        self.assertEqual(self.embedded, [])
+
+        # And the full-scan route
+        (self.vault / "notes").mkdir()
+        (self.vault / "final.md").rename(self.vault / "notes" / "final.md")
+        vault_indexer._run_indexing_logic()
+        self.assertEqual(self._indexed(), {"notes/final.md"})
+        self.assertEqual(self.embedded, [])
+
+
+class TestVaultWatcher(unittest.TestCase):
+    """Test dirty-path collection for the vault indexer."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name) / "vault"
+        (self.root / "sub").mkdir(parents=True)
+        (self.root / "old.md").write_text("old")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_polling_diffs_against_persisted_snapshot(self):
+        snapshot = Path(self.tmp.name) / "snapshot.json"
+        watcher = vault_watcher.PollingWatcher(self.root, snapshot)
+        watcher.poll()
+        self.assertEqual(watcher.drain()[0], {"old.md"})
+
+        (self.root / "sub" / "new.md").write_text("new")
+        (self.root / ".hidden.md").write_text("skip")
+        restarted = vault_watcher.PollingWatcher(self.root, snapshot)
+        restarted.poll()
+        self.assertEqual(restarted.drain()[0], {os.path.join("sub", "new.md")})
+
+    def test_polling_survives_failed_snapshot_writes(self):
+        snapshot = Path(self.tmp.name) / "snapshot.json"
+        watchers = [vault_watcher.PollingWatcher(self.root, snapshot) for _ in "ab"]
+        errors = []
+
+        def save(watcher):
+            try:
+                for _ in range(50):
+                    watcher._save_snapshot()
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save, args=(w,)) for w in watchers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+        # A failing poll is logged and retried, not fatal to the thread
+        watcher = watchers[0]
+        calls = []
+
+        def poll():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OSError("disk full")
+
+        with patch.object(vault_watcher, "VAULT_POLL_INTERVAL", 0.01), patch.object(
+            watcher, "poll", poll
+        ):
+            watcher.start()
+            time.sleep(0.1)
+            self.assertTrue(watcher.alive)
+        self.assertGreater(len(calls), 1)
+
+    def test_inotify_collects_changed_notes(self):
+        try:
+            watcher = vault_watcher.InotifyWatcher(self.root)
+            watcher.start()
+        except (OSError, AttributeError) as e:
+            self.skipTest(f"inotify unavailable: {e}")
+        (self.root / "sub" / "a.md").write_text("a")
+        (self.root / "sub" / "b.txt").write_text("b")
+        (self.root / "new").mkdir()
+        (self.root / "new" / "c.md").write_text("c")
+        deadline = time.time() + 2
+        dirty = set()
+        while time.time() < deadline and len(dirty) < 2:
+            time.sleep(0.05)
+            dirty |= watcher.drain()[0]
+        self.assertEqual(
+            dirty, {os.path.join("sub", "a.md"), os.path.join("new", "c.md")}
+        )
+
+
+class TestFileLease(unittest.TestCase):
+    """Test the cross-process indexer lease."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "indexer.lock"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_second_holder_is_refused_until_release(self):
+        first = FileLease.acquire(self.path)
+        self.assertIsNotNone(first)
+        self.assertIsNone(FileLease.acquire(self.path))
+        first.release()
+        second = FileLease.acquire(self.path)
+        self.assertIsNotNone(second)
+        second.release()
+
+    def test_stale_holder_is_broken(self):
+        wedged = FileLease.acquire(self.path, stale_after=60)
+        info = wedged.holder()
+        info["heartbeat"] -= 120
+        self.path.write_text(json.dumps(info))
+        taker = FileLease.acquire(self.path, stale_after=60)
+        self.assertIsNotNone(taker)
+        with self.assertRaises(LeaseLost):
+            wedged.heartbeat()
+        wedged.release()
+        taker.release()
+
+    def test_rerun_requests_are_not_lost_while_taken(self):
+        rerun = Path(self.tmp.name) / "indexer.rerun"
+        counter = iter(range(10**6))
+        lock = threading.Lock()
+
+        def watcher():
+            # Each requester drains one distinct dirty path
+            with lock:
+                n = next(counter)
+            dirty = vault_watcher._DirtySet()
+            dirty.alive = True
+            dirty.mark_dirty({f"n{n}.md"})
+            return dirty
+
+        taken = set()
+        stop = threading.Event()
+
+        def taker():
+            while not stop.is_set():
+                extra = vault_indexer._take_rerun_requests()
+                if extra:
+                    taken.update(extra["paths"])
+
+        with patch.object(vault_indexer, "VAULT_INDEXER_RERUN", rerun), patch.object(
+            vault_indexer, "get_vault_watcher", watcher
+        ):
+            thread = threading.Thread(target=taker)
+            thread.start()
+            requesters = [
+                threading.Thread(
+                    target=lambda: [vault_indexer._request_rerun() for _ in range(50)]
+                )
+                for _ in range(4)
+            ]
+            for t in requesters:
+                t.start()
+            for t in requesters:
+                t.join()
+            stop.set()
+            thread.join()
+            extra = vault_indexer._take_rerun_requests()
+            if extra:
+                taken.update(extra["paths"])
+        self.assertEqual(taken, {f"n{n}.md" for n in range(200)})
+        self.assertFalse(rerun.exists())
+
+
+class TestSkillInitCache(unittest.TestCase):
+    """Test that load_skill's init block is reused until the data changes."""
+
+    def test_block_cached_until_version_changes(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        version = {"vault": [1, 0], "memory": [None, None]}
+        hit = RetrievalHit("memory", "prefers $\\LaTeX$", item={"id": 1})
+        calls = []
+
+        def fake_retrieve(query, **kwargs):
+            calls.append(query)
+            return RetrievalHits([hit])
+
+        with patch.object(
+            skill_tools, "SKILL_INIT_CACHE_FILE", Path(tmp.name) / "c.json"
+        ), patch.object(skill_tools, "_INIT_CACHE", None), patch.object(
+            skill_tools, "_data_version", lambda: dict(version)
+        ), patch.object(
+            skill_tools, "retrieve", fake_retrieve
+        ):
+            first = skill_tools.get_skill_init_block("latex_wizard")
+            self.assertIn("[Memory] prefers", first)
+            self.assertEqual(skill_tools.get_skill_init_block("latex_wizard"), first)
+            self.assertEqual(len(calls), 1)
+
+            version["vault"] = [2, 0]
+            self.assertIsNone(
+                skill_tools.get_skill_init_block("latex_wizard", refresh=False)
+            )
+            skill_tools.warm_skill_init_cache()
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(skill_tools.get_skill_init_block("latex_wizard"), first)
+            self.assertEqual(len(calls), 2)
+            saved = json.loads((Path(tmp.name) / "c.json").read_text())
+            self.assertEqual(saved["latex_wizard"]["block"], first)
+
+    def test_block_with_a_missed_lane_is_not_cached(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        hit = RetrievalHit("memory", "prefers $\\LaTeX$", item={"id": 1})
+        missed = [("vault",)]
+        calls = []
+
+        def fake_retrieve(query, **kwargs):
+            calls.append(query)
+            return RetrievalHits([hit], missed.pop() if missed else ())
+
+        with patch.object(
+            skill_tools, "SKILL_INIT_CACHE_FILE", Path(tmp.name) / "c.json"
+        ), patch.object(skill_tools, "_INIT_CACHE", None), patch.object(
+            skill_tools, "_data_version", lambda: {"vault": 1}
+        ), patch.object(
+            skill_tools, "retrieve", fake_retrieve
+        ):
+            # The vault lane timed out: shown, but rebuilt on the next load
+            self.assertIn("[Memory]", skill_tools.get_skill_init_block("latex_wizard"))
+            self.assertIsNone(
+                skill_tools.get_skill_init_block("latex_wizard", refresh=False)
+            )
+            skill_tools.get_skill_init_block("latex_wizard")
+            skill_tools.get_skill_init_block("latex_wizard")
+            self.assertEqual(len(calls), 2)
+
+    def test_vault_version_ignores_journal_appends(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        tmp = Path(tmp_dir.name)
+        header = tmp / "header.json"
+        with patch.object(vault_store, "HEADER_FILE", header), patch.object(
+            vault_store, "JOURNAL_FILE", tmp / "journal.log"
+        ):
+            header.write_text("{}")
+            before = vault_store.index_version()
+            (tmp / "journal.log").write_text('{"op": "del", "path": "s.md"}\n')
+            self.assertEqual(vault_store.index_version(), before)
+            os.utime(header, ns=(before + 10**9, before + 10**9))
+            self.assertNotEqual(vault_store.index_version(), before)
+
+
+class TestSearchTools(unittest.TestCase):
+    """Test that the search tools wait longer and report timeouts."""
+
+    def test_timeout_is_not_reported_as_no_results(self):
+        calls = []
+
+        def fake_retrieve(query, **kwargs):
+            calls.append(kwargs["budget_ms"])
+            return RetrievalHits([], (retrieval.VAULT,))
+
+        with patch.object(memory_tools, "retrieve", fake_retrieve):
+            result = memory_tools.vault_search("thesis outline")
+            self.assertIn("timed out", result)
+            self.assertNotIn("No relevant notes", result)
+            self.assertIn("timed out", memory_tools.search_memory_tool("cat"))
+        self.assertEqual(calls, [memory_tools.TOOL_RETRIEVAL_BUDGET_MS] * 2)
+
+    def test_partial_memory_results_are_flagged(self):
+        item = {"id": 3, "timestamp": "2026-01-05 10:00", "content": "cat is Miso"}
+        hit = RetrievalHit("memory", item["content"], item=item)
+        with patch.object(
+            memory_tools,
+            "retrieve",
+            lambda query, **kwargs: RetrievalHits([hit], (retrieval.MEMORY,)),
+        ):
+            result = memory_tools.search_memory_tool("cat")
+        self.assertIn("cat is Miso (ID: 3)", result)
+        self.assertIn("Partial results: memory", result)
+
+
+class TestRateLimit(unittest.TestCase):
+    """Test the shared embedding rate limiter and Retry-After parsing."""
+
+    def test_bucket_spaces_requests_and_honours_pause(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        bucket.pause(0.1)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_retry_after_header(self):
+        class Res:
+            headers = {"Retry-After": "7"}
+
+        self.assertEqual(_retry_after(Res(), 0), 7.0)
+        Res.headers = {}
+        self.assertEqual(_retry_after(Res(), 3), 8.0)
+
+
+class TestEmbeddingBatches(unittest.TestCase):
+    """Test request splitting and result mapping for bulk embeddings."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(Path(self.tmp.name) / "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_batches_respect_input_and_token_limits(self):
+        sizes = [len(b) for b in embeddings._iter_batches(["x"] * 300)]
+        self.assertEqual(sizes, [128, 128, 44])
+        # ~40k tokens each: two fit under the 100k budget, a third doesn't
+        big = "y" * 120_000
+        batches = list(embeddings._iter_batches([big] * 5))
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+        # A text over the budget on its own still gets sent (alone)
+        huge = "z" * 400_000
+        self.assertEqual(list(embeddings._iter_batches(["a", huge])), [[0], [1]])
+
+    def test_results_are_mapped_by_index(self):
+        class Response:
+            ok, status_code, headers = True, 200, {}
+
+            def json(self):
+                # The provider may answer out of order
+                data = [{"index": i, "embedding": [float(i)]} for i in (2, 0, 1)]
+                return {"data": data}
+
+        class Session:
+            def post(self, url, headers, json, timeout):
+                self.payload = json
+                return Response()
+
+        session = Session()
+        config = {"openrouter_base_url": "http://x", "openrouter_api_key": "k"}
+        with patch.object(embeddings, "get_session", lambda: session), patch.object(
+            embeddings, "get_config", lambda: config
+        ), patch.object(embeddings, "_RATE_LIMIT", TokenBucket(1000, 1000)):
+            vectors = embeddings._post_embeddings(["a", "b", "c"], ("m", 8))
+        self.assertEqual(vectors, [[0.0], [1.0], [2.0]])
+        self.assertEqual(session.payload["dimensions"], 8)
+
+    def test_get_embeddings_splits_and_realigns(self):
+        submitted = []
+
+        class Client:
+            def submit(self, inputs, spec, priority):
+                submitted.append(list(inputs))
+                future = Future()
+                future.set_result(
+                    None if "bad" in inputs else [[float(len(t))] for t in inputs]
+                )
+                return future
+
+        texts = ["a", "bb", "a", "ccc", "bad", "dddd"]
+        with patch.object(embeddings, "MAX_BATCH_INPUTS", 2), patch.object(
+            embeddings, "get_embedding_client", Client
+        ), patch.object(embeddings, "get_embedding_cache", lambda: self.cache):
+            vectors = embeddings.get_embeddings(texts, ("m", None))
+            self.assertEqual(submitted, [["a", "bb"], ["ccc", "bad"], ["dddd"]])
+            self.assertEqual(vectors, [[1.0], [2.0], [1.0], None, None, [4.0]])
+            # Successful batches were cached; only the failed one is re-sent
+            submitted.clear()
+            embeddings.get_embeddings(texts, ("m", None))
+            self.assertEqual(submitted, [["ccc", "bad"]])
+
+
+class TestQueryMemo(unittest.TestCase):
+    """Test the LRU/TTL query memo and single-flight in get_embedding."""
+
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+        self.patches = [
+            patch.object(embeddings, "_QUERY_CACHE", OrderedDict()),
+            patch.object(embeddings, "_IN_FLIGHT", {}),
+            patch.object(embeddings, "get_embeddings", self._embed),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def _embed(self, texts, spec=None, priority=None):
+        self.calls.append(list(texts))
+        self.started.set()
+        self.release.wait(2)
+        return [[float(len(t))] for t in texts]
+
+    def test_concurrent_callers_share_one_request(self):
+        self.release.clear()
+        results = []
+
+        def ask():
+            results.append(embeddings.get_embedding("what's my cat called", ("m", 4)))
+
+        leader = threading.Thread(target=ask)
+        leader.start()
+        self.started.wait(2)
+        followers = [threading.Thread(target=ask) for _ in range(4)]
+        for t in followers:
+            t.start()
+        time.sleep(0.05)  # Let them find the request in flight
+        self.release.set()
+        for t in [leader] + followers:
+            t.join(2)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results, [[20.0]] * 5)
+        self.assertEqual(embeddings._IN_FLIGHT, {})
+
+    def test_memo_is_lru_and_expires(self):
+        spec = ("m", None)
+        with patch.object(embeddings, "QUERY_CACHE_SIZE", 2):
+            for text in ("a", "b", "a", "c"):
+                embeddings.get_embedding(text, spec)
+            self.assertEqual(self.calls, [["a"], ["b"], ["c"]])
+            embeddings.get_embedding("a", spec)  # Recently used, still there
+            embeddings.get_embedding("b", spec)  # Evicted by "c"
+            self.assertEqual(self.calls[-1], ["b"])
+            self.assertEqual(len(self.calls), 4)
+            # Another spec is another key
+            embeddings.get_embedding("b", ("m", 8))
+            self.assertEqual(len(self.calls), 5)
+
+        with patch.object(embeddings, "QUERY_CACHE_TTL", -1):
+            embeddings.get_embedding("z", spec)
+            embeddings.get_embedding("z", spec)
+        self.assertEqual(self.calls[-2:], [["z"], ["z"]])
+
+
+class TestEmbeddingClient(unittest.TestCase):
+    """Test micro-batching and lane priority in the shared embedding client."""
+
+    def test_coalesces_and_serves_foreground_first(self):
+        import threading
+
+        calls = []
+        gate = threading.Event()
+
+        def post(inputs, spec, urgent=False):
+            if inputs == ["busy"]:
+                gate.wait(2)
+            calls.append((list(inputs), urgent))
+            return [[float(len(t))] for t in inputs]
+
+        client = EmbeddingClient(workers=1, post=post)
+        spec = ("m", None)
+        # Occupy the only background-capable dispatcher, then queue both lanes
+        blocker = client.submit(["busy"], spec, BACKGROUND)
+        time.sleep(0.05)
+        bg = [client.submit([f"bg{i}"], spec, BACKGROUND) for i in range(3)]
+        fg = [client.submit([q], spec, FOREGROUND) for q in ("q", "qqq")]
+
+        # Queries don't wait for the reindex and share one call
+        self.assertEqual([f.result(2) for f in fg], [[[1.0]], [[3.0]]])
+        self.assertEqual(calls, [(["q", "qqq"], True)])
+        gate.set()
+        self.assertEqual(blocker.result(2), [[4.0]])
+        self.assertEqual([f.result(2) for f in bg], [[[3.0]]] * 3)
+        self.assertEqual(calls[-1], (["bg0", "bg1", "bg2"], False))